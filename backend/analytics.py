@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Optional columnar analytics engine for long-range usage reports.
+
+DuckDB scans the Parquet dataset written by export.py, which is far cheaper
+than SQLite's row store for aggregations over months of raw events. Writes
+stay on SQLite: rows added since the last export (id above the export
+watermark) are aggregated there and merged in, so reports are never stale.
+Compacted hours are read from SQLite's hourly rollups on both engines, so
+they agree. The export and its id watermark cover the single productivity.db
+only, so sharded deployments always use SQLite.
+
+Only /api/usage-report goes through this module. get-insights, adjust-limits
+and daily-summary read per-user hourly rollups and precomputed daily
+summaries, which are already aggregated and index-backed in SQLite and beat
+a Parquet scan (see benchmark.py columnar).
+"""
+
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+from db import DatabaseManager, ShardedDatabaseManager, merge_usage_reports, usage_report
+from export import DEFAULT_OUT_DIR, load_manifest
+
+try:
+    import duckdb
+except ImportError:  # optional: SQLite answers every report without it
+    duckdb = None
+
+# Ranges at least this long go to the columnar engine when it is available.
+# DuckDB pays a fixed cost for scanning the dataset, so SQLite's per-user
+# index wins on shorter ranges (see benchmark.py columnar).
+COLUMNAR_MIN_DAYS = 180
+
+
+class ColumnarAnalytics:
+    """Usage reports over the Parquet export with DuckDB"""
+
+    def __init__(self, parquet_dir: str = DEFAULT_OUT_DIR):
+        if duckdb is None:
+            raise RuntimeError("Columnar analytics needs duckdb (pip install duckdb)")
+        self.parquet_dir = parquet_dir
+        self.conn = duckdb.connect()
+
+    def exported_until_id(self) -> int:
+        """Highest usage_data id in the Parquet dataset (0 before the first export)"""
+        return load_manifest(self.parquet_dir)['tables'].get('usage_data', {}).get('last_id', 0)
+
+    def usage_report(self, db: DatabaseManager, user_id: str, start_ms: int, end_ms: int) -> Dict:
+        """Same result as db.get_usage_report, with the exported rows read from Parquet"""
+        last_id = self.exported_until_id()
+        # Compacted hours are covered by the rollups in db.get_usage_report
+        raw_start_ms = max(start_ms, db.compacted_before_ms())
+        pattern = os.path.join(self.parquet_dir, 'usage_data', '*.parquet')
+        # One cursor per call: a DuckDB connection must not be shared across threads
+        cursor = self.conn.cursor()
+        try:
+            rows = cursor.execute('''
+                SELECT domain, hour_bucket % 24 AS hour,
+                       SUM(duration),
+                       SUM(CASE WHEN is_productive THEN duration ELSE 0 END),
+                       SUM(CASE WHEN is_distraction THEN duration ELSE 0 END),
+                       COUNT(*)
+                FROM read_parquet(?)
+                WHERE user_id = ? AND epoch_ms(ts) >= ? AND epoch_ms(ts) < ? AND id <= ?
+                GROUP BY domain, hour
+            ''', [pattern, user_id, raw_start_ms, end_ms, last_id]).fetchall()
+        finally:
+            cursor.close()
+        fresh = db.get_usage_report(user_id, start_ms, end_ms, after_id=last_id)
+        return merge_usage_reports(usage_report(rows), fresh)
+
+
+_columnar = None
+_columnar_lock = threading.Lock()
+
+
+def get_columnar_analytics(parquet_dir: str = DEFAULT_OUT_DIR) -> Optional[ColumnarAnalytics]:
+    """Process-wide columnar engine, or None if duckdb or the Parquet export is missing"""
+    global _columnar
+    if duckdb is None:
+        return None
+    with _columnar_lock:
+        if _columnar is None:
+            _columnar = ColumnarAnalytics(parquet_dir)
+    return _columnar if _columnar.exported_until_id() > 0 else None
+
+
+def get_usage_report(db: DatabaseManager, user_id: str, start_ms: int, end_ms: int,
+                     engine: str = 'auto') -> Tuple[Dict, str]:
+    """Route a usage report and return (report, engine used).
+
+    'auto' sends ranges of COLUMNAR_MIN_DAYS or more to DuckDB when it is
+    installed and an export exists; 'sqlite' and 'duckdb' force an engine.
+    Sharded databases (DB_SHARDS > 1) have no export, so they only use SQLite.
+    """
+    columnar = None
+    if isinstance(db, ShardedDatabaseManager):
+        if engine == 'duckdb':
+            raise RuntimeError("Columnar engine does not support sharded databases (DB_SHARDS > 1)")
+        return db.get_usage_report(user_id, start_ms, end_ms), 'sqlite'
+    long_range = end_ms - start_ms >= COLUMNAR_MIN_DAYS * 86400 * 1000
+    if engine == 'duckdb' or (engine == 'auto' and long_range):
+        columnar = get_columnar_analytics()
+        if columnar is None and engine == 'duckdb':
+            raise RuntimeError("Columnar engine unavailable: install duckdb and run export.py")
+    if columnar is not None:
+        return columnar.usage_report(db, user_id, start_ms, end_ms), 'duckdb'
+    return db.get_usage_report(user_id, start_ms, end_ms), 'sqlite'
@@ -1,11 +1,16 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from datetime import datetime, timedelta
+import csv
+import io
 import json
 import os
+import re
 import threading
-from model import ProductivityModel
-from db import DatabaseManager
+from model import ProductivityModel, usage_batch_row
+from db import (DatabaseManager, ShardedDatabaseManager, USAGE_EXPORT_COLUMNS, start_compactor,
+                start_summary_scheduler, to_epoch_ms)
+from analytics import get_usage_report
 from brain import analyze_user_mental_health
 from checkUrl import analyze_url
 
@@ -18,21 +23,91 @@ CORS(app, resources={
     }
 })
 
-# Thread-local storage for database connections
+# Batch ingest writes through a background group-commit writer
+WRITE_BEHIND = os.environ.get('WRITE_BEHIND', '').lower() in ('1', 'true', 'yes')
+
+# Send every write through one writer thread; request threads read on query_only connections
+DB_ACTOR = os.environ.get('DB_ACTOR', '').lower() in ('1', 'true', 'yes')
+
+# Keep the last day of usage / tab events in memory, persisted every few seconds (one process per DB)
+HOT_TIER = os.environ.get('HOT_TIER', '').lower() in ('1', 'true', 'yes')
+
+# Route users to this many per-user database files (1 keeps the single productivity.db)
+DB_SHARDS = int(os.environ.get('DB_SHARDS', '1'))
+
+# Engine for /api/usage-report: auto (DuckDB for long ranges when exported), sqlite or duckdb.
+# Insights, limits and daily summaries stay on SQLite's rollups (see analytics.py).
+ANALYTICS_ENGINE = os.environ.get('ANALYTICS_ENGINE', 'auto').lower()
+
+# Days of stored usage replayed into the model when it is created (0 starts empty)
+MODEL_REPLAY_DAYS = float(os.environ.get('MODEL_REPLAY_DAYS', '7'))
+
+# Most events accepted by one /api/usage-data/batch request
+USAGE_BATCH_MAX = 5000
+
+# Raw events older than this many days are compacted into hourly aggregates (0 disables)
+RAW_RETENTION_DAYS = float(os.environ.get('RAW_RETENTION_DAYS', '0'))
+
+# Thread-local storage for database managers (connections are pooled in db.py)
 local_data = threading.local()
+db_init_lock = threading.Lock()
+db_initialized = False
+
+# One model for every request thread, so learned patterns are shared
+shared_model = None
+model_init_lock = threading.Lock()
+
+def create_db_manager():
+    """Create a single-file or sharded database manager from the environment"""
+    if DB_SHARDS > 1:
+        return ShardedDatabaseManager(shards=DB_SHARDS, write_behind=WRITE_BEHIND, actor=DB_ACTOR,
+                                      hot_tier=HOT_TIER)
+    return DatabaseManager(write_behind=WRITE_BEHIND, actor=DB_ACTOR, hot_tier=HOT_TIER)
+
+def start_background_jobs(manager):
+    """Start nightly summaries and, if configured, raw-event compaction for every database file"""
+    for shard in getattr(manager, 'shards', [manager]):
+        start_summary_scheduler(shard.db_name, actor=DB_ACTOR)
+        if RAW_RETENTION_DAYS > 0:
+            start_compactor(shard.db_name, RAW_RETENTION_DAYS, actor=DB_ACTOR)
 
 def get_db_manager():
     """Get thread-local database manager"""
+    global db_initialized
     if not hasattr(local_data, 'db_manager'):
-        local_data.db_manager = DatabaseManager()
-        local_data.db_manager.initialize_database()
+        local_data.db_manager = create_db_manager()
+        # The threaded dev server spawns a thread per request, so only
+        # create the schema once per process
+        with db_init_lock:
+            if not db_initialized:
+                local_data.db_manager.initialize_database()
+                start_background_jobs(local_data.db_manager)
+                db_initialized = True
     return local_data.db_manager
 
 def get_model():
-    """Get thread-local model"""
-    if not hasattr(local_data, 'model'):
-        local_data.model = ProductivityModel()
-    return local_data.model
+    """Get the process-wide model (thread-safe, see ProductivityModel)"""
+    global shared_model
+    if shared_model is None:
+        with model_init_lock:
+            if shared_model is None:
+                model = ProductivityModel()
+                if MODEL_REPLAY_DAYS > 0:
+                    replay_usage_history(model, get_db_manager())
+                shared_model = model
+    return shared_model
+
+def replay_usage_history(model, manager):
+    """Rebuild the model's patterns from the last MODEL_REPLAY_DAYS of stored usage"""
+    start_ms = int((datetime.now() - timedelta(days=MODEL_REPLAY_DAYS)).timestamp() * 1000)
+    events = 0
+    try:
+        for rows in manager.iter_usage_history(start_ms):
+            model.process_usage_batch(model.usage_batch(rows))
+            events += len(rows)
+        print(f"Replayed {events} usage events into the model")
+    except Exception as e:
+        print(f"Error replaying usage history after {events} events: {e}")
 
 @app.route('/api/distraction-urls', methods=['POST', 'OPTIONS'])
 def handle_distraction_urls():
@@ -214,6 +289,80 @@ def handle_usage_data():
             'message': f'Internal server error: {str(e)}'
         }), 500
 
+def event_duration(value):
+    """Integer seconds of an event's duration, or None if it is not a number"""
+    if isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+@app.route('/api/usage-data/batch', methods=['POST', 'OPTIONS'])
+def handle_usage_batch():
+    """Handle many usage entries for one user (same fields as /api/usage-data) in one request"""
+    try:
+        data = get_request_data()
+        events = data.get('events') if isinstance(data, dict) else None
+        if not isinstance(events, list) or not events:
+            return jsonify({
+                'status': 'error',
+                'message': 'No events provided'
+            }), 400
+        if len(events) > USAGE_BATCH_MAX:
+            return jsonify({
+                'status': 'error',
+                'message': f'At most {USAGE_BATCH_MAX} events per batch'
+            }), 400
+
+        user_id = data.get('user_id', 'default_user')
+        usage_entries = []
+        for index, event in enumerate(events):
+            missing = [field for field in ('url', 'domain', 'duration')
+                       if not isinstance(event, dict) or field not in event]
+            if missing:
+                return jsonify({
+                    'status': 'error',
+                    'message': f'Event {index}: missing required field: {missing[0]}'
+                }), 400
+            invalid = [field for field in ('url', 'domain') if not isinstance(event[field], str)]
+            duration = event_duration(event['duration'])
+            if duration is None:
+                invalid.append('duration')
+            if invalid:
+                return jsonify({
+                    'status': 'error',
+                    'message': f'Event {index}: invalid field: {invalid[0]}'
+                }), 400
+            usage_entries.append({
+                'user_id': user_id,
+                'url': event['url'],
+                'domain': event['domain'],
+                'duration': duration,
+                'interactions': event.get('interactions', {}),
+                'timestamp': event.get('timestamp', datetime.now().isoformat()),
+                'is_distraction': bool(event.get('isDistraction', False)),
+                'is_productive': bool(event.get('isProductive', False))
+            })
+
+        db_manager = get_db_manager()
+        model = get_model()
+
+        db_manager.store_usage_batch(user_id, usage_entries)
+        model.process_usage_batch(model.usage_batch([usage_batch_row(entry) for entry in usage_entries]))
+
+        return jsonify({
+            'status': 'success',
+            'message': f'{len(usage_entries)} usage entries recorded'
+        })
+
+    except Exception as e:
+        print(f"Error in handle_usage_batch: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': f'Internal server error: {str(e)}'
+        }), 500
+
 @app.route('/api/tab-activity', methods=['POST', 'OPTIONS'])
 def handle_tab_activity():
     """Handle tab activity data"""
@@ -399,7 +548,7 @@ def get_insights():
         user_data = db_manager.get_user_analytics_data(user_id)
         
         # Generate insights using AI model
-        insights = model.generate_productivity_insights(user_data)
+        insights = model.generate_productivity_insights(user_id, user_data)
         
         return jsonify({
             'insights': insights,
@@ -463,11 +612,11 @@ def get_daily_summary():
         db_manager = get_db_manager()
         model = get_model()
         
-        # Get daily data
-        daily_data = db_manager.get_daily_data(user_id, date)
+        # Get the day's totals, aggregated in SQL
+        daily_report = db_manager.get_daily_report(user_id, date)
         
         # Generate summary using AI
-        summary = model.generate_daily_summary(daily_data)
+        summary = model.generate_daily_summary(daily_report)
         
         return jsonify({
             'summary': summary,
@@ -488,19 +637,160 @@ def get_daily_summary():
             'generated_at': datetime.now().isoformat()
         }), 500
 
+@app.route('/api/usage-report', methods=['GET'])
+def usage_report():
+    """Usage totals by domain and hour of day over a date range (default: last 30 days)"""
+    try:
+        user_id = request.args.get('user_id', 'default_user')
+        end = request.args.get('end') or (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
+        start = request.args.get('start') or (datetime.now() - timedelta(days=29)).strftime('%Y-%m-%d')
+        start_ms, end_ms = to_epoch_ms(start), to_epoch_ms(end)
+        if start_ms is None or end_ms is None or start_ms >= end_ms:
+            return jsonify({'status': 'error', 'message': 'start must be before end'}), 400
+        
+        db_manager = get_db_manager()
+        report, engine = get_usage_report(db_manager, user_id, start_ms, end_ms,
+                                          request.args.get('engine', ANALYTICS_ENGINE))
+        
+        return jsonify({
+            'report': report,
+            'start': start,
+            'end': end,
+            'engine': engine,
+            'generated_at': datetime.now().isoformat()
+        })
+    
+    except Exception as e:
+        print(f"Error in usage_report: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': f'Internal server error: {str(e)}'
+        }), 500
+
+@app.route('/api/engagement-patterns', methods=['GET'])
+def engagement_patterns():
+    """Average engagement score per domain and local hour of day over the user's raw history"""
+    try:
+        user_id = request.args.get('user_id', 'default_user')
+        
+        db_manager = get_db_manager()
+        patterns = db_manager.get_engagement_patterns(user_id)
+        
+        return jsonify({
+            'engagement_patterns': patterns,
+            'generated_at': datetime.now().isoformat()
+        })
+    
+    except Exception as e:
+        print(f"Error in engagement_patterns: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': f'Internal server error: {str(e)}'
+        }), 500
+
+@app.route('/api/search-history', methods=['GET'])
+def search_history():
+    """Full-text search over a user's tab titles and URLs.
+
+    Query args: user_id, q (terms; a trailing * searches by prefix), start /
+    end (ISO date or time), limit, and before_id=<next_before_id> for the
+    next page.
+    """
+    try:
+        user_id = request.args.get('user_id', 'default_user')
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'status': 'error', 'message': 'q is required'}), 400
+        start_ms = to_epoch_ms(request.args['start']) if request.args.get('start') else None
+        end_ms = to_epoch_ms(request.args['end']) if request.args.get('end') else None
+        before_id = int(request.args['before_id']) if request.args.get('before_id') else None
+        limit = min(max(int(request.args.get('limit', 50)), 1), 200)
+    except (ValueError, TypeError) as e:
+        return jsonify({'status': 'error', 'message': f'Invalid search parameters: {str(e)}'}), 400
+
+    try:
+        db_manager = get_db_manager()
+        page = db_manager.search_history(user_id, query, start_ms, end_ms, before_id, limit)
+        return jsonify({
+            'query': query,
+            'results': page['results'],
+            'next_before_id': page['next_before_id']
+        })
+    
+    except Exception as e:
+        print(f"Error in search_history: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': f'Internal server error: {str(e)}'
+        }), 500
+
+@app.route('/api/export/usage', methods=['GET'])
+def export_usage():
+    """Stream a user's raw usage history as NDJSON (default) or CSV.
+
+    Query args: user_id, format=ndjson|csv, start / end (ISO date or time),
+    after=<ts_epoch_ms>:<id> to resume after the last record received, and
+    limit to cap the number of records.
+    """
+    try:
+        user_id = request.args.get('user_id', 'default_user')
+        export_format = request.args.get('format', 'ndjson').lower()
+        if export_format not in ('ndjson', 'csv'):
+            return jsonify({'status': 'error', 'message': 'format must be ndjson or csv'}), 400
+        
+        start_ms = to_epoch_ms(request.args['start']) if request.args.get('start') else None
+        end_ms = to_epoch_ms(request.args['end']) if request.args.get('end') else None
+        after = None
+        if request.args.get('after'):
+            ts_part, id_part = request.args['after'].split(':')
+            after = (int(ts_part), int(id_part))
+        limit = int(request.args['limit']) if request.args.get('limit') else None
+    except (ValueError, TypeError) as e:
+        return jsonify({'status': 'error', 'message': f'Invalid export parameters: {str(e)}'}), 400
+
+    db_manager = get_db_manager()
+
+    def generate():
+        rows = db_manager.iter_usage_export(user_id, start_ms, end_ms, after)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if export_format == 'csv':
+            writer.writerow(USAGE_EXPORT_COLUMNS)
+        for count, row in enumerate(rows):
+            if limit is not None and count >= limit:
+                break
+            if export_format == 'csv':
+                writer.writerow([row[column] for column in USAGE_EXPORT_COLUMNS])
+            else:
+                buffer.write(json.dumps(row) + '\n')
+            # Flush in chunks of a few KB rather than one write per record
+            if buffer.tell() >= 65536:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    # user_id is client input: keep only characters that are safe in a header value
+    filename = f"usage_{re.sub(r'[^A-Za-z0-9_-]', '_', user_id)}.{export_format}"
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     try:
         # Test database connection
         db_manager = get_db_manager()
-        db_manager.cursor.execute('SELECT 1')
+        db_manager.ping()
         
         return jsonify({
             'status': 'healthy',
             'timestamp': datetime.now().isoformat(),
             'version': '1.0.0',
-            'database': 'connected'
+            'database': 'connected',
+            'user_context_cache': db_manager.cache_stats(),
+            'write_locks': db_manager.lock_stats()
         })
     except Exception as e:
         return jsonify({
@@ -571,10 +861,14 @@ def get_request_data():
 if __name__ == '__main__':
     # Initialize database once at startup
     try:
-        initial_db = DatabaseManager()
+        initial_db = create_db_manager()
         initial_db.initialize_database()
         initial_db.close()
+        start_background_jobs(initial_db)
+        db_initialized = True
         print("Database initialized successfully")
+        # Create the model (and replay recent history into it) before serving
+        get_model()
     except Exception as e:
         print(f"Database initialization error: {e}")
     
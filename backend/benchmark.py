@@ -0,0 +1,821 @@
+#!/usr/bin/env python3
+"""
+Storage benchmarks for the productivity backend.
+
+Each benchmark runs against a throwaway database in a temp directory, so the
+real productivity.db is never touched.
+
+Usage: python benchmark.py [name ...]
+"""
+
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime, timedelta
+
+from db import (DatabaseManager, ShardedDatabaseManager, StripedLock, TAB_ACTIVITY_INSERT_SQL,
+                USAGE_INSERT_SQL, open_connection, shutdown_hot_tiers, shutdown_write_behind,
+                shutdown_writer_actors)
+
+DOMAINS = ['github.com', 'stackoverflow.com', 'docs.python.org', 'youtube.com',
+           'facebook.com', 'twitter.com', 'reddit.com', 'netflix.com']
+
+
+class UnpooledDatabaseManager(DatabaseManager):
+    """The pre-pool behaviour: a fresh connection per call, closed afterwards"""
+
+    def _get_connection(self):
+        return sqlite3.connect(self.db_name, check_same_thread=False)
+
+    def _release_connection(self, conn):
+        conn.close()
+
+
+def make_usage_entry(user_id, when=None):
+    """Build a synthetic /api/usage-data payload"""
+    domain = random.choice(DOMAINS)
+    when = when or datetime.now()
+    return {
+        'user_id': user_id,
+        'url': f'https://{domain}/page/{random.randint(1, 500)}',
+        'domain': domain,
+        'duration': random.randint(5, 900),
+        'interactions': {'clicks': random.randint(0, 30), 'scrolls': random.randint(0, 60),
+                         'keystrokes': random.randint(0, 400)},
+        'timestamp': when.isoformat(),
+        'is_distraction': domain in DOMAINS[3:],
+        'is_productive': domain in DOMAINS[:3]
+    }
+
+
+@contextmanager
+def quiet():
+    """Silence the per-write log lines printed by DatabaseManager"""
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        yield
+
+
+def run_threads(worker, threads):
+    """Run worker(thread_index) on N threads and return elapsed seconds"""
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    with quiet():
+        start = time.perf_counter()
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        return time.perf_counter() - start
+
+
+def bench_connection_pool(threads=8, requests_per_thread=200):
+    """Per-request cost of fresh connections vs the pooled WAL connections.
+
+    Each simulated extension request stores one usage event and then reads the
+    user context, like /api/usage-data followed by /api/get-question.
+    """
+    print("=== Connection pool ===")
+    results = {}
+    for label, manager_cls in [('fresh connections', UnpooledDatabaseManager),
+                               ('pooled WAL', DatabaseManager)]:
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            db_path = os.path.join(tmp_dir, 'bench.db')
+            with quiet():
+                manager_cls(db_path).initialize_database()
+
+            def worker(i):
+                db = manager_cls(db_path)
+                user_id = f'user_{i}'
+                for _ in range(requests_per_thread):
+                    db.store_usage_data(make_usage_entry(user_id))
+                    db.get_user_context(user_id)
+
+            elapsed = run_threads(worker, threads)
+            total = threads * requests_per_thread
+            results[label] = elapsed / total * 1000
+            print(f"{label:>18}: {total} requests in {elapsed:.2f}s "
+                  f"({results[label]:.3f} ms/request)")
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    saving = results['fresh connections'] - results['pooled WAL']
+    print(f"Per-request saving: {saving:.3f} ms")
+    return results
+
+
+def bench_write_behind(thread_counts=(1, 4, 16), events_per_thread=2000):
+    """Ingest throughput of per-event commits vs the group-commit writer"""
+    print("=== Write-behind ingest ===")
+    results = {}
+    for write_behind in (False, True):
+        label = 'write-behind' if write_behind else 'commit per event'
+        for threads in thread_counts:
+            tmp_dir = tempfile.mkdtemp()
+            try:
+                db_path = os.path.join(tmp_dir, 'bench.db')
+                with quiet():
+                    DatabaseManager(db_path).initialize_database()
+
+                def worker(i):
+                    db = DatabaseManager(db_path, write_behind=write_behind)
+                    for _ in range(events_per_thread):
+                        db.store_usage_data(make_usage_entry(f'user_{i}'))
+                    db.flush()
+
+                elapsed = run_threads(worker, threads)
+                rate = threads * events_per_thread / elapsed
+                results[(label, threads)] = rate
+                print(f"{label:>16}, {threads:>2} threads: {rate:,.0f} events/s")
+            finally:
+                shutdown_write_behind()
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+    return results
+
+
+# usage_data as it was before domains and URLs were interned
+TEXT_USAGE_TABLE_SQL = '''
+    CREATE TABLE usage_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT, url TEXT, domain TEXT, duration INTEGER,
+        clicks INTEGER, scrolls INTEGER, keystrokes INTEGER, mouse_movements INTEGER,
+        timestamp TEXT, ts_epoch_ms INTEGER, is_distraction BOOLEAN, is_productive BOOLEAN
+    )
+'''
+
+
+def synthetic_events(rows, users=50, distinct_urls=5000):
+    """Yield (user_id, url, domain, duration, counts, timestamp, ts_epoch_ms, flags) tuples.
+
+    One URL in ten is a multi-kilobyte OAuth-style redirect, like the ones in
+    latest_behavior_upload.json.
+    """
+    rng = random.Random(42)
+    domains = DOMAINS + [f'site{i}.example.com' for i in range(32)]
+    urls = []
+    for i in range(distinct_urls):
+        domain = rng.choice(domains)
+        if i % 10 == 0:
+            state = ''.join(rng.choice('abcdef0123456789') for _ in range(2048))
+            urls.append((f'https://accounts.{domain}/o/oauth2/auth?client_id={i}&state={state}', domain))
+        else:
+            urls.append((f'https://{domain}/page/{i}', domain))
+
+    start = datetime(2024, 1, 1)
+    for n in range(rows):
+        url, domain = urls[rng.randrange(distinct_urls)]
+        when = start + timedelta(seconds=n * 30)
+        yield (f'user_{n % users}', url, domain, rng.randint(5, 900),
+               (rng.randint(0, 30), rng.randint(0, 60), rng.randint(0, 400), rng.randint(0, 200)),
+               when.isoformat(), int(when.timestamp() * 1000),
+               domain in DOMAINS[3:], domain in DOMAINS[:3])
+
+
+def bench_interning(rows=1000000, batch=10000):
+    """Database size and aggregation speed of text vs interned domain/URL columns"""
+    print(f"=== Interned domains and URLs ({rows:,} usage rows) ===")
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        text_path = os.path.join(tmp_dir, 'text.db')
+        text_conn = open_connection(text_path)
+        text_conn.execute(TEXT_USAGE_TABLE_SQL)
+        text_conn.execute('CREATE INDEX idx_usage_user_epoch ON usage_data (user_id, ts_epoch_ms)')
+
+        interned_path = os.path.join(tmp_dir, 'interned.db')
+        with quiet():
+            manager = DatabaseManager(interned_path)
+            with quiet():
+                manager.initialize_database()
+        interned_conn = open_connection(interned_path)
+
+        text_rows, interned_rows = [], []
+        insert_text = 'INSERT INTO usage_data VALUES (NULL, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+        for user_id, url, domain, duration, counts, timestamp, ts_epoch_ms, distraction, productive in \
+                synthetic_events(rows):
+            text_rows.append((user_id, url, domain, duration, *counts, timestamp, ts_epoch_ms,
+                              distraction, productive))
+            # Same intern caches the write path uses
+            interned_rows.append((user_id, manager.urls.id(url), manager.domains.id(domain), duration,
+                                  *counts, timestamp, ts_epoch_ms, distraction, productive))
+            if len(text_rows) >= batch:
+                text_conn.executemany(insert_text, text_rows)
+                interned_conn.executemany(USAGE_INSERT_SQL, interned_rows)
+                # The interner commits new IDs on its own connection, so never hold the write lock
+                text_conn.commit()
+                interned_conn.commit()
+                text_rows, interned_rows = [], []
+        if text_rows:
+            text_conn.executemany(insert_text, text_rows)
+            interned_conn.executemany(USAGE_INSERT_SQL, interned_rows)
+        for conn in (text_conn, interned_conn):
+            conn.commit()
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            conn.execute('VACUUM')
+
+        queries = {
+            'text': '''
+                SELECT domain, SUM(duration) FROM usage_data
+                WHERE user_id = ? GROUP BY domain
+            ''',
+            'interned': '''
+                SELECT d.domain, t.total FROM (
+                    SELECT domain_id, SUM(duration) as total FROM usage_data
+                    WHERE user_id = ? GROUP BY domain_id
+                ) t JOIN domains d ON d.id = t.domain_id
+            ''',
+        }
+        results = {}
+        for label, path, conn in (('text', text_path, text_conn), ('interned', interned_path, interned_conn)):
+            size_mb = os.path.getsize(path) / 1024 / 1024
+            start = time.perf_counter()
+            for i in range(10):
+                conn.execute(queries[label], (f'user_{i}',)).fetchall()
+            per_query = (time.perf_counter() - start) / 10 * 1000
+            results[label] = (size_mb, per_query)
+            print(f"{label:>9}: {size_mb:8.1f} MB, per-user domain aggregation {per_query:.1f} ms")
+            conn.close()
+
+        print(f"Size ratio: {results['text'][0] / results['interned'][0]:.1f}x smaller, "
+              f"aggregation {results['text'][1] / results['interned'][1]:.1f}x faster")
+        return results
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def bench_sharding(shard_counts=(1, 2, 4, 8), threads=16, events_per_thread=1000):
+    """Multi-user ingest throughput (commit per event) as the shard count grows"""
+    print(f"=== Sharded ingest ({threads} users on {threads} threads) ===")
+    results = {}
+    for shards in shard_counts:
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            db_path = os.path.join(tmp_dir, 'bench.db')
+            with quiet():
+                ShardedDatabaseManager(db_path, shards=shards).initialize_database()
+
+            def worker(i):
+                db = ShardedDatabaseManager(db_path, shards=shards)
+                for _ in range(events_per_thread):
+                    db.store_usage_data(make_usage_entry(f'user_{i}'))
+
+            elapsed = run_threads(worker, threads)
+            rate = threads * events_per_thread / elapsed
+            results[shards] = rate
+            print(f"{shards:>2} shard(s): {rate:,.0f} events/s")
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return results
+
+
+def bench_lock_striping(threads=16, events_per_thread=500):
+    """Lock wait per write with one shared lock vs per-user striped locks"""
+    print(f"=== Write lock contention ({threads} users on {threads} threads) ===")
+    results = {}
+    for label, stripes in (('single lock', 1), ('striped', 64)):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            db_path = os.path.join(tmp_dir, 'bench.db')
+            with quiet():
+                DatabaseManager(db_path).initialize_database()
+            locks = StripedLock(stripes)
+
+            def worker(i):
+                db = DatabaseManager(db_path)
+                db.locks = locks
+                for _ in range(events_per_thread):
+                    db.store_usage_data(make_usage_entry(f'user_{i}'))
+
+            elapsed = run_threads(worker, threads)
+            stats = locks.stats()
+            results[label] = stats
+            print(f"{label:>11}: {threads * events_per_thread / elapsed:,.0f} events/s, "
+                  f"lock wait avg {stats['avg_wait_ms']:.3f} ms / max {stats['max_wait_ms']:.1f} ms "
+                  f"({stats['contended']} of {stats['acquisitions']} contended), "
+                  f"SQLite write-lock wait {stats['sqlite_wait_ms_total']:.0f} ms total")
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return results
+
+
+def bench_writer_actor(threads=8, requests_per_thread=300):
+    """Mixed ingest + context reads with pooled writers vs the single writer thread"""
+    print(f"=== Writer actor ({threads} threads, write + read per request) ===")
+    results = {}
+    for label, actor in (('pooled writers', False), ('writer actor', True)):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            db_path = os.path.join(tmp_dir, 'bench.db')
+            with quiet():
+                DatabaseManager(db_path, actor=actor).initialize_database()
+
+            def worker(i):
+                db = DatabaseManager(db_path, actor=actor)
+                for _ in range(requests_per_thread):
+                    db.store_usage_data(make_usage_entry(f'user_{i}'))
+                    db.get_user_context(f'user_{i}')
+
+            elapsed = run_threads(worker, threads)
+            stats = DatabaseManager(db_path).lock_stats()
+            results[label] = threads * requests_per_thread / elapsed
+            print(f"{label:>14}: {results[label]:,.0f} requests/s, "
+                  f"SQLite write-lock wait {stats['sqlite_wait_ms_total']:.0f} ms total")
+        finally:
+            shutdown_writer_actors()
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return results
+
+
+def bench_columnar(rows=1000000, users=20, repeats=5):
+    """Per-user usage report over month and year ranges: SQLite rows vs DuckDB over Parquet"""
+    import analytics
+    import export
+    if analytics.duckdb is None or export.pa is None:
+        print("=== Columnar analytics: skipped (needs duckdb and pyarrow) ===")
+        return {}
+    print(f"=== Columnar analytics ({rows:,} usage rows, {users} users, one year) ===")
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        db_path = os.path.join(tmp_dir, 'bench.db')
+        with quiet():
+            manager = DatabaseManager(db_path)
+            with quiet():
+                manager.initialize_database()
+        conn = open_connection(db_path)
+        batch = []
+        for user_id, url, domain, duration, counts, timestamp, ts_epoch_ms, distraction, productive in \
+                synthetic_events(rows, users=users):
+            batch.append((user_id, manager.urls.id(url), manager.domains.id(domain), duration,
+                          *counts, timestamp, ts_epoch_ms, distraction, productive))
+            if len(batch) >= 10000:
+                conn.executemany(USAGE_INSERT_SQL, batch)
+                conn.commit()
+                batch = []
+        conn.executemany(USAGE_INSERT_SQL, batch)
+        conn.commit()
+        conn.close()
+
+        parquet_dir = os.path.join(tmp_dir, 'parquet')
+        with quiet():
+            export.export_all(db_path, os.path.join(tmp_dir, 'none.db'), parquet_dir, ['usage_data'])
+        columnar = analytics.ColumnarAnalytics(parquet_dir)
+
+        start = datetime(2024, 1, 1)
+        results = {}
+        for label, days in (('month', 30), ('year', 365)):
+            start_ms = int(start.timestamp() * 1000)
+            end_ms = int((start + timedelta(days=days)).timestamp() * 1000)
+            for engine, report in (('sqlite', lambda: manager.get_usage_report('user_0', start_ms, end_ms)),
+                                   ('duckdb', lambda: columnar.usage_report(manager, 'user_0', start_ms, end_ms))):
+                report()
+                begin = time.perf_counter()
+                for _ in range(repeats):
+                    report()
+                results[(label, engine)] = (time.perf_counter() - begin) / repeats * 1000
+            print(f"{label:>6} range: SQLite {results[(label, 'sqlite')]:7.1f} ms, "
+                  f"DuckDB {results[(label, 'duckdb')]:7.1f} ms")
+
+        # get-insights and adjust-limits aggregate all history from the hourly rollups
+        with quiet():
+            manager.rebuild_rollups()
+        begin = time.perf_counter()
+        for _ in range(repeats):
+            manager.get_user_analytics_data('user_0')
+            manager.get_user_performance('user_0')
+        results['rollups'] = (time.perf_counter() - begin) / repeats * 1000
+        print(f"insights + limits from rollups (all history): {results['rollups']:.1f} ms")
+        return results
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def bench_daily_summary(session_counts=(50, 5000, 50000), repeats=20):
+    """Daily summary cost vs sessions per day: Python loop over raw rows vs grouped rollup query"""
+    print("=== Daily summary aggregation ===")
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        db_path = os.path.join(tmp_dir, 'bench.db')
+        with quiet():
+            manager = DatabaseManager(db_path)
+            with quiet():
+                manager.initialize_database()
+        rng = random.Random(42)
+        domains = DOMAINS + [f'site{i}.example.com' for i in range(32)]
+        start = datetime(2024, 1, 1)
+        conn = open_connection(db_path)
+        for sessions in session_counts:
+            rows = []
+            for n in range(sessions):
+                domain = rng.choice(domains)
+                when = start + timedelta(seconds=n * 86400 / sessions)
+                rows.append((f'user_{sessions}', manager.urls.id(f'https://{domain}/page/{n % 500}'),
+                             manager.domains.id(domain), rng.randint(5, 900), 0, 0, 0, 0,
+                             when.isoformat(), int(when.timestamp() * 1000),
+                             domain in DOMAINS[3:], domain in DOMAINS[:3]))
+            conn.executemany(USAGE_INSERT_SQL, rows)
+            conn.commit()
+        conn.close()
+        with quiet():
+            manager.rebuild_rollups()
+
+        def row_loop(user_id):
+            # The summary path before aggregation moved into SQL
+            productive = distraction = 0
+            for entry in manager.get_daily_data(user_id, '2024-01-01')['usage_entries']:
+                if entry['is_productive']:
+                    productive += entry['duration']
+                if entry['is_distraction']:
+                    distraction += entry['duration']
+            return productive, distraction
+
+        def grouped(user_id):
+            report = manager.get_daily_report(user_id, '2024-01-01')
+            return report['productive_secs'], report['distraction_secs']
+
+        def timed(summary, user_id):
+            begin = time.perf_counter()
+            for _ in range(repeats):
+                summary(user_id)
+            return (time.perf_counter() - begin) / repeats * 1000
+
+        results = {}
+        for sessions in session_counts:
+            user_id = f'user_{sessions}'
+            assert row_loop(user_id) == grouped(user_id)
+            results[(sessions, 'rows')] = timed(row_loop, user_id)
+            results[(sessions, 'rollup')] = timed(grouped, user_id)
+
+        # The nightly job turns finished days into primary-key lookups
+        with quiet():
+            manager.precompute_daily_summaries('2024-01-01')
+        for sessions in session_counts:
+            user_id = f'user_{sessions}'
+            results[(sessions, 'stored')] = timed(grouped, user_id)
+            print(f"{sessions:>6} sessions: row loop {results[(sessions, 'rows')]:8.2f} ms, "
+                  f"grouped rollup {results[(sessions, 'rollup')]:6.2f} ms, "
+                  f"stored summary {results[(sessions, 'stored')]:5.2f} ms")
+        return results
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def bench_history_search(rows=300000, users=20, repeats=20):
+    """Search one user's year of tab titles and URLs: LIKE scan vs the FTS5 index"""
+    print(f"=== History search ({rows:,} tab switches, {users} users, one year) ===")
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        db_path = os.path.join(tmp_dir, 'bench.db')
+        with quiet():
+            manager = DatabaseManager(db_path)
+            with quiet():
+                manager.initialize_database()
+        rng = random.Random(42)
+        words = ['python', 'release', 'notes', 'tutorial', 'weather', 'music', 'video', 'news', 'recipe',
+                 'football', 'pull', 'request', 'review', 'invoice', 'travel', 'hotel', 'sqlite', 'index']
+        domains = DOMAINS + [f'site{i}.example.com' for i in range(32)]
+        url_ids = [manager.urls.id(f'https://{rng.choice(domains)}/page/{i}') for i in range(5000)]
+        start = datetime(2024, 1, 1)
+        conn = open_connection(db_path)
+        batch = []
+        for n in range(rows):
+            when = start + timedelta(seconds=n * 365 * 86400 // rows)
+            title = ' '.join(rng.choice(words) for _ in range(6))
+            if rng.random() < 0.001:
+                title += ' changelog'
+            batch.append((f'user_{n % users}', rng.choice(url_ids), title, when.isoformat(),
+                          int(when.timestamp() * 1000), when.hour))
+            if len(batch) >= 10000:
+                conn.executemany(TAB_ACTIVITY_INSERT_SQL, batch)
+                conn.commit()
+                batch = []
+        conn.executemany(TAB_ACTIVITY_INSERT_SQL, batch)
+        conn.commit()
+
+        def like_scan(term):
+            return [row[0] for row in conn.execute('''
+                SELECT ta.id FROM tab_activity ta LEFT JOIN urls u ON u.id = ta.url_id
+                WHERE ta.user_id = ? AND (ta.title LIKE ? OR u.url LIKE ?)
+                ORDER BY ta.id DESC LIMIT 50
+            ''', ('user_0', f'%{term}%', f'%{term}%'))]
+
+        def fts(term):
+            return [result['id'] for result in manager.search_history('user_0', term, limit=50)['results']]
+
+        results = {}
+        for term in ('sqlite', 'changelog'):
+            assert set(like_scan(term)) == set(fts(term))
+            for label, search in (('like', like_scan), ('fts', fts)):
+                begin = time.perf_counter()
+                for _ in range(repeats):
+                    search(term)
+                results[(term, label)] = (time.perf_counter() - begin) / repeats * 1000
+            print(f"{term:>9} ({len(fts(term))} hits on the first page): "
+                  f"LIKE scan {results[(term, 'like')]:7.2f} ms, FTS5 {results[(term, 'fts')]:6.2f} ms")
+        conn.close()
+        return results
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def bench_hot_tier(history_rows=200000, events=2000, reads=200):
+    """Today's events: store + read cost on disk vs in the in-memory hot tier"""
+    print(f"=== Hot tier ({history_rows:,} rows of history, {events} events today) ===")
+    results = {}
+    for label, hot_tier in (('disk', False), ('hot tier', True)):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            db_path = os.path.join(tmp_dir, 'bench.db')
+            with quiet():
+                seed = DatabaseManager(db_path)
+                with quiet():
+                    seed.initialize_database()
+            conn = open_connection(db_path)
+            rows = [(user_id, seed.urls.id(url), seed.domains.id(domain), duration, *counts, timestamp, ts_epoch_ms,
+                     distraction, productive)
+                    for user_id, url, domain, duration, counts, timestamp, ts_epoch_ms, distraction, productive
+                    in synthetic_events(history_rows, users=20, distinct_urls=500)]
+            conn.executemany(USAGE_INSERT_SQL, rows)
+            conn.commit()
+            conn.close()
+            with quiet():
+                seed.rebuild_rollups()
+                manager = DatabaseManager(db_path, hot_tier=hot_tier)
+
+            today = datetime.now().strftime('%Y-%m-%d')
+            begin = time.perf_counter()
+            with quiet():
+                for _ in range(events):
+                    manager.store_usage_data(make_usage_entry('user_0'))
+            results[(label, 'store')] = (time.perf_counter() - begin) / events * 1000
+
+            begin = time.perf_counter()
+            for _ in range(reads):
+                manager.get_daily_report('user_0', today)
+                manager.get_daily_data('user_0', today)
+            results[(label, 'read')] = (time.perf_counter() - begin) / reads * 1000
+            with quiet():
+                manager.flush()
+            print(f"{label:>9}: store {results[(label, 'store')]:.3f} ms/event, "
+                  f"today's report + rows {results[(label, 'read')]:.3f} ms")
+        finally:
+            with quiet():
+                shutdown_hot_tiers()
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return results
+
+
+def bench_shared_model(threads=8, users=200, events_per_user=50, tabs_per_user=10):
+    """ProductivityModel memory and alert hit rate: one model per thread vs one shared model.
+
+    Requests are taken off one queue by whichever server thread is free, so a
+    user's distraction list and their later tab switches usually land on
+    different threads.
+    """
+    import queue
+    import tracemalloc
+    from model import ProductivityModel
+
+    print(f"=== Shared model ({threads} threads, {users} users) ===")
+    results = {}
+    for label, shared in (('per-thread', False), ('shared', True)):
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        shared_model = ProductivityModel() if shared else None
+        local = threading.local()
+        alerts = []
+
+        def get_model():
+            if shared_model is not None:
+                return shared_model
+            if not hasattr(local, 'model'):
+                local.model = ProductivityModel()
+            return local.model
+
+        def worker(_):
+            # A pooled server: the same threads serve both phases
+            models.append(get_model())
+            for phase, requests in enumerate((learn, browse)):
+                if phase:
+                    learned.wait()
+                while True:
+                    try:
+                        request = requests.get_nowait()
+                    except queue.Empty:
+                        break
+                    request(get_model())
+
+        def tab_switch(user_id, url):
+            def request(model):
+                alerts.append(model.analyze_tab_activity({'user_id': user_id, 'url': url, 'time_of_day': 22}))
+            return request
+
+        rng = random.Random(42)
+        learn, browse = queue.Queue(), queue.Queue()
+        for u in range(users):
+            user_id = f'user_{u}'
+            distractions = [f'https://{domain}/' for domain in DOMAINS[3:]]
+            learn.put(lambda model, user_id=user_id, urls=distractions:
+                      model.update_distraction_patterns(user_id, urls))
+            for _ in range(events_per_user):
+                learn.put(lambda model, entry=make_usage_entry(user_id): model.process_usage_data(entry))
+            for _ in range(tabs_per_user):
+                browse.put(tab_switch(user_id, rng.choice(distractions)))
+
+        models = []
+        learned = threading.Barrier(threads)
+        elapsed = run_threads(worker, threads)
+        memory = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        hit_rate = sum(alert is not None for alert in alerts) / len(alerts)
+        results[label] = {'memory_kb': memory / 1024, 'hit_rate': hit_rate, 'seconds': elapsed}
+        print(f"{label:>10}: {len({id(model) for model in models})} model(s), {memory / 1024:8.0f} KB, "
+              f"alert hit rate {hit_rate:.0%}, {elapsed:.2f}s")
+    return results
+
+
+def bench_streaming_stats(event_counts=(1000, 10000, 100000), users=10):
+    """behavioral_patterns memory as events accumulate (should stay flat) and insight cost"""
+    import tracemalloc
+    from model import ProductivityModel
+
+    print(f"=== Streaming pattern statistics ({users} users) ===")
+    results = {}
+    for events in event_counts:
+        random.seed(42)
+        entries = [make_usage_entry(f'user_{n % users}') for n in range(events)]
+        tracemalloc.start()
+        model = ProductivityModel()
+        before = tracemalloc.get_traced_memory()[0]
+        with quiet():
+            for entry in entries:
+                model.process_usage_data(entry)
+        memory = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+
+        begin = time.perf_counter()
+        for _ in range(100):
+            model.generate_productivity_insights('user_0', {'total_time': 600})
+        insights_ms = (time.perf_counter() - begin) / 100 * 1000
+        results[events] = {'memory_kb': memory / 1024, 'insights_ms': insights_ms}
+        print(f"{events:>7} events: patterns {memory / 1024:7.0f} KB, insights {insights_ms:.3f} ms")
+    return results
+
+
+def _legacy_model_layout(url_lists, entries):
+    """user_profiles / behavioral_patterns as the baseline model kept them: nested dicts of lists"""
+    from model import ProductivityModel
+
+    score = ProductivityModel()._calculate_engagement_score
+    profiles, patterns = {}, {}
+    for user_id, urls in url_lists.items():
+        profiles[user_id] = {'distraction_urls': [{'url': url} for url in urls[:5]],
+                             'productive_urls': [{'url': url} for url in urls[5:]],
+                             'intervention_history': [], 'performance_metrics': {}}
+    for entry in entries:
+        user = patterns.setdefault(entry['user_id'], {
+            'time_patterns': {}, 'engagement_patterns': {}, 'productivity_scores': []})
+        hour = datetime.fromisoformat(entry['timestamp']).hour
+        user['time_patterns'].setdefault(hour, {}).setdefault(entry['domain'], []).append(entry['duration'])
+        user['engagement_patterns'].setdefault(entry['domain'], []).append(
+            score(entry['interactions'], entry['duration']))
+        user['productivity_scores'].append(entry['duration'] if entry['is_productive'] else -entry['duration'])
+    return profiles, patterns
+
+
+def bench_model_layout(users=10000, events_per_user=20):
+    """Heap size and full-GC time of per-user model state, baseline nested dicts vs slotted arrays"""
+    import gc
+    import tracemalloc
+    from model import ProductivityModel
+
+    print(f"=== Model per-user layout ({users} users, {events_per_user} events each) ===")
+
+    def make_inputs():
+        random.seed(42)
+        start = datetime.now() - timedelta(days=1)
+        url_lists = {f'user_{n}': [f'https://{domain}/page/{n % 500}' for domain in DOMAINS]
+                     for n in range(users)}
+        entries = [make_usage_entry(f'user_{n % users}', start + timedelta(minutes=random.randint(0, 1439)))
+                   for n in range(users * events_per_user)]
+        return url_lists, entries
+
+    def build_compact(url_lists, entries):
+        model = ProductivityModel()
+        with quiet():
+            for user_id, urls in url_lists.items():
+                model.update_distraction_patterns(user_id, urls[:5])
+                model.update_productive_patterns(user_id, urls[5:])
+            for entry in entries:
+                model.process_usage_data(entry)
+        return model
+
+    results = {}
+    for name, build in (('nested lists', _legacy_model_layout), ('slots + arrays', build_compact)):
+        gc.collect()
+        baseline_objects = len(gc.get_objects())
+        url_lists, entries = make_inputs()
+        tracemalloc.start()
+        state = build(url_lists, entries)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        # Only the model state stays alive while the collector is timed and objects counted
+        del url_lists, entries
+        gc.collect()
+        begin = time.perf_counter()
+        gc.collect()
+        gc_ms = (time.perf_counter() - begin) * 1000
+        objects = len(gc.get_objects()) - baseline_objects
+        del state
+        results[name] = {'memory_mb': memory / 2 ** 20, 'gc_ms': gc_ms, 'gc_objects': objects}
+        print(f"{name:>15}: {memory / 2 ** 20:6.1f} MB, full GC {gc_ms:6.1f} ms, {objects} tracked objects")
+    return results
+
+
+def bench_batch_ingest(events=200000, users=1000, batch_size=200):
+    """Model updates per event vs one columnar batch per request, and startup replay from the database"""
+    from model import ProductivityModel, usage_batch_row
+
+    print(f"=== Model batch ingest ({events} events, {users} users) ===")
+    random.seed(42)
+    start = datetime.now() - timedelta(days=3)
+    entries = [make_usage_entry(f'user_{n % users}', start + timedelta(seconds=random.randint(0, 3 * 86400)))
+               for n in range(events)]
+
+    model = ProductivityModel()
+    begin = time.perf_counter()
+    with quiet():
+        for entry in entries:
+            model.process_usage_data(entry)
+    per_event = time.perf_counter() - begin
+
+    # Each /api/usage-data/batch request carries batch_size events of one user
+    by_user = {}
+    for entry in entries:
+        by_user.setdefault(entry['user_id'], []).append(entry)
+    model = ProductivityModel()
+    begin = time.perf_counter()
+    rows = {user_id: [usage_batch_row(entry) for entry in user_entries] for user_id, user_entries in by_user.items()}
+    build = time.perf_counter()
+    for user_rows in rows.values():
+        for offset in range(0, len(user_rows), batch_size):
+            model.process_usage_batch(model.usage_batch(user_rows[offset:offset + batch_size]))
+    batched = time.perf_counter() - begin
+    print(f"process_usage_data:  {per_event * 1000:8.1f} ms ({events / per_event:9.0f} events/s)")
+    print(f"process_usage_batch: {batched * 1000:8.1f} ms ({events / batched:9.0f} events/s, "
+          f"{(build - begin) * 1000:.1f} ms of it parsing entries into rows)")
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        db = DatabaseManager(os.path.join(tmp_dir, 'replay.db'))
+        with quiet():
+            db.initialize_database()
+        with quiet():
+            for user_id, user_entries in by_user.items():
+                db.store_usage_batch(user_id, user_entries)
+        model = ProductivityModel()
+        begin = time.perf_counter()
+        for page in db.iter_usage_history(int(start.timestamp() * 1000)):
+            model.process_usage_batch(model.usage_batch(page))
+        replay = time.perf_counter() - begin
+        print(f"startup replay:      {replay * 1000:8.1f} ms ({events / replay:9.0f} events/s, read + update)")
+        db.close()
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return {'per_event_s': per_event, 'batch_s': batched, 'replay_s': replay}
+
+
+BENCHMARKS = {
+    'pool': bench_connection_pool,
+    'write-behind': bench_write_behind,
+    'interning': bench_interning,
+    'sharding': bench_sharding,
+    'locks': bench_lock_striping,
+    'actor': bench_writer_actor,
+    'columnar': bench_columnar,
+    'daily-summary': bench_daily_summary,
+    'search': bench_history_search,
+    'hot-tier': bench_hot_tier,
+    'model': bench_shared_model,
+    'stats': bench_streaming_stats,
+    'model-layout': bench_model_layout,
+    'batch': bench_batch_ingest,
+}
+
+
+def main():
+    """Run the selected benchmarks (all by default)"""
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark: {name} (choose from {', '.join(BENCHMARKS)})")
+            continue
+        BENCHMARKS[name]()
+        print()
+
+
+if __name__ == "__main__":
+    main()
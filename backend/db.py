@@ -1,7 +1,20 @@
 import sqlite3
+import atexit
+import functools
+import gzip
+import hashlib
 import json
+import os
+import queue
+import shutil
+import tempfile
 import threading
-from datetime import datetime
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from typing import Dict, List, Any, Optional
 from dataclasses import dataclass
 
@@ -16,20 +29,1756 @@ class UserContext:
     stress_indicators: List[str]
 
 
+DEFAULT_POOL_SIZE = 8
+
+# How long a writer waits for SQLite's write lock before "database is locked".
+# In WAL mode only writers contend, and ingest commits take milliseconds, but
+# maintenance transactions (rollup rebuild, archival copy) can hold the lock
+# for seconds, so ingest waits them out instead of failing.
+BUSY_TIMEOUT_MS = 10000
+
+# Applied to every pooled connection. WAL lets readers run alongside the single
+# writer, and synchronous=NORMAL only fsyncs at checkpoints in WAL mode.
+CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA cache_size=-16000',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA temp_store=MEMORY',
+    f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}',
+)
+
+
+def open_connection(db_name: str, read_only: bool = False) -> sqlite3.Connection:
+    """Open a tuned SQLite connection (WAL mode, larger page cache, mmap)"""
+    conn = sqlite3.connect(db_name, check_same_thread=False)
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    if read_only:
+        # Any write on this connection fails instead of taking the write lock
+        conn.execute('PRAGMA query_only=ON')
+    return conn
+
+
+class ConnectionPool:
+    """Bounded pool of long-lived SQLite connections shared across threads"""
+
+    def __init__(self, db_name: str, max_size: int = DEFAULT_POOL_SIZE, timeout: float = 10.0,
+                 read_only: bool = False):
+        self.db_name = db_name
+        self.read_only = read_only
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self.stats = {'opened': 0, 'reused': 0, 'waited': 0}
+
+    def acquire(self) -> sqlite3.Connection:
+        """Take an idle connection, opening a new one while under max_size"""
+        try:
+            conn = self._idle.get_nowait()
+            self.stats['reused'] += 1
+            return conn
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_open = self._created < self.max_size
+            if can_open:
+                self._created += 1
+
+        if can_open:
+            try:
+                conn = open_connection(self.db_name, self.read_only)
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+            self.stats['opened'] += 1
+            return conn
+
+        # Pool exhausted: wait for another thread to release a connection
+        self.stats['waited'] += 1
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No database connection available for {self.db_name} after {self.timeout}s")
+
+    def release(self, conn: sqlite3.Connection):
+        """Return a connection to the pool, discarding any open transaction"""
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def close_all(self):
+        """Close all idle connections"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_read_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool_locked(db_name: str) -> ConnectionPool:
+    """Get or create a pool; caller must hold _pools_lock"""
+    pool = _pools.get(db_name)
+    if pool is None:
+        pool = ConnectionPool(db_name)
+        _pools[db_name] = pool
+    return pool
+
+
+def get_connection_pool(db_name: str) -> ConnectionPool:
+    """Get the process-wide connection pool for a database file"""
+    with _pools_lock:
+        return get_connection_pool_locked(db_name)
+
+
+def get_read_pool(db_name: str) -> ConnectionPool:
+    """Get the process-wide pool of read-only (query_only) connections for a database file"""
+    with _pools_lock:
+        pool = _read_pools.get(db_name)
+        if pool is None:
+            pool = ConnectionPool(db_name, read_only=True)
+            _read_pools[db_name] = pool
+        return pool
+
+
+class UserContextCache:
+    """Size-bounded LRU cache of UserContext objects with a TTL.
+
+    Writers call invalidate(user_id) after committing data that feeds the
+    context. Each invalidation bumps a per-user generation, and put() drops
+    values computed against an older generation, so a read that raced with a
+    write can never re-insert a stale context. clear() does the same for
+    every user at once, after bulk rewrites such as a rollup rebuild.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def get(self, user_id: str) -> tuple:
+        """Return (context or None, generation token to pass to put)"""
+        with self._lock:
+            generation = (self._epoch, self._generations.get(user_id, 0))
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                context, expires_at = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(user_id)
+                    self.hits += 1
+                    return context, generation
+                del self._entries[user_id]
+            self.misses += 1
+            return None, generation
+
+    def put(self, user_id: str, context: 'UserContext', generation: tuple):
+        """Cache a context unless the user was invalidated since get()"""
+        with self._lock:
+            if (self._epoch, self._generations.get(user_id, 0)) != generation:
+                return
+            self._entries[user_id] = (context, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id: str):
+        """Drop a user's cached context after their data changed"""
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        """Drop every cached context after a change to many users' data"""
+        with self._lock:
+            self._epoch += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """Counters for monitoring the hit rate"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'invalidations': self.invalidations,
+                'evictions': self.evictions
+            }
+
+
+class StripedLock:
+    """Fixed set of locks shared by every DatabaseManager for one database file.
+
+    A user_id always hashes to the same stripe, so writes for one user are
+    serialized across request threads while other users' writes proceed.
+    Every acquisition records how long it waited, as does every wait for
+    SQLite's own write lock (record_busy_wait), so contention can be measured.
+    """
+
+    # An uncontended BEGIN IMMEDIATE takes microseconds; anything slower waited for another writer
+    BUSY_WAIT_THRESHOLD_SECS = 0.001
+
+    def __init__(self, stripes: int = 64):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._stats_lock = threading.Lock()
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_secs = 0.0
+        self.max_wait_secs = 0.0
+        self.busy_waits = 0
+        self.busy_wait_secs = 0.0
+
+    def _record(self, waited: float, contended: bool):
+        with self._stats_lock:
+            self.acquisitions += 1
+            self.contended += contended
+            self.wait_secs += waited
+            self.max_wait_secs = max(self.max_wait_secs, waited)
+
+    @contextmanager
+    def hold(self, key: str):
+        """Hold the stripe for key (usually a user_id)"""
+        lock = self._locks[zlib.crc32(key.encode('utf-8')) % len(self._locks)]
+        if lock.acquire(blocking=False):
+            self._record(0.0, False)
+        else:
+            start = time.perf_counter()
+            lock.acquire()
+            self._record(time.perf_counter() - start, True)
+        try:
+            yield
+        finally:
+            lock.release()
+
+    @contextmanager
+    def hold_all(self):
+        """Hold every stripe (in a fixed order, so it cannot deadlock with hold)"""
+        start = time.perf_counter()
+        for lock in self._locks:
+            lock.acquire()
+        self._record(time.perf_counter() - start, False)
+        try:
+            yield
+        finally:
+            for lock in reversed(self._locks):
+                lock.release()
+
+    def record_busy_wait(self, waited: float):
+        """Record how long a BEGIN IMMEDIATE took; only slow ones count as waits for the lock"""
+        if waited < self.BUSY_WAIT_THRESHOLD_SECS:
+            return
+        with self._stats_lock:
+            self.busy_waits += 1
+            self.busy_wait_secs += waited
+
+    def stats(self) -> Dict:
+        """Wait-time counters for monitoring lock contention"""
+        with self._stats_lock:
+            return {
+                'stripes': len(self._locks),
+                'acquisitions': self.acquisitions,
+                'contended': self.contended,
+                'wait_ms_total': round(self.wait_secs * 1000, 3),
+                'avg_wait_ms': round(self.wait_secs * 1000 / self.acquisitions, 4) if self.acquisitions else 0.0,
+                'max_wait_ms': round(self.max_wait_secs * 1000, 3),
+                'sqlite_busy_waits': self.busy_waits,
+                'sqlite_wait_ms_total': round(self.busy_wait_secs * 1000, 3),
+            }
+
+
+class KnownUsers:
+    """Process-wide set of user IDs already present in the users table.
+
+    Warmed from the table on first use and extended by writers after their
+    transaction commits, so writes for existing users skip the users table.
+    """
+
+    def __init__(self, pool: ConnectionPool):
+        self.pool = pool
+        self._users = set()
+        self._warmed = False
+        self._lock = threading.Lock()
+
+    def warm(self):
+        """Load every existing user ID (runs once)"""
+        with self._lock:
+            if self._warmed:
+                return
+            conn = self.pool.acquire()
+            try:
+                self._users.update(row[0] for row in conn.execute('SELECT user_id FROM users'))
+            except sqlite3.OperationalError:
+                # users table not created yet; initialize_database warms again
+                return
+            finally:
+                self.pool.release(conn)
+            self._warmed = True
+
+    def __contains__(self, user_id: str) -> bool:
+        if not self._warmed:
+            self.warm()
+        return user_id in self._users
+
+    def unknown(self, user_ids) -> set:
+        """The subset of user_ids not yet in the users table"""
+        return {user_id for user_id in user_ids if user_id not in self}
+
+    def add(self, user_id: str):
+        self._users.add(user_id)
+
+
+class Interner:
+    """Process-wide string -> integer ID cache over a dictionary table.
+
+    Used for the domains and urls tables. Values missing from the cache are
+    looked up, and inserted if new, in a short transaction of their own
+    before the caller's write, so the cache never holds an ID whose row was
+    rolled back. URLs are found through a 64-bit hash index instead of a
+    second copy of their (sometimes kilobytes long) text.
+    """
+
+    def __init__(self, pool: ConnectionPool, table: str, column: str, hashed: bool = False,
+                 max_entries: int = 100000):
+        self.pool = pool
+        self.table = table
+        self.column = column
+        self.hashed = hashed
+        self.max_entries = max_entries
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def id(self, value: str) -> int:
+        """Get the ID for one value"""
+        return self.ids([value])[value]
+
+    def ids(self, values) -> Dict[str, int]:
+        """Get IDs for several values, interning any that are new"""
+        result = {}
+        missing = []
+        with self._lock:
+            for value in values:
+                value_id = self._ids.get(value)
+                if value_id is None:
+                    missing.append(value)
+                else:
+                    self._ids.move_to_end(value)
+                    result[value] = value_id
+        if missing:
+            result.update(self._lookup_or_insert(missing))
+        return result
+
+    def _lookup_or_insert(self, values: List[str]) -> Dict[str, int]:
+        """Resolve uncached values against the table, inserting new ones"""
+        found = {}
+        # Serialized per process so two threads never insert the same URL twice
+        with self._lock:
+            conn = self.pool.acquire()
+            try:
+                cursor = conn.cursor()
+                for value in dict.fromkeys(values):
+                    if self.hashed:
+                        cursor.execute(f'SELECT MIN(id) FROM {self.table} WHERE url_hash = ? AND {self.column} = ?',
+                                       (url_hash(value), value))
+                    else:
+                        cursor.execute(f'SELECT id FROM {self.table} WHERE {self.column} = ?', (value,))
+                    row = cursor.fetchone()
+                    if row and row[0] is not None:
+                        found[value] = row[0]
+                    elif self.hashed:
+                        cursor.execute(f'INSERT INTO {self.table} (url_hash, {self.column}) VALUES (?, ?)',
+                                       (url_hash(value), value))
+                        found[value] = cursor.lastrowid
+                    else:
+                        cursor.execute(f'INSERT INTO {self.table} ({self.column}) VALUES (?)', (value,))
+                        found[value] = cursor.lastrowid
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                self.pool.release(conn)
+
+            self._ids.update(found)
+            while len(self._ids) > self.max_entries:
+                self._ids.popitem(last=False)
+        return found
+
+
+_context_caches: Dict[str, UserContextCache] = {}
+_striped_locks: Dict[str, StripedLock] = {}
+_interners: Dict[tuple, Interner] = {}
+_known_users: Dict[str, KnownUsers] = {}
+
+
+def get_known_users(db_name: str) -> KnownUsers:
+    """Get the process-wide known-user registry for a database file"""
+    with _pools_lock:
+        known_users = _known_users.get(db_name)
+        if known_users is None:
+            known_users = KnownUsers(get_connection_pool_locked(db_name))
+            _known_users[db_name] = known_users
+        return known_users
+
+
+def get_interner(db_name: str, table: str) -> Interner:
+    """Get the process-wide interner for the 'domains' or 'urls' table of a database file"""
+    with _pools_lock:
+        interner = _interners.get((db_name, table))
+        if interner is None:
+            pool = get_connection_pool_locked(db_name)
+            if table == 'urls':
+                interner = Interner(pool, 'urls', 'url', hashed=True)
+            else:
+                interner = Interner(pool, 'domains', 'domain')
+            _interners[(db_name, table)] = interner
+        return interner
+
+
+def get_striped_lock(db_name: str) -> StripedLock:
+    """Get the process-wide per-user write lock for a database file"""
+    with _pools_lock:
+        locks = _striped_locks.get(db_name)
+        if locks is None:
+            locks = StripedLock()
+            _striped_locks[db_name] = locks
+        return locks
+
+
+def get_user_context_cache(db_name: str) -> UserContextCache:
+    """Get the process-wide UserContext cache for a database file"""
+    with _pools_lock:
+        cache = _context_caches.get(db_name)
+        if cache is None:
+            cache = UserContextCache()
+            _context_caches[db_name] = cache
+        return cache
+
+
+# Column order of the insert parameter tuples built by the *_row helpers below
+USAGE_COLUMNS = ('user_id', 'url_id', 'domain_id', 'duration', 'clicks', 'scrolls', 'keystrokes',
+                 'mouse_movements', 'timestamp', 'ts_epoch_ms', 'is_distraction', 'is_productive')
+TAB_ACTIVITY_COLUMNS = ('user_id', 'url_id', 'title', 'timestamp', 'ts_epoch_ms', 'time_of_day')
+INTERVENTION_COLUMNS = ('user_id', 'domain', 'answer', 'timestamp', 'ts_epoch_ms')
+
+# usage_data counter column -> keys accepted in the extension's interactions dict
+INTERACTION_KEYS = {
+    'clicks': ('clicks',),
+    'scrolls': ('scrolls',),
+    'keystrokes': ('keystrokes',),
+    'mouse_movements': ('mouseMovements', 'mouse_movements'),
+}
+
+# Tables whose url column is replaced by an interned url_id
+URL_TABLES = ('usage_data', 'tab_activity', 'distraction_urls', 'productive_urls')
+
+
+def _insert_sql(table: str, columns: tuple) -> str:
+    """Build a parameterized INSERT statement for the given columns"""
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+
+USAGE_INSERT_SQL = _insert_sql('usage_data', USAGE_COLUMNS)
+TAB_ACTIVITY_INSERT_SQL = _insert_sql('tab_activity', TAB_ACTIVITY_COLUMNS)
+INTERVENTION_INSERT_SQL = _insert_sql('intervention_responses', INTERVENTION_COLUMNS)
+
+INSERT_SQL = {
+    'usage_data': USAGE_INSERT_SQL,
+    'tab_activity': TAB_ACTIVITY_INSERT_SQL,
+    'intervention_responses': INTERVENTION_INSERT_SQL,
+}
+
+
+def to_epoch_ms(value) -> Optional[int]:
+    """Normalize a timestamp to integer epoch milliseconds.
+
+    Accepts ISO strings with either a 'T' or space separator and an optional
+    'Z'/offset suffix (naive values are taken as server local time), or a
+    number of epoch milliseconds, also as text (the extension's Date.now()
+    values). Returns None if the value cannot be parsed.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    value = value.strip() if isinstance(value, str) else ''
+    if not value:
+        return None
+    # Checked first: fromisoformat also accepts some digit strings as basic-format dates
+    if value.isascii() and value.replace('.', '', 1).isdigit():
+        return int(float(value))
+    try:
+        dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return int(dt.timestamp() * 1000)
+
+
+def day_range_ms(date: str) -> tuple:
+    """Get the [start, end) epoch millisecond range of a local YYYY-MM-DD day"""
+    start = datetime.strptime(date, '%Y-%m-%d')
+    end = start + timedelta(days=1)
+    return int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+
+
+def month_range_ms(month: str) -> tuple:
+    """Get the [start, end) epoch millisecond range of a local YYYY-MM month"""
+    start = datetime.strptime(month, '%Y-%m')
+    end = datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+
+
+def local_utc_offset_ms() -> int:
+    """Current offset of server local time from UTC, in milliseconds"""
+    offset = datetime.now().astimezone().utcoffset()
+    return int(offset.total_seconds() * 1000) if offset else 0
+
+
+def local_hour_bucket(ts_epoch_ms: int) -> int:
+    """Hours since the epoch on the server's local wall clock.
+
+    Bucket % 24 is the local hour of day, and a local day covers buckets
+    [day * 24, day * 24 + 24).
+    """
+    local = datetime.fromtimestamp(ts_epoch_ms / 1000).replace(tzinfo=timezone.utc)
+    return int(local.timestamp()) // 3600
+
+
+# SQL equivalent of local_hour_bucket, used to rebuild rollups from raw rows
+LOCAL_HOUR_BUCKET_SQL = "CAST(strftime('%s', ts_epoch_ms / 1000, 'unixepoch', 'localtime') AS INTEGER) / 3600"
+
+# Adds new totals to an existing usage_rollup_hourly row
+_ROLLUP_ACCUMULATE_SQL = '''
+    ON CONFLICT (user_id, hour_bucket, domain_id) DO UPDATE SET
+        total_secs = total_secs + excluded.total_secs,
+        productive_secs = productive_secs + excluded.productive_secs,
+        distraction_secs = distraction_secs + excluded.distraction_secs,
+        count = count + excluded.count,
+        productive_count = productive_count + excluded.productive_count,
+        distraction_count = distraction_count + excluded.distraction_count
+'''
+
+ROLLUP_UPSERT_SQL = '''
+    INSERT INTO usage_rollup_hourly
+    (user_id, hour_bucket, domain_id, total_secs, productive_secs, distraction_secs,
+     count, productive_count, distraction_count)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+''' + _ROLLUP_ACCUMULATE_SQL
+
+_ROLLUP_REBUILD_TEMPLATE = f'''
+    INSERT INTO usage_rollup_hourly
+    (user_id, hour_bucket, domain_id, total_secs, productive_secs, distraction_secs,
+     count, productive_count, distraction_count)
+    SELECT user_id, {LOCAL_HOUR_BUCKET_SQL} AS hour_bucket, domain_id,
+           SUM(duration),
+           SUM(CASE WHEN is_productive = 1 THEN duration ELSE 0 END),
+           SUM(CASE WHEN is_distraction = 1 THEN duration ELSE 0 END),
+           COUNT(*),
+           SUM(CASE WHEN is_productive = 1 THEN 1 ELSE 0 END),
+           SUM(CASE WHEN is_distraction = 1 THEN 1 ELSE 0 END)
+    FROM usage_data
+    WHERE {{where}}
+    GROUP BY user_id, hour_bucket, domain_id
+'''
+ROLLUP_REBUILD_SQL = _ROLLUP_REBUILD_TEMPLATE.format(where='ts_epoch_ms IS NOT NULL')
+# Rebuild only from raw rows at or after a watermark (older raw rows are archived)
+ROLLUP_REBUILD_SINCE_SQL = _ROLLUP_REBUILD_TEMPLATE.format(where='ts_epoch_ms >= ?')
+# Add the rows listed in temp.backfilled_usage to the existing rollups
+ROLLUP_BACKFILL_SQL = _ROLLUP_REBUILD_TEMPLATE.format(
+    where='ts_epoch_ms IS NOT NULL AND id IN (SELECT id FROM temp.backfilled_usage)') + _ROLLUP_ACCUMULATE_SQL
+
+
+def apply_usage_rollup(cursor, rows: List[tuple]):
+    """Add usage_data insert rows to usage_rollup_hourly in the caller's transaction"""
+    user_i, domain_i, duration_i, ts_i, distraction_i, productive_i = (
+        USAGE_COLUMNS.index(name) for name in
+        ('user_id', 'domain_id', 'duration', 'ts_epoch_ms', 'is_distraction', 'is_productive'))
+
+    # Pre-aggregate so a batch costs one upsert per (user, hour, domain)
+    totals: Dict[tuple, List[int]] = {}
+    for row in rows:
+        key = (row[user_i], local_hour_bucket(row[ts_i]), row[domain_i])
+        acc = totals.setdefault(key, [0, 0, 0, 0, 0, 0])
+        duration = row[duration_i]
+        acc[0] += duration
+        acc[3] += 1
+        if row[productive_i]:
+            acc[1] += duration
+            acc[4] += 1
+        if row[distraction_i]:
+            acc[2] += duration
+            acc[5] += 1
+
+    cursor.executemany(ROLLUP_UPSERT_SQL, [key + tuple(acc) for key, acc in totals.items()])
+
+    # Late events for a finished day: refresh its precomputed summary, if any
+    today_bucket = local_hour_bucket(int(time.time() * 1000)) // 24 * 24
+    for user_id, date in {(user_id, bucket_date(hour)) for user_id, hour, _ in totals if hour < today_bucket}:
+        cursor.execute('SELECT 1 FROM daily_summaries WHERE user_id = ? AND date = ?', (user_id, date))
+        if cursor.fetchone():
+            store_daily_summary(cursor, user_id, date)
+
+
+def interaction_counts(interactions) -> tuple:
+    """Extract (clicks, scrolls, keystrokes, mouse_movements) from an interactions dict"""
+    if not isinstance(interactions, dict):
+        return 0, 0, 0, 0
+    counts = []
+    # Plain loops: this runs once per ingested event
+    for keys in INTERACTION_KEYS.values():
+        value = 0
+        for key in keys:
+            if key in interactions:
+                value = interactions[key]
+                break
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            value = 0
+        counts.append(value if value > 0 else 0)
+    return tuple(counts)
+
+
+# Per-row engagement score, the SQL form of ProductivityModel._calculate_engagement_score
+ENGAGEMENT_SCORE_SQL = (
+    'CASE WHEN duration > 0 '
+    'THEN MIN(1.0, CAST(clicks + scrolls + keystrokes AS REAL) / duration) '
+    'ELSE 0.0 END'
+)
+
+
+def _backfill_interaction_counts(cursor):
+    """Migration step: move interactions_json into the counter columns and drop the text"""
+    cursor.execute('SELECT id, interactions_json FROM usage_data WHERE interactions_json IS NOT NULL')
+    updates = []
+    for row_id, interactions_json in cursor.fetchall():
+        try:
+            interactions = json.loads(interactions_json)
+        except (TypeError, ValueError):
+            interactions = {}
+        updates.append(interaction_counts(interactions) + (row_id,))
+    cursor.executemany('''
+        UPDATE usage_data
+        SET clicks = ?, scrolls = ?, keystrokes = ?, mouse_movements = ?, interactions_json = NULL
+        WHERE id = ?
+    ''', updates)
+
+
+def url_hash(url: str) -> int:
+    """Signed 64-bit hash used to look up interned URLs without indexing their text"""
+    return int.from_bytes(hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+
+def _backfill_interned_ids(cursor):
+    """Migration step: move domain and URL text into the dictionary tables"""
+    cursor.execute('''
+        INSERT OR IGNORE INTO domains (domain)
+        SELECT DISTINCT domain FROM usage_data WHERE domain IS NOT NULL
+    ''')
+    cursor.execute('''
+        UPDATE usage_data
+        SET domain_id = (SELECT id FROM domains WHERE domains.domain = usage_data.domain), domain = NULL
+        WHERE domain IS NOT NULL
+    ''')
+
+    distinct_urls = set()
+    for table in URL_TABLES:
+        cursor.execute(f'SELECT DISTINCT url FROM {table} WHERE url IS NOT NULL')
+        distinct_urls.update(row[0] for row in cursor.fetchall())
+
+    # A temporary url -> id map turns each UPDATE into one pass with indexed lookups
+    cursor.execute('CREATE TEMP TABLE url_map (url TEXT PRIMARY KEY, id INTEGER)')
+    url_map = []
+    for url in distinct_urls:
+        cursor.execute('INSERT INTO urls (url_hash, url) VALUES (?, ?)', (url_hash(url), url))
+        url_map.append((url, cursor.lastrowid))
+    cursor.executemany('INSERT INTO url_map (url, id) VALUES (?, ?)', url_map)
+    for table in URL_TABLES:
+        cursor.execute(f'''
+            UPDATE {table}
+            SET url_id = (SELECT id FROM url_map WHERE url_map.url = {table}.url), url = NULL
+            WHERE url IS NOT NULL
+        ''')
+    cursor.execute('DROP TABLE url_map')
+
+
+def _backfill_epoch_ms(cursor):
+    """Migration step: parse the text timestamp of existing rows into ts_epoch_ms"""
+    for table in ('usage_data', 'tab_activity', 'intervention_responses'):
+        cursor.execute(f'SELECT id, timestamp FROM {table} WHERE ts_epoch_ms IS NULL')
+        updates = [(to_epoch_ms(timestamp), row_id) for row_id, timestamp in cursor.fetchall()]
+        cursor.executemany(f'UPDATE {table} SET ts_epoch_ms = ? WHERE id = ?', updates)
+
+
+def _backfill_numeric_epoch_ms(cursor):
+    """Migration step: backfill rows left NULL by migration 2 and add them to the rollups.
+
+    Migration 2 could not parse epoch-ms digit strings, so those rows were
+    missing from every range query, rollup and maintenance job.
+    """
+    cursor.execute('CREATE TEMP TABLE backfilled_usage (id INTEGER PRIMARY KEY)')
+    cursor.execute('INSERT INTO temp.backfilled_usage SELECT id FROM usage_data WHERE ts_epoch_ms IS NULL')
+    _backfill_epoch_ms(cursor)
+    cursor.execute(ROLLUP_BACKFILL_SQL)
+    cursor.execute('DROP TABLE temp.backfilled_usage')
+    # Stored summaries may have been computed without the backfilled rows
+    cursor.execute('DELETE FROM daily_summaries')
+
+
+# Ordered schema migrations, applied once each by initialize_database.
+# A step is either an SQL statement or a callable taking the cursor; every
+# migration runs in its own transaction together with its schema_version row.
+# FTS5 token standing for a tab_activity row's user, so a search intersects
+# the match with that user's rows instead of filtering every user's matches
+HISTORY_OWNER_SQL = "'u' || hex({user_id})"
+
+
+def history_owner(user_id: str) -> str:
+    """Python equivalent of HISTORY_OWNER_SQL"""
+    return 'u' + user_id.encode().hex().upper()
+
+
+def history_match(user_id: str, query: str) -> Optional[str]:
+    """FTS5 MATCH expression for a user's search terms (None if there are none).
+
+    Terms are quoted so punctuation in URLs is not read as query syntax; a
+    trailing * keeps its prefix-search meaning.
+    """
+    terms = []
+    for term in query.split():
+        prefix = term.endswith('*')
+        term = term.rstrip('*')
+        if term:
+            terms.append('"' + term.replace('"', '""') + '"' + (' *' if prefix else ''))
+    if not terms:
+        return None
+    return f'owner : "{history_owner(user_id)}" AND {{title url}} : ({" ".join(terms)})'
+
+
+MIGRATIONS = [
+    (1, 'Composite indexes for per-user queries', [
+        'CREATE INDEX IF NOT EXISTS idx_usage_user_ts ON usage_data (user_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_usage_user_distraction '
+        'ON usage_data (user_id, is_distraction, domain, duration)',
+        'CREATE INDEX IF NOT EXISTS idx_usage_user_productive '
+        'ON usage_data (user_id, is_productive, domain, duration, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_tab_user_ts ON tab_activity (user_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_responses_user_ts ON intervention_responses (user_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_distraction_urls_user ON distraction_urls (user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_productive_urls_user ON productive_urls (user_id)',
+    ]),
+    (2, 'Integer epoch timestamps with range indexes', [
+        'ALTER TABLE usage_data ADD COLUMN ts_epoch_ms INTEGER',
+        'ALTER TABLE tab_activity ADD COLUMN ts_epoch_ms INTEGER',
+        'ALTER TABLE intervention_responses ADD COLUMN ts_epoch_ms INTEGER',
+        _backfill_epoch_ms,
+        'DROP INDEX IF EXISTS idx_usage_user_ts',
+        'DROP INDEX IF EXISTS idx_usage_user_productive',
+        'DROP INDEX IF EXISTS idx_tab_user_ts',
+        'DROP INDEX IF EXISTS idx_responses_user_ts',
+        'CREATE INDEX IF NOT EXISTS idx_usage_user_epoch ON usage_data (user_id, ts_epoch_ms)',
+        'CREATE INDEX IF NOT EXISTS idx_usage_user_productive '
+        'ON usage_data (user_id, is_productive, domain, duration, ts_epoch_ms)',
+        'CREATE INDEX IF NOT EXISTS idx_tab_user_epoch ON tab_activity (user_id, ts_epoch_ms)',
+        'CREATE INDEX IF NOT EXISTS idx_responses_user_epoch ON intervention_responses (user_id, ts_epoch_ms)',
+    ]),
+    (3, 'Hourly per-domain usage rollups', [
+        '''
+        CREATE TABLE IF NOT EXISTS usage_rollup_hourly (
+            user_id TEXT,
+            hour_bucket INTEGER,
+            domain TEXT,
+            total_secs INTEGER DEFAULT 0,
+            productive_secs INTEGER DEFAULT 0,
+            distraction_secs INTEGER DEFAULT 0,
+            count INTEGER DEFAULT 0,
+            productive_count INTEGER DEFAULT 0,
+            distraction_count INTEGER DEFAULT 0,
+            PRIMARY KEY (user_id, hour_bucket, domain)
+        )
+        ''',
+        # Original text-domain rebuild; migration 6 rebuilds it keyed by domain_id
+        f'''
+        INSERT INTO usage_rollup_hourly
+        (user_id, hour_bucket, domain, total_secs, productive_secs, distraction_secs,
+         count, productive_count, distraction_count)
+        SELECT user_id, {LOCAL_HOUR_BUCKET_SQL} AS hour_bucket, COALESCE(domain, ''),
+               SUM(duration),
+               SUM(CASE WHEN is_productive = 1 THEN duration ELSE 0 END),
+               SUM(CASE WHEN is_distraction = 1 THEN duration ELSE 0 END),
+               COUNT(*),
+               SUM(CASE WHEN is_productive = 1 THEN 1 ELSE 0 END),
+               SUM(CASE WHEN is_distraction = 1 THEN 1 ELSE 0 END)
+        FROM usage_data
+        WHERE ts_epoch_ms IS NOT NULL
+        GROUP BY user_id, hour_bucket, COALESCE(domain, '')
+        ''',
+    ]),
+    (4, 'Unique URL lists with content hashes', [
+        'DELETE FROM distraction_urls WHERE url IS NULL OR id NOT IN '
+        '(SELECT MIN(id) FROM distraction_urls GROUP BY user_id, url)',
+        'DELETE FROM productive_urls WHERE url IS NULL OR id NOT IN '
+        '(SELECT MIN(id) FROM productive_urls GROUP BY user_id, url)',
+        'DROP INDEX IF EXISTS idx_distraction_urls_user',
+        'DROP INDEX IF EXISTS idx_productive_urls_user',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_distraction_urls_user_url ON distraction_urls (user_id, url)',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_productive_urls_user_url ON productive_urls (user_id, url)',
+        '''
+        CREATE TABLE IF NOT EXISTS url_list_hashes (
+            user_id TEXT,
+            list_name TEXT,
+            content_hash TEXT,
+            PRIMARY KEY (user_id, list_name)
+        )
+        ''',
+    ]),
+    (5, 'Interaction counter columns replace interactions_json', [
+        'ALTER TABLE usage_data ADD COLUMN clicks INTEGER DEFAULT 0',
+        'ALTER TABLE usage_data ADD COLUMN scrolls INTEGER DEFAULT 0',
+        'ALTER TABLE usage_data ADD COLUMN keystrokes INTEGER DEFAULT 0',
+        'ALTER TABLE usage_data ADD COLUMN mouse_movements INTEGER DEFAULT 0',
+        _backfill_interaction_counts,
+    ]),
+    (6, 'Interned domain and URL dictionary tables', [
+        'CREATE TABLE IF NOT EXISTS domains (id INTEGER PRIMARY KEY, domain TEXT NOT NULL UNIQUE)',
+        'CREATE TABLE IF NOT EXISTS urls (id INTEGER PRIMARY KEY, url_hash INTEGER NOT NULL, url TEXT NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS idx_urls_hash ON urls (url_hash)',
+        'ALTER TABLE usage_data ADD COLUMN domain_id INTEGER',
+        'ALTER TABLE usage_data ADD COLUMN url_id INTEGER',
+        'ALTER TABLE tab_activity ADD COLUMN url_id INTEGER',
+        'ALTER TABLE distraction_urls ADD COLUMN url_id INTEGER',
+        'ALTER TABLE productive_urls ADD COLUMN url_id INTEGER',
+        # Analytics read the rollups now, so the wide text-domain indexes go
+        'DROP INDEX IF EXISTS idx_usage_user_distraction',
+        'DROP INDEX IF EXISTS idx_usage_user_productive',
+        'DROP INDEX IF EXISTS idx_distraction_urls_user_url',
+        'DROP INDEX IF EXISTS idx_productive_urls_user_url',
+        _backfill_interned_ids,
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_distraction_urls_user_url_id ON distraction_urls (user_id, url_id)',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_productive_urls_user_url_id ON productive_urls (user_id, url_id)',
+        'DROP TABLE IF EXISTS usage_rollup_hourly',
+        '''
+        CREATE TABLE usage_rollup_hourly (
+            user_id TEXT,
+            hour_bucket INTEGER,
+            domain_id INTEGER,
+            total_secs INTEGER DEFAULT 0,
+            productive_secs INTEGER DEFAULT 0,
+            distraction_secs INTEGER DEFAULT 0,
+            count INTEGER DEFAULT 0,
+            productive_count INTEGER DEFAULT 0,
+            distraction_count INTEGER DEFAULT 0,
+            PRIMARY KEY (user_id, hour_bucket, domain_id)
+        )
+        ''',
+        ROLLUP_REBUILD_SQL,
+    ]),
+    (7, 'Monthly archive partition catalog', [
+        '''
+        CREATE TABLE IF NOT EXISTS partitions (
+            month TEXT PRIMARY KEY,
+            start_ms INTEGER,
+            end_ms INTEGER,
+            path TEXT,
+            usage_rows INTEGER,
+            tab_rows INTEGER,
+            archived_at TEXT
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_partitions_range ON partitions (start_ms, end_ms)',
+    ]),
+    (8, 'Hourly tab switch aggregates and maintenance watermarks', [
+        '''
+        CREATE TABLE IF NOT EXISTS tab_activity_hourly (
+            user_id TEXT NOT NULL,
+            hour_bucket INTEGER NOT NULL,
+            url_id INTEGER NOT NULL,
+            switches INTEGER DEFAULT 0,
+            PRIMARY KEY (user_id, hour_bucket, url_id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS watermarks (
+            name TEXT PRIMARY KEY,
+            value INTEGER,
+            updated_at TEXT
+        )
+        ''',
+    ]),
+    (9, 'Precomputed daily summaries', [
+        '''
+        CREATE TABLE IF NOT EXISTS daily_summaries (
+            user_id TEXT NOT NULL,
+            date TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            updated_at TEXT,
+            PRIMARY KEY (user_id, date)
+        )
+        ''',
+    ]),
+    (10, 'Full-text search over tab titles and URLs', [
+        # External content: the index reads titles and URLs back through this
+        # view instead of keeping its own copy of every (often huge) URL
+        f'''
+        CREATE VIEW IF NOT EXISTS tab_search_source AS
+        SELECT ta.id AS id, {HISTORY_OWNER_SQL.format(user_id='ta.user_id')} AS owner, ta.title AS title, u.url AS url
+        FROM tab_activity ta LEFT JOIN urls u ON u.id = ta.url_id
+        ''',
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS tab_search USING fts5(
+            owner, title, url, content='tab_search_source', content_rowid='id'
+        )
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS tab_search_insert AFTER INSERT ON tab_activity BEGIN
+            INSERT INTO tab_search (rowid, owner, title, url)
+            VALUES (new.id, {HISTORY_OWNER_SQL.format(user_id='new.user_id')}, new.title,
+                    (SELECT url FROM urls WHERE id = new.url_id));
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS tab_search_delete AFTER DELETE ON tab_activity BEGIN
+            INSERT INTO tab_search (tab_search, rowid, owner, title, url)
+            VALUES ('delete', old.id, {HISTORY_OWNER_SQL.format(user_id='old.user_id')}, old.title,
+                    (SELECT url FROM urls WHERE id = old.url_id));
+        END
+        ''',
+        "INSERT INTO tab_search (tab_search) VALUES ('rebuild')",
+    ]),
+    (11, 'Epoch timestamps stored as digit strings', [
+        _backfill_numeric_epoch_ms,
+    ]),
+    (12, 'Drop unread hourly tab switch aggregates', [
+        'DROP TABLE IF EXISTS tab_activity_hourly',
+    ]),
+]
+
+# One page of a user's rows for iter_usage_history, after a (ts_epoch_ms, id) key
+USAGE_HISTORY_PAGE_SQL = f'''
+    SELECT ud.user_id, d.domain, ({LOCAL_HOUR_BUCKET_SQL}) % 24, ud.duration,
+           ud.clicks, ud.scrolls, ud.keystrokes, ud.is_distraction, ud.is_productive,
+           ud.ts_epoch_ms, ud.id
+    FROM usage_data ud
+    LEFT JOIN domains d ON d.id = ud.domain_id
+    WHERE ud.user_id = ? AND (ud.ts_epoch_ms, ud.id) > (?, ?)
+    ORDER BY ud.ts_epoch_ms, ud.id
+    LIMIT ?
+'''
+
+# Fields of one /api/export/usage record, in CSV column order
+USAGE_EXPORT_COLUMNS = ('id', 'timestamp', 'ts_epoch_ms', 'url', 'domain', 'duration', 'clicks', 'scrolls',
+                        'keystrokes', 'mouse_movements', 'is_distraction', 'is_productive')
+# Open-ended export range (year 9999)
+EXPORT_END_MS = 253402300800000
+
+def usage_report(rows) -> Dict:
+    """Fold (domain, hour, total, productive, distraction, sessions) groups into a report dict"""
+    report = {'total_secs': 0, 'productive_secs': 0, 'distraction_secs': 0, 'sessions': 0,
+              'by_domain': {}, 'by_hour': {}}
+    for domain, hour, total, productive, distraction, sessions in rows:
+        for bucket in (report, report['by_domain'].setdefault(domain or '', {}),
+                       report['by_hour'].setdefault(int(hour), {})):
+            bucket['total_secs'] = bucket.get('total_secs', 0) + int(total or 0)
+            bucket['productive_secs'] = bucket.get('productive_secs', 0) + int(productive or 0)
+            bucket['distraction_secs'] = bucket.get('distraction_secs', 0) + int(distraction or 0)
+        report['sessions'] += int(sessions)
+    return report
+
+
+def merge_usage_reports(first: Dict, second: Dict) -> Dict:
+    """Add two usage_report results (e.g. columnar archive plus fresh SQLite rows)"""
+    merged = usage_report([])
+    for report in (first, second):
+        merged['sessions'] += report['sessions']
+        for key in ('total_secs', 'productive_secs', 'distraction_secs'):
+            merged[key] += report[key]
+        for group in ('by_domain', 'by_hour'):
+            for name, totals in report[group].items():
+                bucket = merged[group].setdefault(name, {'total_secs': 0, 'productive_secs': 0,
+                                                         'distraction_secs': 0})
+                for key, value in totals.items():
+                    bucket[key] += value
+    return merged
+
+
+def bucket_date(hour_bucket: int) -> str:
+    """Local YYYY-MM-DD day of a local hour bucket"""
+    return (datetime(1970, 1, 1) + timedelta(hours=hour_bucket)).strftime('%Y-%m-%d')
+
+
+def daily_report(cursor, user_id: str, date: str) -> Dict:
+    """One user's usage_report for a local day, grouped from usage_rollup_hourly"""
+    start_ms, end_ms = day_range_ms(date)
+    cursor.execute('''
+        SELECT d.domain, t.hour_bucket % 24, t.total, t.productive, t.distraction, t.sessions
+        FROM (
+            SELECT domain_id, hour_bucket, SUM(total_secs) as total, SUM(productive_secs) as productive,
+                   SUM(distraction_secs) as distraction, SUM(count) as sessions
+            FROM usage_rollup_hourly
+            WHERE user_id = ? AND hour_bucket >= ? AND hour_bucket < ?
+            GROUP BY domain_id, hour_bucket
+        ) t LEFT JOIN domains d ON d.id = t.domain_id
+    ''', (user_id, local_hour_bucket(start_ms), local_hour_bucket(end_ms)))
+    return usage_report(cursor.fetchall())
+
+
+def store_daily_summary(cursor, user_id: str, date: str):
+    """Recompute and save one daily_summaries row in the caller's transaction"""
+    payload = json.dumps(daily_report(cursor, user_id, date))
+    cursor.execute('INSERT OR REPLACE INTO daily_summaries (user_id, date, payload, updated_at) VALUES (?, ?, ?, ?)',
+                   (user_id, date, payload, datetime.now().isoformat()))
+
+
+def load_daily_summary(payload: str) -> Dict:
+    """Decode a daily_summaries payload (JSON turns the hour keys into strings)"""
+    report = json.loads(payload)
+    report['by_hour'] = {int(hour): totals for hour, totals in report['by_hour'].items()}
+    return report
+
+
+# Raw tables moved out to monthly archive files by the retention policy
+PARTITIONED_TABLES = ('usage_data', 'tab_activity')
+
+# Archives attached per range-query connection (SQLite allows 10 attached databases)
+ARCHIVES_PER_CONNECTION = 9
+
+
+def _timestamp_or_now(value) -> tuple:
+    """Get the (text, epoch ms) pair stored for an event timestamp.
+
+    Epoch millisecond numbers are kept and rendered as ISO text; missing or
+    unparseable timestamps fall back to the current time.
+    """
+    epoch_ms = to_epoch_ms(value)
+    if epoch_ms is None:
+        now = datetime.now()
+        return now.isoformat(), int(now.timestamp() * 1000)
+    if not isinstance(value, str):
+        value = datetime.fromtimestamp(epoch_ms / 1000).isoformat()
+    return value, epoch_ms
+
+
+def usage_row(usage_entry: Dict, url_id: int, domain_id: int) -> tuple:
+    """Build the usage_data insert parameters for a usage entry"""
+    timestamp, ts_epoch_ms = _timestamp_or_now(usage_entry.get('timestamp'))
+    return (
+        usage_entry['user_id'],
+        url_id,
+        domain_id,
+        int(usage_entry.get('duration', 0)),
+        *interaction_counts(usage_entry.get('interactions', {})),
+        timestamp,
+        ts_epoch_ms,
+        bool(usage_entry.get('is_distraction', False)),
+        bool(usage_entry.get('is_productive', False))
+    )
+
+
+def tab_activity_row(tab_data: Dict, url_id: int) -> tuple:
+    """Build the tab_activity insert parameters for a tab event"""
+    timestamp, ts_epoch_ms = _timestamp_or_now(tab_data.get('timestamp'))
+    return (
+        tab_data['user_id'],
+        url_id,
+        tab_data.get('title', ''),
+        timestamp,
+        ts_epoch_ms,
+        int(tab_data.get('time_of_day', datetime.now().hour))
+    )
+
+
+def intervention_row(interaction: Dict) -> tuple:
+    """Build the intervention_responses insert parameters for an answer"""
+    timestamp, ts_epoch_ms = _timestamp_or_now(interaction.get('timestamp'))
+    return (
+        interaction['user_id'],
+        interaction.get('domain', ''),
+        interaction.get('answer', ''),
+        timestamp,
+        ts_epoch_ms
+    )
+
+
+def write_event_rows(cursor, rows_by_table: Dict[str, List[tuple]], new_users, now: str):
+    """Insert batched event rows (and their new users) in the caller's transaction"""
+    if new_users:
+        cursor.executemany('INSERT OR IGNORE INTO users (user_id, created_at) VALUES (?, ?)',
+                           [(user_id, now) for user_id in new_users])
+    for table, rows in rows_by_table.items():
+        cursor.executemany(INSERT_SQL[table], rows)
+        if table == 'usage_data':
+            apply_usage_rollup(cursor, rows)
+
+
+class WriteBehindQueue:
+    """Bounded queue of ingest events flushed by one writer thread.
+
+    Events are grouped into a single transaction per batch (one fsync for up
+    to batch_size events). A batch is flushed once it is full or once the
+    oldest queued event has waited flush_interval seconds. put() blocks when
+    the queue is full, so producers slow down instead of growing memory.
+    """
+
+    _STOP = object()
+    _FLUSH = object()
+
+    def __init__(self, pool: ConnectionPool, max_size: int = 10000, batch_size: int = 500,
+                 flush_interval: float = 0.5, put_timeout: float = 5.0,
+                 context_cache: Optional[UserContextCache] = None,
+                 known_users: Optional[KnownUsers] = None):
+        self.pool = pool
+        self.context_cache = context_cache
+        self.known_users = known_users
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=max_size)
+        self._closed = False
+        self.stats = {'queued': 0, 'written': 0, 'batches': 0, 'dropped': 0}
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+    def put(self, table: str, row: tuple):
+        """Queue one row; raises queue.Full if the writer cannot keep up"""
+        if self._closed:
+            raise RuntimeError("Write-behind queue is shut down")
+        self._queue.put((table, row), timeout=self.put_timeout)
+        self.stats['queued'] += 1
+
+    def _run(self):
+        """Writer loop: collect a batch on size or time trigger, then commit it"""
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is self._STOP:
+                self._queue.task_done()
+                break
+            if first is self._FLUSH:
+                self._queue.task_done()
+                continue
+
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is self._STOP or item is self._FLUSH:
+                    # Flush requests cut the batch short instead of waiting for the timer
+                    self._queue.task_done()
+                    stopping = item is self._STOP
+                    break
+                batch.append(item)
+
+            try:
+                self._write_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+        # Shutdown: write whatever producers queued before close
+        leftover = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not self._STOP and item is not self._FLUSH:
+                leftover.append(item)
+            self._queue.task_done()
+        for start in range(0, len(leftover), self.batch_size):
+            self._write_batch(leftover[start:start + self.batch_size])
+
+    def _write_batch(self, batch: List[tuple], attempts: int = 3):
+        """Write a batch in one transaction using executemany per table"""
+        rows_by_table: Dict[str, List[tuple]] = {}
+        for table, row in batch:
+            rows_by_table.setdefault(table, []).append(row)
+        user_ids = {row[0] for rows in rows_by_table.values() for row in rows}
+        new_users = self.known_users.unknown(user_ids) if self.known_users else user_ids
+        now = datetime.now().isoformat()
+
+        for attempt in range(1, attempts + 1):
+            conn = self.pool.acquire()
+            try:
+                write_event_rows(conn.cursor(), rows_by_table, new_users, now)
+                conn.commit()
+                self.stats['written'] += len(batch)
+                self.stats['batches'] += 1
+                if self.known_users:
+                    for user_id in new_users:
+                        self.known_users.add(user_id)
+                if self.context_cache:
+                    for table in ('usage_data', 'intervention_responses'):
+                        for user_id in {row[0] for row in rows_by_table.get(table, [])}:
+                            self.context_cache.invalidate(user_id)
+                return
+            except Exception as e:
+                print(f"Error writing batch of {len(batch)} events (attempt {attempt}): {e}")
+                conn.rollback()
+                time.sleep(0.1 * attempt)
+            finally:
+                self.pool.release(conn)
+
+        self.stats['dropped'] += len(batch)
+        print(f"Dropped batch of {len(batch)} events after {attempts} attempts")
+
+    def flush(self):
+        """Block until every event queued so far has been written"""
+        if not self._closed:
+            self._queue.put(self._FLUSH)
+        self._queue.join()
+
+    def shutdown(self):
+        """Stop accepting events, write everything queued and stop the writer"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(self._STOP)
+        self._thread.join()
+
+
+_write_queues: Dict[str, WriteBehindQueue] = {}
+
+
+def get_write_behind_queue(db_name: str) -> WriteBehindQueue:
+    """Get the process-wide write-behind queue for a database file"""
+    context_cache = get_user_context_cache(db_name)
+    known_users = get_known_users(db_name)
+    with _pools_lock:
+        write_queue = _write_queues.get(db_name)
+        if write_queue is None:
+            write_queue = WriteBehindQueue(get_connection_pool_locked(db_name), context_cache=context_cache,
+                                           known_users=known_users)
+            _write_queues[db_name] = write_queue
+        return write_queue
+
+
+def shutdown_write_behind():
+    """Flush and stop every write-behind queue (registered with atexit)"""
+    with _pools_lock:
+        write_queues = list(_write_queues.values())
+        _write_queues.clear()
+    for write_queue in write_queues:
+        write_queue.shutdown()
+
+
+atexit.register(shutdown_write_behind)
+
+
+# How long events stay in the in-memory hot tier after their timestamp
+HOT_WINDOW_MS = 24 * 3600 * 1000
+HOT_TABLES = {'usage_data': USAGE_COLUMNS, 'tab_activity': TAB_ACTIVITY_COLUMNS}
+
+
+class HotTier:
+    """In-memory tier holding the last window_ms of usage_data and tab_activity.
+
+    Events go to an in-memory SQLite database and are appended to a journal
+    file next to the database. A background thread fsyncs the journal every
+    sync_interval seconds, which bounds what a crash can lose, and persists
+    new rows to disk in one transaction every flush_interval seconds and at
+    shutdown. The last persisted journal sequence is stored as a watermark in
+    that transaction, so replaying the journal at startup never writes a row
+    twice.
+
+    Rows stay in memory until window_ms after their timestamp, and startup
+    reloads that window from disk, so reads of recent ranges never touch the
+    file. Readers that only query the file (reports, exports, history search)
+    persist pending rows first. Only rows written through this process are
+    seen, which assumes one server process per database file.
+    """
+
+    def __init__(self, db_name: str, pool: ConnectionPool, window_ms: int = HOT_WINDOW_MS,
+                 flush_interval: float = 5.0, sync_interval: float = 1.0,
+                 context_cache: Optional[UserContextCache] = None,
+                 known_users: Optional[KnownUsers] = None):
+        self.pool = pool
+        self.window_ms = window_ms
+        self.flush_interval = flush_interval
+        self.sync_interval = sync_interval
+        self.context_cache = context_cache
+        self.known_users = known_users
+        self.journal_path = db_name + '.hot-journal'
+        self.stats = {'buffered': 0, 'persisted': 0, 'flushes': 0, 'replayed': 0, 'evicted': 0}
+        # Guards the memory database, the journal and the sequence counter
+        self._lock = threading.Lock()
+        self._persist_lock = threading.Lock()
+        self._closed = False
+
+        self.memory = sqlite3.connect(':memory:', check_same_thread=False)
+        for table, columns in HOT_TABLES.items():
+            names = ('url', 'domain') if table == 'usage_data' else ('url',)
+            self.memory.execute(f'''
+                CREATE TABLE {table} (
+                    seq INTEGER PRIMARY KEY, persisted INTEGER NOT NULL DEFAULT 0,
+                    {', '.join(names)}, {', '.join(columns)}
+                )
+            ''')
+            self.memory.execute(f'CREATE INDEX idx_{table}_user_epoch ON {table} (user_id, ts_epoch_ms)')
+            self.memory.execute(f'CREATE INDEX idx_{table}_unpersisted ON {table} (persisted, seq)')
+        # Same hourly totals as the disk rollup, so reports cost the same in memory
+        self.memory.execute('''
+            CREATE TABLE usage_rollup_hourly (
+                user_id TEXT, hour_bucket INTEGER, domain TEXT,
+                total_secs INTEGER, productive_secs INTEGER, distraction_secs INTEGER, count INTEGER,
+                PRIMARY KEY (user_id, hour_bucket, domain)
+            )
+        ''')
+
+        self._seq = self._replay_journal()
+        # Reads at or after complete_from are answered from memory alone
+        self.complete_from = self._load_recent()
+        self._journal = open(self.journal_path, 'a')
+        self._dirty = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='hot-tier', daemon=True)
+        self._thread.start()
+
+    def _replay_journal(self) -> int:
+        """Persist journal entries a crash left behind; returns the last sequence number"""
+        conn = self.pool.acquire()
+        try:
+            row = conn.execute("SELECT value FROM watermarks WHERE name = 'hot_journal_seq'").fetchone()
+            last_seq = row[0] if row and row[0] is not None else 0
+            entries = []
+            if os.path.exists(self.journal_path):
+                with open(self.journal_path) as f:
+                    for line in f:
+                        try:
+                            seq, table, values = json.loads(line)
+                        except ValueError:
+                            continue  # torn final line from the crash
+                        if seq > last_seq:
+                            entries.append((seq, table, tuple(values)))
+            if entries:
+                self._write_entries(conn, entries)
+                self.stats['replayed'] = len(entries)
+                print(f"Replayed {len(entries)} journaled events into {self.journal_path[:-len('.hot-journal')]}")
+                last_seq = max(seq for seq, _, _ in entries)
+            open(self.journal_path, 'w').close()
+            return last_seq
+        finally:
+            self.pool.release(conn)
+
+    def _load_recent(self) -> int:
+        """Copy the last window_ms of persisted rows into memory"""
+        since_ms = int(time.time() * 1000) - self.window_ms
+        conn = self.pool.acquire()
+        try:
+            usage = conn.execute(f'''
+                SELECT u.url, d.domain, {', '.join('ud.' + column for column in USAGE_COLUMNS)}
+                FROM usage_data ud
+                LEFT JOIN urls u ON u.id = ud.url_id
+                LEFT JOIN domains d ON d.id = ud.domain_id
+                WHERE ud.ts_epoch_ms >= ?
+            ''', (since_ms,)).fetchall()
+            tabs = conn.execute(f'''
+                SELECT u.url, {', '.join('ta.' + column for column in TAB_ACTIVITY_COLUMNS)}
+                FROM tab_activity ta LEFT JOIN urls u ON u.id = ta.url_id
+                WHERE ta.ts_epoch_ms >= ?
+            ''', (since_ms,)).fetchall()
+            rollups = conn.execute('''
+                SELECT r.user_id, r.hour_bucket, d.domain, r.total_secs, r.productive_secs, r.distraction_secs,
+                       r.count
+                FROM usage_rollup_hourly r LEFT JOIN domains d ON d.id = r.domain_id
+                WHERE r.hour_bucket >= ?
+            ''', (local_hour_bucket(since_ms),)).fetchall()
+        finally:
+            self.pool.release(conn)
+        self.memory.executemany(
+            f"INSERT INTO usage_data (persisted, url, domain, {', '.join(USAGE_COLUMNS)}) "
+            f"VALUES (1, {', '.join('?' * (len(USAGE_COLUMNS) + 2))})", usage)
+        self.memory.executemany(
+            f"INSERT INTO tab_activity (persisted, url, {', '.join(TAB_ACTIVITY_COLUMNS)}) "
+            f"VALUES (1, {', '.join('?' * (len(TAB_ACTIVITY_COLUMNS) + 1))})", tabs)
+        self.memory.executemany('INSERT INTO usage_rollup_hourly VALUES (?, ?, ?, ?, ?, ?, ?)', rollups)
+        self.memory.commit()
+        return since_ms
+
+    def put(self, table: str, row: tuple, url: str, domain: Optional[str] = None):
+        """Add one usage_data / tab_activity row to memory and the journal"""
+        names = (url, domain) if table == 'usage_data' else (url,)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Hot tier is shut down")
+            self._seq += 1
+            if table == 'usage_data':
+                self._add_to_rollup(row, domain)
+            self.memory.execute(
+                f"INSERT INTO {table} (seq, {'url, domain' if table == 'usage_data' else 'url'}, "
+                f"{', '.join(HOT_TABLES[table])}) VALUES ({', '.join('?' * (len(row) + len(names) + 1))})",
+                (self._seq, *names, *row))
+            self.memory.commit()
+            self._journal.write(json.dumps([self._seq, table, row]) + '\n')
+            self._dirty = True
+            if not self.sync_interval:
+                self._sync_journal()
+            self.stats['buffered'] += 1
+
+    def _add_to_rollup(self, row: tuple, domain: str):
+        """Add one usage_data row to the in-memory hourly totals (caller holds _lock)"""
+        values = dict(zip(USAGE_COLUMNS, row))
+        duration = values['duration']
+        self.memory.execute('''
+            INSERT INTO usage_rollup_hourly VALUES (?, ?, ?, ?, ?, ?, 1)
+            ON CONFLICT (user_id, hour_bucket, domain) DO UPDATE SET
+                total_secs = total_secs + excluded.total_secs,
+                productive_secs = productive_secs + excluded.productive_secs,
+                distraction_secs = distraction_secs + excluded.distraction_secs,
+                count = count + 1
+        ''', (values['user_id'], local_hour_bucket(values['ts_epoch_ms']), domain, duration,
+              duration if values['is_productive'] else 0, duration if values['is_distraction'] else 0))
+
+    def _sync_journal(self):
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._dirty = False
+
+    def _write_entries(self, conn, entries: List[tuple]):
+        """Write journal entries and advance the sequence watermark in one transaction"""
+        rows_by_table: Dict[str, List[tuple]] = {}
+        for _, table, row in entries:
+            rows_by_table.setdefault(table, []).append(row)
+        user_ids = {row[0] for rows in rows_by_table.values() for row in rows}
+        new_users = self.known_users.unknown(user_ids) if self.known_users else user_ids
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            cursor = conn.cursor()
+            write_event_rows(cursor, rows_by_table, new_users, datetime.now().isoformat())
+            cursor.execute('''
+                INSERT OR REPLACE INTO watermarks (name, value, updated_at) VALUES ('hot_journal_seq', ?, ?)
+            ''', (max(seq for seq, _, _ in entries), datetime.now().isoformat()))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if self.known_users:
+            for user_id in new_users:
+                self.known_users.add(user_id)
+        if self.context_cache:
+            for user_id in {row[0] for row in rows_by_table.get('usage_data', [])}:
+                self.context_cache.invalidate(user_id)
+
+    def persist(self) -> int:
+        """Write every row not yet on disk; returns the number of rows written"""
+        with self._persist_lock:
+            with self._lock:
+                entries = [
+                    (row[0], table, row[1:])
+                    for table, columns in HOT_TABLES.items()
+                    for row in self.memory.execute(
+                        f"SELECT seq, {', '.join(columns)} FROM {table} WHERE persisted = 0 ORDER BY seq")
+                ]
+            if not entries:
+                return 0
+            last_seq = max(seq for seq, _, _ in entries)
+            conn = self.pool.acquire()
+            try:
+                self._write_entries(conn, entries)
+            finally:
+                self.pool.release(conn)
+
+            with self._lock:
+                for table in HOT_TABLES:
+                    self.memory.execute(f'UPDATE {table} SET persisted = 1 WHERE persisted = 0 AND seq <= ?',
+                                        (last_seq,))
+                self.memory.commit()
+                self._rewrite_journal()
+                self._evict()
+            self.stats['persisted'] += len(entries)
+            self.stats['flushes'] += 1
+            return len(entries)
+
+    def _rewrite_journal(self):
+        """Shrink the journal to the rows still only in memory (caller holds _lock)"""
+        pending = [
+            json.dumps([row[0], table, list(row[1:])]) + '\n'
+            for table, columns in HOT_TABLES.items()
+            for row in self.memory.execute(
+                f"SELECT seq, {', '.join(columns)} FROM {table} WHERE persisted = 0 ORDER BY seq")
+        ]
+        self._journal.close()
+        with open(self.journal_path + '.tmp', 'w') as f:
+            f.writelines(pending)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.journal_path + '.tmp', self.journal_path)
+        self._journal = open(self.journal_path, 'a')
+        self._dirty = False
+
+    def _evict(self):
+        """Drop persisted rows older than the window (caller holds _lock)"""
+        cutoff = int(time.time() * 1000) - self.window_ms
+        for table in HOT_TABLES:
+            cursor = self.memory.execute(f'DELETE FROM {table} WHERE persisted = 1 AND ts_epoch_ms < ?', (cutoff,))
+            self.stats['evicted'] += cursor.rowcount
+        self.memory.execute('DELETE FROM usage_rollup_hourly WHERE hour_bucket < ?', (local_hour_bucket(cutoff),))
+        self.memory.commit()
+        self.complete_from = max(self.complete_from, cutoff)
+
+    def usage_range(self, user_id: str, start_ms: int, end_ms: int) -> tuple:
+        """(complete_from, rows) with the in-memory part of get_usage_range from complete_from on"""
+        with self._lock:
+            rows = self.memory.execute('''
+                SELECT url, domain, duration, is_distraction, is_productive
+                FROM usage_data WHERE user_id = ? AND ts_epoch_ms >= ? AND ts_epoch_ms < ?
+            ''', (user_id, max(start_ms, self.complete_from), end_ms)).fetchall()
+            return self.complete_from, rows
+
+    def usage_report(self, user_id: str, start_ms: int, end_ms: int) -> Optional[Dict]:
+        """usage_report for whole local hours inside the window, or None if it starts before it"""
+        with self._lock:
+            if start_ms < self.complete_from:
+                return None
+            return usage_report(self.memory.execute('''
+                SELECT domain, hour_bucket % 24, total_secs, productive_secs, distraction_secs, count
+                FROM usage_rollup_hourly WHERE user_id = ? AND hour_bucket >= ? AND hour_bucket < ?
+            ''', (user_id, local_hour_bucket(start_ms), local_hour_bucket(end_ms))).fetchall())
+
+    def _run(self):
+        last_persist = time.monotonic()
+        while not self._stop.wait(self.sync_interval or self.flush_interval):
+            with self._lock:
+                if self._dirty:
+                    self._sync_journal()
+            if time.monotonic() - last_persist >= self.flush_interval:
+                try:
+                    self.persist()
+                except Exception as e:
+                    # Rows stay in memory and in the journal until a later flush succeeds
+                    print(f"Error persisting hot tier: {e}")
+                last_persist = time.monotonic()
+
+    def flush(self):
+        """Write every buffered row to disk now"""
+        self.persist()
+
+    def shutdown(self):
+        """Stop the flush thread and persist everything still in memory"""
+        if self._closed:
+            return
+        self._stop.set()
+        self._thread.join()
+        try:
+            self.persist()
+        finally:
+            with self._lock:
+                self._closed = True
+                self._journal.close()
+
+
+_hot_tiers: Dict[str, HotTier] = {}
+# Separate from _pools_lock: building a tier runs migrations through a DatabaseManager
+_hot_tiers_lock = threading.Lock()
+
+
+def get_hot_tier(db_name: str) -> HotTier:
+    """Get the process-wide hot tier for a database file"""
+    with _hot_tiers_lock:
+        hot = _hot_tiers.get(db_name)
+        if hot is None:
+            # Journal replay and the warm-up read need the current schema
+            DatabaseManager(db_name).initialize_database()
+            hot = HotTier(db_name, get_connection_pool(db_name), context_cache=get_user_context_cache(db_name),
+                          known_users=get_known_users(db_name))
+            _hot_tiers[db_name] = hot
+        return hot
+
+
+def shutdown_hot_tiers():
+    """Persist and stop every hot tier (registered with atexit)"""
+    with _hot_tiers_lock:
+        hot_tiers = list(_hot_tiers.values())
+        _hot_tiers.clear()
+    for hot in hot_tiers:
+        hot.shutdown()
+
+
+atexit.register(shutdown_hot_tiers)
+
+
+class WriterActor:
+    """One thread that owns the only write connection to a database file.
+
+    Mutations are queued as calls and run one at a time on that thread, so
+    request threads never compete for SQLite's write lock. submit() returns a
+    Future; callers that need the result (or the exception) wait on it.
+    """
+
+    _STOP = object()
+
+    def __init__(self, db_name: str, max_size: int = 10000):
+        self.db_name = db_name
+        self._queue = queue.Queue(maxsize=max_size)
+        self._conn = None
+        self._ready = threading.Event()
+        self._closed = False
+        self.stats = {'submitted': 0, 'completed': 0, 'failed': 0}
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        return self._conn
+
+    def owns_current_thread(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """Queue fn(*args, **kwargs) for the writer thread"""
+        if self._closed:
+            raise RuntimeError("Database writer is shut down")
+        future = Future()
+        self._queue.put((future, fn, args, kwargs))
+        self.stats['submitted'] += 1
+        return future
+
+    def _run(self):
+        self._conn = open_connection(self.db_name)
+        self._ready.set()
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                break
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, **kwargs))
+                self.stats['completed'] += 1
+            except BaseException as e:
+                if self._conn.in_transaction:
+                    self._conn.rollback()
+                future.set_exception(e)
+                self.stats['failed'] += 1
+        self._conn.close()
+
+    def shutdown(self):
+        """Run every queued mutation, then stop the writer"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(self._STOP)
+        self._thread.join()
+
+
+_writer_actors: Dict[str, WriterActor] = {}
+
+
+def get_writer_actor(db_name: str) -> WriterActor:
+    """Get the process-wide writer thread for a database file"""
+    with _pools_lock:
+        actor = _writer_actors.get(db_name)
+        if actor is None:
+            actor = WriterActor(db_name)
+            _writer_actors[db_name] = actor
+        return actor
+
+
+def shutdown_writer_actors():
+    """Drain and stop every writer thread (registered with atexit)"""
+    with _pools_lock:
+        actors = list(_writer_actors.values())
+        _writer_actors.clear()
+    for actor in actors:
+        actor.shutdown()
+
+
+atexit.register(shutdown_writer_actors)
+
+
+def mutation(method):
+    """Mark a DatabaseManager method as a write.
+
+    In actor mode the call is run on the writer thread and the caller blocks
+    on the result; otherwise (or when already on the writer) it runs inline.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.writer is None or self.writer.owns_current_thread():
+            return method(self, *args, **kwargs)
+        return self.writer.submit(method, self, *args, **kwargs).result()
+    return wrapper
+
+
 class DatabaseManager:
     """Database manager for productivity data using SQLite"""
 
-    def __init__(self, db_name='productivity.db'):
+    def __init__(self, db_name='productivity.db', write_behind=False, archive_dir=None, actor=False,
+                 hot_tier=False):
         self.db_name = db_name
-        self.lock = threading.Lock()
+        # Compressed monthly partitions; attached (decompressed) copies go in attached/
+        self.archive_dir = archive_dir or os.path.join(os.path.dirname(os.path.abspath(db_name)), 'archive')
+        # Per-user write locks shared by every manager (and thread) in the process
+        self.locks = get_striped_lock(db_name)
+        # Actor mode: one writer thread owns all writes, everything else reads query_only
+        self.writer = get_writer_actor(db_name) if actor else None
+        self.pool = get_read_pool(db_name) if actor else get_connection_pool(db_name)
+        self.context_cache = get_user_context_cache(db_name)
+        self.known_users = get_known_users(db_name)
+        self.domains = get_interner(db_name, 'domains')
+        self.urls = get_interner(db_name, 'urls')
+        # Optional group-commit mode for the high-frequency ingest endpoints
+        self.write_queue = get_write_behind_queue(db_name) if write_behind and not actor else None
+        # Optional in-memory tier for the last day of usage and tab events
+        self.hot = get_hot_tier(db_name) if hot_tier and not actor else None
         
     def _get_connection(self):
-        """Get a new database connection for thread safety"""
-        return sqlite3.connect(self.db_name, check_same_thread=False)
+        """Borrow a pooled connection; hand it back with _release_connection.
+
+        In actor mode the writer thread gets its own write connection and
+        every other thread a read-only one.
+        """
+        if self.writer and self.writer.owns_current_thread():
+            return self.writer.connection
+        return self.pool.acquire()
+
+    def _begin_write(self, conn):
+        """Start a write transaction holding SQLite's write lock (waits up to BUSY_TIMEOUT_MS)"""
+        start = time.perf_counter()
+        conn.execute('BEGIN IMMEDIATE')
+        self.locks.record_busy_wait(time.perf_counter() - start)
+
+    def _release_connection(self, conn):
+        """Return a borrowed connection to the pool"""
+        if self.writer and conn is self.writer.connection:
+            if conn.in_transaction:
+                conn.rollback()
+            return
+        self.pool.release(conn)
 
+    @mutation
     def initialize_database(self):
         """Initialize all necessary database tables"""
-        with self.lock:
+        with self.locks.hold_all():
             conn = self._get_connection()
             cursor = conn.cursor()
             
@@ -126,6 +1875,8 @@ class DatabaseManager:
                 ''')
 
                 conn.commit()
+                self._apply_migrations(conn)
+                self.known_users.warm()
                 print("Database tables initialized successfully")
                 
             except Exception as e:
@@ -133,149 +1884,237 @@ class DatabaseManager:
                 conn.rollback()
                 raise
             finally:
-                conn.close()
+                self._release_connection(conn)
+
+    def _apply_migrations(self, conn):
+        """Run pending MIGRATIONS in version order and record them in schema_version"""
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TEXT
+            )
+        ''')
+        conn.commit()
+
+        cursor.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version')
+        current_version = cursor.fetchone()[0]
+
+        for version, description, steps in sorted(MIGRATIONS, key=lambda m: m[0]):
+            if version <= current_version:
+                continue
+            try:
+                # Explicit BEGIN so DDL steps are part of the migration transaction
+                cursor.execute('BEGIN')
+                for step in steps:
+                    if callable(step):
+                        step(cursor)
+                    else:
+                        cursor.execute(step)
+                cursor.execute('INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)',
+                               (version, description, datetime.now().isoformat()))
+                conn.commit()
+                print(f"Applied migration {version}: {description}")
+            except Exception as e:
+                print(f"Error applying migration {version}: {e}")
+                conn.rollback()
+                raise
+
+    def get_schema_version(self) -> int:
+        """Get the latest applied migration version"""
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version')
+            return cursor.fetchone()[0]
+        finally:
+            self._release_connection(conn)
 
     def _ensure_user_exists(self, user_id: str, conn=None):
-        """Helper to ensure user exists in users table"""
+        """Helper to ensure user exists in users table.
+
+        Known users cost nothing. For a new user this adds an INSERT OR IGNORE
+        to the caller's transaction; the caller registers the user with
+        known_users.add() once that transaction commits.
+        """
+        if user_id in self.known_users:
+            return
+
         should_close = False
         if conn is None:
             conn = self._get_connection()
             should_close = True
             
         try:
-            cursor = conn.cursor()
-            cursor.execute('SELECT user_id FROM users WHERE user_id = ?', (user_id,))
-            if not cursor.fetchone():
-                cursor.execute('INSERT INTO users (user_id, created_at) VALUES (?, ?)',
-                              (user_id, datetime.now().isoformat()))
+            conn.execute('INSERT OR IGNORE INTO users (user_id, created_at) VALUES (?, ?)',
+                         (user_id, datetime.now().isoformat()))
+            if should_close:
                 conn.commit()
+                self.known_users.add(user_id)
         except Exception as e:
             print(f"Error ensuring user exists: {e}")
             conn.rollback()
             raise
         finally:
-            if should_close:
-                conn.close()
+            if should_close:
+                self._release_connection(conn)
+
+    @mutation
+    def store_distraction_urls(self, user_id: str, urls: List[str]):
+        """Store distraction URLs for a user"""
+        self._store_url_list('distraction_urls', user_id, urls, 'distraction')
+
+    @mutation
+    def store_productive_urls(self, user_id: str, urls: List[str]):
+        """Store productive URLs for a user"""
+        self._store_url_list('productive_urls', user_id, urls, 'productive')
+
+    def _store_url_list(self, table: str, user_id: str, urls: List[str], label: str):
+        """Replace a user's URL list by applying only the added and removed URLs.
+
+        Re-posting an unchanged list matches the content hash stored in
+        url_list_hashes and skips the write transaction entirely. The stored
+        hash is always read, so a list changed by another process is never
+        mistaken for unchanged.
+        """
+        valid_urls = {url for url in urls if url and isinstance(url, str)}  # Validate URLs
+        content_hash = hashlib.sha256('\n'.join(sorted(valid_urls)).encode('utf-8')).hexdigest()
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT content_hash FROM url_list_hashes WHERE user_id = ? AND list_name = ?',
+                           (user_id, table))
+            stored = cursor.fetchone()
+        finally:
+            self._release_connection(conn)
+        if stored and stored[0] == content_hash:
+            print(f"{label.capitalize()} URLs unchanged for user {user_id}")
+            return
 
-    def store_distraction_urls(self, user_id: str, urls: List[str]):
-        """Store distraction URLs for a user"""
-        with self.lock:
+        url_ids = set(self.urls.ids(valid_urls).values())
+        with self.locks.hold(user_id):
             conn = self._get_connection()
             try:
-                self._ensure_user_exists(user_id, conn)
                 cursor = conn.cursor()
-                
-                # Delete existing for user to update
-                cursor.execute('DELETE FROM distraction_urls WHERE user_id = ?', (user_id,))
-                
-                # Insert new URLs
-                for url in urls:
-                    if url and isinstance(url, str):  # Validate URL
-                        cursor.execute('INSERT INTO distraction_urls (user_id, url) VALUES (?, ?)', (user_id, url))
+                self._begin_write(conn)
+                self._ensure_user_exists(user_id, conn)
+                cursor.execute(f'SELECT url_id FROM {table} WHERE user_id = ?', (user_id,))
+                existing = {row[0] for row in cursor.fetchall()}
+                added = url_ids - existing
+                removed = existing - url_ids
+
+                cursor.executemany(f'DELETE FROM {table} WHERE user_id = ? AND url_id = ?',
+                                   [(user_id, url_id) for url_id in removed])
+                cursor.executemany(f'INSERT OR IGNORE INTO {table} (user_id, url_id) VALUES (?, ?)',
+                                   [(user_id, url_id) for url_id in added])
+                cursor.execute('''
+                    INSERT OR REPLACE INTO url_list_hashes (user_id, list_name, content_hash)
+                    VALUES (?, ?, ?)
+                ''', (user_id, table, content_hash))
                 
                 conn.commit()
-                print(f"Stored {len(urls)} distraction URLs for user {user_id}")
+                self.known_users.add(user_id)
+                print(f"Stored {len(valid_urls)} {label} URLs for user {user_id} "
+                      f"(+{len(added)}/-{len(removed)})")
                 
             except Exception as e:
-                print(f"Error storing distraction URLs: {e}")
+                print(f"Error storing {label} URLs: {e}")
                 conn.rollback()
                 raise
             finally:
-                conn.close()
+                self._release_connection(conn)
 
-    def store_productive_urls(self, user_id: str, urls: List[str]):
-        """Store productive URLs for a user"""
-        with self.lock:
+    @mutation
+    def store_usage_data(self, usage_entry: Dict):
+        """Store usage data entry"""
+        row = usage_row(usage_entry,
+                        self.urls.id(usage_entry.get('url') or ''),
+                        self.domains.id(usage_entry.get('domain') or ''))
+        if self.hot:
+            self.hot.put('usage_data', row, usage_entry.get('url') or '', usage_entry.get('domain') or '')
+            return
+        if self.write_queue:
+            self.write_queue.put('usage_data', row)
+            return
+
+        with self.locks.hold(usage_entry['user_id']):
             conn = self._get_connection()
             try:
-                self._ensure_user_exists(user_id, conn)
+                self._begin_write(conn)
+                self._ensure_user_exists(usage_entry['user_id'], conn)
                 cursor = conn.cursor()
-                
-                # Delete existing for user to update
-                cursor.execute('DELETE FROM productive_urls WHERE user_id = ?', (user_id,))
-                
-                # Insert new URLs
-                for url in urls:
-                    if url and isinstance(url, str):  # Validate URL
-                        cursor.execute('INSERT INTO productive_urls (user_id, url) VALUES (?, ?)', (user_id, url))
+                cursor.execute(USAGE_INSERT_SQL, row)
+                apply_usage_rollup(cursor, [row])
                 
                 conn.commit()
-                print(f"Stored {len(urls)} productive URLs for user {user_id}")
+                self.known_users.add(usage_entry['user_id'])
+                self.context_cache.invalidate(usage_entry['user_id'])
+                print(f"Stored usage data for user {usage_entry['user_id']}")
                 
             except Exception as e:
-                print(f"Error storing productive URLs: {e}")
+                print(f"Error storing usage data: {e}")
                 conn.rollback()
                 raise
             finally:
-                conn.close()
+                self._release_connection(conn)
 
-    def store_usage_data(self, usage_entry: Dict):
-        """Store usage data entry"""
-        with self.lock:
+    @mutation
+    def store_usage_batch(self, user_id: str, usage_entries: List[Dict]):
+        """Store one user's usage entries in a single transaction"""
+        if not usage_entries:
+            return
+        url_ids = self.urls.ids({entry.get('url') or '' for entry in usage_entries})
+        domain_ids = self.domains.ids({entry.get('domain') or '' for entry in usage_entries})
+        rows = [usage_row(entry, url_ids[entry.get('url') or ''], domain_ids[entry.get('domain') or ''])
+                for entry in usage_entries]
+        if self.hot:
+            for entry, row in zip(usage_entries, rows):
+                self.hot.put('usage_data', row, entry.get('url') or '', entry.get('domain') or '')
+            return
+        if self.write_queue:
+            for row in rows:
+                self.write_queue.put('usage_data', row)
+            return
+
+        with self.locks.hold(user_id):
             conn = self._get_connection()
             try:
-                self._ensure_user_exists(usage_entry['user_id'], conn)
-                cursor = conn.cursor()
-                
-                # Serialize interactions to JSON
-                interactions_json = json.dumps(usage_entry.get('interactions', {}))
-                
-                # Ensure timestamp is a string
-                timestamp = usage_entry.get('timestamp')
-                if not isinstance(timestamp, str):
-                    timestamp = datetime.now().isoformat()
-                
-                cursor.execute('''
-                    INSERT INTO usage_data 
-                    (user_id, url, domain, duration, interactions_json, timestamp, is_distraction, is_productive)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    usage_entry['user_id'], 
-                    usage_entry.get('url', ''), 
-                    usage_entry.get('domain', ''), 
-                    int(usage_entry.get('duration', 0)),
-                    interactions_json, 
-                    timestamp, 
-                    bool(usage_entry.get('is_distraction', False)), 
-                    bool(usage_entry.get('is_productive', False))
-                ))
-                
+                self._begin_write(conn)
+                new_users = self.known_users.unknown({user_id})
+                write_event_rows(conn.cursor(), {'usage_data': rows}, new_users, datetime.now().isoformat())
                 conn.commit()
-                print(f"Stored usage data for user {usage_entry['user_id']}")
-                
+                self.known_users.add(user_id)
+                self.context_cache.invalidate(user_id)
+                print(f"Stored {len(rows)} usage entries for user {user_id}")
             except Exception as e:
-                print(f"Error storing usage data: {e}")
+                print(f"Error storing usage batch: {e}")
                 conn.rollback()
                 raise
             finally:
-                conn.close()
+                self._release_connection(conn)
 
+    @mutation
     def store_tab_activity(self, tab_data: Dict):
         """Store tab activity data"""
-        with self.lock:
+        row = tab_activity_row(tab_data, self.urls.id(tab_data.get('url') or ''))
+        if self.hot:
+            self.hot.put('tab_activity', row, tab_data.get('url') or '')
+            return
+        if self.write_queue:
+            self.write_queue.put('tab_activity', row)
+            return
+
+        with self.locks.hold(tab_data['user_id']):
             conn = self._get_connection()
             try:
+                self._begin_write(conn)
                 self._ensure_user_exists(tab_data['user_id'], conn)
                 cursor = conn.cursor()
-                
-                # Ensure timestamp is a string
-                timestamp = tab_data.get('timestamp')
-                if not isinstance(timestamp, str):
-                    timestamp = datetime.now().isoformat()
-                
-                cursor.execute('''
-                    INSERT INTO tab_activity 
-                    (user_id, url, title, timestamp, time_of_day)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (
-                    tab_data['user_id'], 
-                    tab_data.get('url', ''), 
-                    tab_data.get('title', ''), 
-                    timestamp, 
-                    int(tab_data.get('time_of_day', datetime.now().hour))
-                ))
+                cursor.execute(TAB_ACTIVITY_INSERT_SQL, row)
                 
                 conn.commit()
+                self.known_users.add(tab_data['user_id'])
                 print(f"Stored tab activity for user {tab_data['user_id']}")
                 
             except Exception as e:
@@ -283,33 +2122,27 @@ class DatabaseManager:
                 conn.rollback()
                 raise
             finally:
-                conn.close()
+                self._release_connection(conn)
 
+    @mutation
     def store_intervention_response(self, interaction: Dict):
         """Store intervention response"""
-        with self.lock:
+        row = intervention_row(interaction)
+        if self.write_queue:
+            self.write_queue.put('intervention_responses', row)
+            return
+
+        with self.locks.hold(interaction['user_id']):
             conn = self._get_connection()
             try:
+                self._begin_write(conn)
                 self._ensure_user_exists(interaction['user_id'], conn)
                 cursor = conn.cursor()
-                
-                # Ensure timestamp is a string
-                timestamp = interaction.get('timestamp')
-                if not isinstance(timestamp, str):
-                    timestamp = datetime.now().isoformat()
-                
-                cursor.execute('''
-                    INSERT INTO intervention_responses 
-                    (user_id, domain, answer, timestamp)
-                    VALUES (?, ?, ?, ?)
-                ''', (
-                    interaction['user_id'], 
-                    interaction.get('domain', ''), 
-                    interaction.get('answer', ''), 
-                    timestamp
-                ))
+                cursor.execute(INTERVENTION_INSERT_SQL, row)
                 
                 conn.commit()
+                self.known_users.add(interaction['user_id'])
+                self.context_cache.invalidate(interaction['user_id'])
                 print(f"Stored intervention response for user {interaction['user_id']}")
                 
             except Exception as e:
@@ -317,20 +2150,23 @@ class DatabaseManager:
                 conn.rollback()
                 raise
             finally:
-                conn.close()
+                self._release_connection(conn)
 
     def get_user_context(self, user_id: str) -> UserContext:
         """Get or compute user context (simplified computation for demo)"""
+        context, generation = self.context_cache.get(user_id)
+        if context is not None:
+            return context
+
         conn = self._get_connection()
         try:
-            self._ensure_user_exists(user_id, conn)
             cursor = conn.cursor()
             
             # Compute typical productive hours (e.g., hours with more productive usage)
             cursor.execute('''
-                SELECT strftime('%H', timestamp) as hour, SUM(duration) as total
-                FROM usage_data 
-                WHERE user_id = ? AND is_productive = 1
+                SELECT hour_bucket % 24 as hour, SUM(productive_secs) as total
+                FROM usage_rollup_hourly
+                WHERE user_id = ? AND productive_count > 0
                 GROUP BY hour
                 ORDER BY total DESC
                 LIMIT 5
@@ -340,23 +2176,26 @@ class DatabaseManager:
             
             # Distraction patterns (domain -> avg duration)
             cursor.execute('''
-                SELECT domain, AVG(duration) as avg_duration
-                FROM usage_data 
-                WHERE user_id = ? AND is_distraction = 1
-                GROUP BY domain
+                SELECT d.domain, t.avg_duration
+                FROM (
+                    SELECT domain_id, CAST(SUM(distraction_secs) AS REAL) / SUM(distraction_count) as avg_duration
+                    FROM usage_rollup_hourly
+                    WHERE user_id = ? AND distraction_count > 0
+                    GROUP BY domain_id
+                ) t JOIN domains d ON d.id = t.domain_id
             ''', (user_id,))
             result = cursor.fetchall()
             distraction_patterns = {row[0]: float(row[1]) for row in result if row[0] and row[1] is not None}
             
             # Response history
-            cursor.execute('SELECT domain, answer, timestamp FROM intervention_responses WHERE user_id = ? ORDER BY timestamp DESC LIMIT 10', (user_id,))
+            cursor.execute('SELECT domain, answer, timestamp FROM intervention_responses WHERE user_id = ? ORDER BY ts_epoch_ms DESC LIMIT 10', (user_id,))
             result = cursor.fetchall()
             response_history = [{'domain': r[0] or '', 'answer': r[1] or '', 'timestamp': r[2] or ''} for r in result]
             
             # Productivity score (simple: avg of (productive_duration - distraction_duration))
             cursor.execute('''
-                SELECT AVG(CASE WHEN is_productive = 1 THEN duration WHEN is_distraction = 1 THEN -duration ELSE 0 END) as score
-                FROM usage_data WHERE user_id = ?
+                SELECT CAST(SUM(productive_secs) - SUM(distraction_secs) AS REAL) / SUM(count) as score
+                FROM usage_rollup_hourly WHERE user_id = ?
             ''', (user_id,))
             result = cursor.fetchone()
             productivity_score = float(result[0]) if result and result[0] is not None else 0.0
@@ -370,13 +2209,15 @@ class DatabaseManager:
                 else:
                     stress_indicators.append('low')
             
-            return UserContext(
+            context = UserContext(
                 typical_productive_hours=productive_hours if productive_hours else [9, 10, 11, 12, 13],  # Default
                 distraction_patterns=distraction_patterns,
                 response_history=response_history,
                 productivity_score=productivity_score,
                 stress_indicators=stress_indicators
             )
+            self.context_cache.put(user_id, context, generation)
+            return context
             
         except Exception as e:
             print(f"Error getting user context: {e}")
@@ -388,168 +2229,1236 @@ class DatabaseManager:
                 productivity_score=0.0,
                 stress_indicators=[]
             )
+        finally:
+            self._release_connection(conn)
+
+    def get_user_analytics_data(self, user_id: str) -> Dict:
+        """Get analytics data for insights"""
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            
+            # Total time
+            cursor.execute('SELECT SUM(total_secs) FROM usage_rollup_hourly WHERE user_id = ?', (user_id,))
+            result = cursor.fetchone()
+            total_time = int(result[0]) if result and result[0] is not None else 0
+            
+            # Top distractions
+            cursor.execute('''
+                SELECT d.domain, t.total
+                FROM (
+                    SELECT domain_id, SUM(distraction_secs) as total
+                    FROM usage_rollup_hourly WHERE user_id = ? AND distraction_count > 0
+                    GROUP BY domain_id ORDER BY total DESC LIMIT 3
+                ) t JOIN domains d ON d.id = t.domain_id
+                ORDER BY t.total DESC
+            ''', (user_id,))
+            result = cursor.fetchall()
+            top_distractions = [row[0] for row in result if row[0]]
+            
+            return {
+                'total_time': total_time,
+                'top_distractions': top_distractions
+            }
+            
+        except Exception as e:
+            print(f"Error getting user analytics data: {e}")
+            return {'total_time': 0, 'top_distractions': []}
+        finally:
+            self._release_connection(conn)
+
+    def get_user_performance(self, user_id: str) -> Dict:
+        """Get performance data for limit adjustments"""
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            
+            # Distraction usage
+            cursor.execute('''
+                SELECT d.domain, t.total
+                FROM (
+                    SELECT domain_id, SUM(distraction_secs) as total
+                    FROM usage_rollup_hourly WHERE user_id = ? AND distraction_count > 0
+                    GROUP BY domain_id
+                ) t JOIN domains d ON d.id = t.domain_id
+            ''', (user_id,))
+            result = cursor.fetchall()
+            distraction_usage = {row[0]: int(row[1]) for row in result if row[0] and row[1] is not None}
+            
+            # Productive usage
+            cursor.execute('''
+                SELECT d.domain, t.total
+                FROM (
+                    SELECT domain_id, SUM(productive_secs) as total
+                    FROM usage_rollup_hourly WHERE user_id = ? AND productive_count > 0
+                    GROUP BY domain_id
+                ) t JOIN domains d ON d.id = t.domain_id
+            ''', (user_id,))
+            result = cursor.fetchall()
+            productive_usage = {row[0]: int(row[1]) for row in result if row[0] and row[1] is not None}
+            
+            return {
+                'distraction_usage': distraction_usage,
+                'productive_usage': productive_usage
+            }
+            
+        except Exception as e:
+            print(f"Error getting user performance: {e}")
+            return {'distraction_usage': {}, 'productive_usage': {}}
+        finally:
+            self._release_connection(conn)
+
+    def get_engagement_patterns(self, user_id: str) -> Dict:
+        """Get average engagement score per domain and local hour of day.
+
+        Scores need per-session counters, so only raw rows that have not been
+        compacted into hourly aggregates are counted.
+        """
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT d.domain, t.hour, t.engagement, t.sessions
+                FROM (
+                    SELECT domain_id, ({LOCAL_HOUR_BUCKET_SQL}) % 24 as hour,
+                           AVG({ENGAGEMENT_SCORE_SQL}) as engagement, COUNT(*) as sessions
+                    FROM usage_data
+                    WHERE user_id = ? AND ts_epoch_ms IS NOT NULL
+                    GROUP BY domain_id, hour
+                ) t JOIN domains d ON d.id = t.domain_id
+            ''', (user_id,))
+            
+            engagement_patterns = {}
+            for domain, hour, engagement, sessions in cursor.fetchall():
+                engagement_patterns.setdefault(domain or '', {})[int(hour)] = {
+                    'engagement': float(engagement),
+                    'sessions': int(sessions)
+                }
+            return engagement_patterns
+            
+        except Exception as e:
+            print(f"Error getting engagement patterns: {e}")
+            return {}
+        finally:
+            self._release_connection(conn)
+
+    @mutation
+    def update_distraction_limits(self, user_id: str, adjustments: Dict):
+        """Update distraction limits"""
+        with self.locks.hold(user_id):
+            conn = self._get_connection()
+            try:
+                self._begin_write(conn)
+                self._ensure_user_exists(user_id, conn)
+                cursor = conn.cursor()
+                
+                for domain, adj in adjustments.items():
+                    new_limit = int(adj.get('new_limit', 0))
+                    cursor.execute('''
+                        INSERT OR REPLACE INTO distraction_limits (user_id, domain, limit_minutes)
+                        VALUES (?, ?, ?)
+                    ''', (user_id, domain, new_limit))
+                
+                conn.commit()
+                self.known_users.add(user_id)
+                print(f"Updated distraction limits for user {user_id}")
+                
+            except Exception as e:
+                print(f"Error updating distraction limits: {e}")
+                conn.rollback()
+                raise
+            finally:
+                self._release_connection(conn)
+
+    @mutation
+    def update_productive_targets(self, user_id: str, adjustments: Dict):
+        """Update productive targets"""
+        with self.locks.hold(user_id):
+            conn = self._get_connection()
+            try:
+                self._begin_write(conn)
+                self._ensure_user_exists(user_id, conn)
+                cursor = conn.cursor()
+                
+                for domain, adj in adjustments.items():
+                    new_target = int(adj.get('new_target', 0))
+                    cursor.execute('''
+                        INSERT OR REPLACE INTO productive_targets (user_id, domain, target_minutes)
+                        VALUES (?, ?, ?)
+                    ''', (user_id, domain, new_target))
+                
+                conn.commit()
+                self.known_users.add(user_id)
+                print(f"Updated productive targets for user {user_id}")
+                
+            except Exception as e:
+                print(f"Error updating productive targets: {e}")
+                conn.rollback()
+                raise
+            finally:
+                self._release_connection(conn)
+
+    def get_daily_data(self, user_id: str, date: str) -> Dict:
+        """Get daily data for summary (raw sessions, or hourly aggregates once compacted)"""
+        try:
+            start_ms, end_ms = day_range_ms(date)
+            conn = self._get_connection()
+            try:
+                compacted_before = self._get_watermark(conn.cursor(), 'compacted_before_ms')
+            finally:
+                self._release_connection(conn)
+            split_ms = min(max(start_ms, compacted_before), end_ms)
+
+            usage_entries = self._get_hourly_usage_entries(user_id, start_ms, split_ms)
+            result = self.get_usage_range(user_id, split_ms, end_ms) if split_ms < end_ms else []
+            for row in result:
+                usage_entries.append({
+                    'url': row[0] or '',
+                    'domain': row[1] or '',
+                    'duration': int(row[2]) if row[2] is not None else 0,
+                    'is_distraction': bool(row[3]),
+                    'is_productive': bool(row[4])
+                })
+            
+            return {'usage_entries': usage_entries}
+            
+        except Exception as e:
+            print(f"Error getting daily data: {e}")
+            return {'usage_entries': []}
+
+    def get_daily_report(self, user_id: str, date: str) -> Dict:
+        """Daily totals, per-domain and per-hour breakdowns.
+
+        Finished days are a primary-key lookup in daily_summaries once the
+        nightly job has stored them. Today, and days without a stored row,
+        take one grouped rollup query: usage_rollup_hourly already holds every
+        event of the day, raw, compacted or archived, so the cost depends on
+        the domains and hours used, not on the number of sessions.
+        """
+        if self.hot and date >= datetime.now().strftime('%Y-%m-%d'):
+            report = self.hot.usage_report(user_id, *day_range_ms(date))
+            if report is not None:
+                return report
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            if date < datetime.now().strftime('%Y-%m-%d'):
+                cursor.execute('SELECT payload FROM daily_summaries WHERE user_id = ? AND date = ?', (user_id, date))
+                row = cursor.fetchone()
+                if row:
+                    return load_daily_summary(row[0])
+            return daily_report(cursor, user_id, date)
+        finally:
+            self._release_connection(conn)
+
+    @mutation
+    def precompute_daily_summaries(self, date: Optional[str] = None) -> int:
+        """Store the daily summary of every user active on a finished day (default: yesterday)"""
+        date = date or (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+        if date >= datetime.now().strftime('%Y-%m-%d'):
+            raise ValueError(f"{date} is not a finished day")
+        self.flush()
+        start_ms, end_ms = day_range_ms(date)
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            self._begin_write(conn)
+            cursor.execute('SELECT DISTINCT user_id FROM usage_rollup_hourly WHERE hour_bucket >= ? AND hour_bucket < ?',
+                           (local_hour_bucket(start_ms), local_hour_bucket(end_ms)))
+            users = [row[0] for row in cursor.fetchall()]
+            for user_id in users:
+                store_daily_summary(cursor, user_id, date)
+            conn.commit()
+            print(f"Stored daily summaries for {date} ({len(users)} users)")
+            return len(users)
+        except Exception as e:
+            print(f"Error precomputing daily summaries for {date}: {e}")
+            conn.rollback()
+            raise
+        finally:
+            self._release_connection(conn)
+
+    def search_history(self, user_id: str, query: str, start_ms: Optional[int] = None,
+                       end_ms: Optional[int] = None, before_id: Optional[int] = None, limit: int = 50) -> Dict:
+        """Full-text search of a user's tab titles and URLs.
+
+        Pages walk back from the newest matching row id, and each page is
+        ranked by bm25 with titles weighted over URLs. Pass the returned
+        next_before_id to get the next page. Only live rows are indexed;
+        archived months and compacted hours are not searchable.
+        """
+        match = history_match(user_id, query)
+        if match is None:
+            return {'results': [], 'next_before_id': None}
+        self._persist_hot_rows()
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, timestamp, ts_epoch_ms, title, url, score FROM (
+                    SELECT s.rowid as id, ta.timestamp, ta.ts_epoch_ms, s.title, s.url,
+                           bm25(tab_search, 0.0, 2.0, 1.0) as score
+                    FROM tab_search s JOIN tab_activity ta ON ta.id = s.rowid
+                    WHERE tab_search MATCH ? AND s.rowid < ? AND ta.ts_epoch_ms >= ? AND ta.ts_epoch_ms < ?
+                    ORDER BY s.rowid DESC
+                    LIMIT ?
+                ) ORDER BY score, id DESC
+            ''', (match, before_id if before_id is not None else 2 ** 63 - 1,
+                  start_ms if start_ms is not None else 0, end_ms if end_ms is not None else EXPORT_END_MS, limit))
+            results = [{'id': row[0], 'timestamp': row[1], 'ts_epoch_ms': row[2], 'title': row[3] or '',
+                        'url': row[4] or '', 'score': row[5]} for row in cursor.fetchall()]
+            next_before_id = min(result['id'] for result in results) if len(results) == limit else None
+            return {'results': results, 'next_before_id': next_before_id}
+        finally:
+            self._release_connection(conn)
+
+    def _get_hourly_usage_entries(self, user_id: str, start_ms: int, end_ms: int) -> List[Dict]:
+        """Usage entries rebuilt from usage_rollup_hourly for a compacted range.
+
+        Each domain yields one entry per productive / distraction / other
+        total; URLs are not kept at hourly resolution.
+        """
+        if start_ms >= end_ms:
+            return []
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT d.domain, t.total, t.productive, t.distraction
+                FROM (
+                    SELECT domain_id, SUM(total_secs) as total, SUM(productive_secs) as productive,
+                           SUM(distraction_secs) as distraction
+                    FROM usage_rollup_hourly
+                    WHERE user_id = ? AND hour_bucket >= ? AND hour_bucket < ?
+                    GROUP BY domain_id
+                ) t LEFT JOIN domains d ON d.id = t.domain_id
+            ''', (user_id, local_hour_bucket(start_ms), local_hour_bucket(end_ms)))
+
+            entries = []
+            for domain, total, productive, distraction in cursor.fetchall():
+                other = max(total - productive - distraction, 0)
+                for duration, is_productive, is_distraction in ((productive, True, False),
+                                                                 (distraction, False, True),
+                                                                 (other, False, False)):
+                    if duration:
+                        entries.append({
+                            'url': '',
+                            'domain': domain or '',
+                            'duration': int(duration),
+                            'is_distraction': is_distraction,
+                            'is_productive': is_productive
+                        })
+            return entries
+        finally:
+            self._release_connection(conn)
+
+    def _range_connections(self, start_ms: int, end_ms: int):
+        """Yield (connection, schemas) pairs that together cover raw rows in [start_ms, end_ms).
+
+        Partition pruning: only archived months overlapping the range are
+        attached, on dedicated connections. SQLite attaches at most 10
+        databases per connection, so archives are attached ARCHIVES_PER_CONNECTION
+        at a time and callers combine the results of every pair; 'main' is
+        in the first pair only. Ranges that are entirely live use one pooled
+        connection and just the main schema.
+        """
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT month FROM partitions WHERE start_ms < ? AND end_ms > ? ORDER BY start_ms
+            ''', (end_ms, start_ms))
+            months = [row[0] for row in cursor.fetchall()]
+        finally:
+            self._release_connection(conn)
+
+        if not months:
+            conn = self._get_connection()
+            try:
+                yield conn, ['main']
+            finally:
+                self._release_connection(conn)
+            return
+
+        for offset in range(0, len(months), ARCHIVES_PER_CONNECTION):
+            conn = open_connection(self.db_name, read_only=self.writer is not None)
+            try:
+                schemas = ['main'] if offset == 0 else []
+                for month in months[offset:offset + ARCHIVES_PER_CONNECTION]:
+                    schema = 'm_' + month.replace('-', '_')
+                    conn.execute('ATTACH DATABASE ? AS ' + schema, (self.attach_archive(month),))
+                    schemas.append(schema)
+                yield conn, schemas
+            finally:
+                conn.close()
+
+    def get_usage_range(self, user_id: str, start_ms: int, end_ms: int) -> List[tuple]:
+        """Get (url, domain, duration, is_distraction, is_productive) rows across every tier.
+
+        With the hot tier on, the part of the range inside its window comes
+        from memory and only the older part is read from disk.
+        """
+        if self.hot:
+            complete_from, rows = self.hot.usage_range(user_id, start_ms, end_ms)
+            if start_ms < complete_from:
+                rows = self._get_disk_usage_range(user_id, start_ms, min(end_ms, complete_from)) + rows
+            return rows
+        return self._get_disk_usage_range(user_id, start_ms, end_ms)
+
+    def _get_disk_usage_range(self, user_id: str, start_ms: int, end_ms: int) -> List[tuple]:
+        """get_usage_range over the database file and archived months"""
+        rows = []
+        for conn, schemas in self._range_connections(start_ms, end_ms):
+            parts = [
+                f'''
+                SELECT url_id, domain_id, duration, is_distraction, is_productive
+                FROM {schema}.usage_data
+                WHERE user_id = ? AND ts_epoch_ms >= ? AND ts_epoch_ms < ?
+                '''
+                for schema in schemas
+            ]
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT u.url, d.domain, ud.duration, ud.is_distraction, ud.is_productive
+                FROM ({' UNION ALL '.join(parts)}) ud
+                LEFT JOIN main.urls u ON u.id = ud.url_id
+                LEFT JOIN main.domains d ON d.id = ud.domain_id
+            ''', (user_id, start_ms, end_ms) * len(schemas))
+            rows.extend(cursor.fetchall())
+        return rows
+
+    def compacted_before_ms(self) -> int:
+        """Raw usage rows before this time have been compacted into usage_rollup_hourly"""
+        conn = self._get_connection()
+        try:
+            return self._get_watermark(conn.cursor(), 'compacted_before_ms')
+        finally:
+            self._release_connection(conn)
+
+    def _get_hourly_usage_report(self, user_id: str, start_ms: int, end_ms: int) -> Dict:
+        """usage_report over usage_rollup_hourly for a compacted range"""
+        if start_ms >= end_ms:
+            return usage_report([])
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT d.domain, t.hour, t.total, t.productive, t.distraction, t.sessions
+                FROM (
+                    SELECT domain_id, hour_bucket % 24 as hour, SUM(total_secs) as total,
+                           SUM(productive_secs) as productive, SUM(distraction_secs) as distraction,
+                           SUM(count) as sessions
+                    FROM usage_rollup_hourly
+                    WHERE user_id = ? AND hour_bucket >= ? AND hour_bucket < ?
+                    GROUP BY domain_id, hour
+                ) t LEFT JOIN domains d ON d.id = t.domain_id
+            ''', (user_id, local_hour_bucket(start_ms), local_hour_bucket(end_ms)))
+            return usage_report(cursor.fetchall())
+        finally:
+            self._release_connection(conn)
+
+    def get_usage_report(self, user_id: str, start_ms: int, end_ms: int, after_id: int = 0) -> Dict:
+        """Aggregate usage in [start_ms, end_ms) by domain and local hour of day.
+
+        Compacted hours are read from usage_rollup_hourly and the rest from
+        raw rows. after_id restricts the raw scan to rows newer than a
+        Parquet export watermark, so a columnar engine can cover the
+        exported part; it does not apply to compacted hours.
+        """
+        self._persist_hot_rows()
+        split_ms = min(max(start_ms, self.compacted_before_ms()), end_ms)
+        report = self._get_hourly_usage_report(user_id, start_ms, split_ms)
+        if split_ms >= end_ms:
+            return report
+        for conn, schemas in self._range_connections(split_ms, end_ms):
+            parts = [
+                f'''
+                SELECT domain_id, ({LOCAL_HOUR_BUCKET_SQL}) % 24 as hour,
+                       SUM(duration) as total,
+                       SUM(CASE WHEN is_productive = 1 THEN duration ELSE 0 END) as productive,
+                       SUM(CASE WHEN is_distraction = 1 THEN duration ELSE 0 END) as distraction,
+                       COUNT(*) as sessions
+                FROM {schema}.usage_data
+                WHERE user_id = ? AND ts_epoch_ms >= ? AND ts_epoch_ms < ? AND id > ?
+                GROUP BY domain_id, hour
+                '''
+                for schema in schemas
+            ]
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT d.domain, t.hour, t.total, t.productive, t.distraction, t.sessions
+                FROM ({' UNION ALL '.join(parts)}) t
+                LEFT JOIN main.domains d ON d.id = t.domain_id
+            ''', (user_id, split_ms, end_ms, after_id) * len(schemas))
+            report = merge_usage_reports(report, usage_report(cursor.fetchall()))
+        return report
+
+    def iter_usage_export(self, user_id: str, start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                          after: Optional[tuple] = None, page_size: int = 1000):
+        """Yield a user's raw usage rows as dicts, ordered by (ts_epoch_ms, id).
+
+        Keyset pagination: each page is one short indexed query that continues
+        after the last (ts_epoch_ms, id) seen, so memory stays at one page and
+        no connection is held between pages. Pass after=(ts_epoch_ms, id) to
+        resume an earlier export. Archived months are included; hours already
+        compacted into hourly aggregates have no raw rows left to export.
+        """
+        self._persist_hot_rows()
+        key = (start_ms if start_ms is not None else 0, -1)
+        if after is not None:
+            key = max(key, tuple(after))
+        end_ms = end_ms if end_ms is not None else EXPORT_END_MS
+
+        while True:
+            page = []
+            for conn, schemas in self._range_connections(key[0], end_ms):
+                parts = [
+                    f'''
+                    SELECT * FROM (
+                        SELECT id, url_id, domain_id, duration, clicks, scrolls, keystrokes,
+                               mouse_movements, timestamp, ts_epoch_ms, is_distraction, is_productive
+                        FROM {schema}.usage_data
+                        WHERE user_id = ? AND ts_epoch_ms < ? AND (ts_epoch_ms, id) > (?, ?)
+                        ORDER BY ts_epoch_ms, id
+                        LIMIT ?
+                    )
+                    '''
+                    for schema in schemas
+                ]
+                cursor = conn.cursor()
+                cursor.execute(f'''
+                    SELECT ud.id, ud.timestamp, ud.ts_epoch_ms, u.url, d.domain, ud.duration,
+                           ud.clicks, ud.scrolls, ud.keystrokes, ud.mouse_movements,
+                           ud.is_distraction, ud.is_productive
+                    FROM ({' UNION ALL '.join(parts)}) ud
+                    LEFT JOIN main.urls u ON u.id = ud.url_id
+                    LEFT JOIN main.domains d ON d.id = ud.domain_id
+                    ORDER BY ud.ts_epoch_ms, ud.id
+                    LIMIT ?
+                ''', (user_id, end_ms, key[0], key[1], page_size) * len(schemas) + (page_size,))
+                page.extend(cursor.fetchall())
+            # Each connection returned its first page_size rows; keep the overall first
+            page = sorted(page, key=lambda row: (row[2], row[0]))[:page_size]
+
+            for row in page:
+                entry = dict(zip(USAGE_EXPORT_COLUMNS, row))
+                entry['url'] = entry['url'] or ''
+                entry['domain'] = entry['domain'] or ''
+                entry['is_distraction'] = bool(entry['is_distraction'])
+                entry['is_productive'] = bool(entry['is_productive'])
+                yield entry
+            if len(page) < page_size:
+                return
+            key = (page[-1][2], page[-1][0])
+
+    def iter_usage_history(self, start_ms: int, page_size: int = 50000):
+        """Yield every user's usage rows since start_ms in pages, by user and time.
+
+        Rows are (user_id, domain, local hour of day, duration, clicks,
+        scrolls, keystrokes, is_distraction, is_productive), the input of
+        ProductivityModel.usage_batch; used to replay recent history into
+        the model at startup. Each user is found with a seek to the next
+        user_id in idx_usage_user_epoch, and their rows are read from
+        start_ms on with a (ts_epoch_ms, id) keyset, so older history is
+        never scanned. Pages hold long runs of one user's events. Archived
+        months are not read.
+        """
+        self.flush()
+        page, user_id, after, key = [], '', '>=', None
+        while True:
+            conn = self._get_connection()
+            try:
+                cursor = conn.cursor()
+                if key is None:
+                    cursor.execute(f'SELECT user_id FROM usage_data WHERE user_id {after} ? '
+                                   'ORDER BY user_id LIMIT 1', (user_id,))
+                    row = cursor.fetchone()
+                    if row is None:
+                        break
+                    user_id, after, key = row[0], '>', (start_ms, -1)
+                limit = page_size - len(page)
+                cursor.execute(USAGE_HISTORY_PAGE_SQL, (user_id,) + key + (limit,))
+                rows = cursor.fetchall()
+            finally:
+                self._release_connection(conn)
+            page.extend(row[:9] for row in rows)
+            key = (rows[-1][9], rows[-1][10]) if len(rows) == limit else None
+            if len(page) == page_size:
+                yield page
+                page = []
+        if page:
+            yield page
+
+    def _archive_path(self, month: str) -> str:
+        return os.path.join(self.archive_dir, f'usage_{month.replace("-", "_")}.db.gz')
+
+    def _attached_path(self, month: str) -> str:
+        return os.path.join(self.archive_dir, 'attached', f'usage_{month.replace("-", "_")}.db')
+
+    @mutation
+    def archive_month(self, month: str, batch_size: int = 5000) -> Dict:
+        """Move one month of usage_data and tab_activity into a compressed archive file.
+
+        The month's rows are copied to a standalone SQLite file (with the
+        domains and URLs they reference), gzipped, and only then deleted from
+        the live database in bounded batches. Hourly rollups are kept, so the
+        analytics endpoints are unaffected.
+
+        If the month was archived before, late rows are merged into the
+        existing archive; rows whose id it already holds are skipped, so
+        rerunning after a failed delete does not duplicate them.
+        """
+        self.flush()
+        start_ms, end_ms = month_range_ms(month)
+        os.makedirs(self.archive_dir, exist_ok=True)
+        archive_path = self._archive_path(month)
+        staging_path = archive_path[:-len('.gz')]
+        if os.path.exists(staging_path):
+            os.remove(staging_path)
+        merging = os.path.exists(archive_path)
+        if merging:
+            with gzip.open(archive_path, 'rb') as src, open(staging_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+
+        # Copy the month's rows out through a dedicated connection
+        conn = open_connection(self.db_name)
+        try:
+            conn.execute('ATTACH DATABASE ? AS archive', (staging_path,))
+            conn.execute('PRAGMA archive.journal_mode=DELETE')
+            counts = {}
+            totals = {}
+            for table in PARTITIONED_TABLES:
+                if merging:
+                    counts[table] = conn.execute(f'''
+                        INSERT INTO archive.{table}
+                        SELECT * FROM main.{table}
+                        WHERE ts_epoch_ms >= ? AND ts_epoch_ms < ? AND id NOT IN (SELECT id FROM archive.{table})
+                    ''', (start_ms, end_ms)).rowcount
+                else:
+                    conn.execute(f'''
+                        CREATE TABLE archive.{table} AS
+                        SELECT * FROM main.{table} WHERE ts_epoch_ms >= ? AND ts_epoch_ms < ?
+                    ''', (start_ms, end_ms))
+                    conn.execute(f'CREATE INDEX archive.idx_{table}_user_epoch ON {table} (user_id, ts_epoch_ms)')
+                    counts[table] = conn.execute(f'SELECT COUNT(*) FROM archive.{table}').fetchone()[0]
+                totals[table] = conn.execute(f'SELECT COUNT(*) FROM archive.{table}').fetchone()[0]
+            if merging:
+                conn.execute('''
+                    INSERT INTO archive.domains SELECT * FROM main.domains
+                    WHERE id IN (SELECT domain_id FROM archive.usage_data)
+                      AND id NOT IN (SELECT id FROM archive.domains)
+                ''')
+                conn.execute('''
+                    INSERT INTO archive.urls SELECT * FROM main.urls
+                    WHERE id IN (SELECT url_id FROM archive.usage_data UNION SELECT url_id FROM archive.tab_activity)
+                      AND id NOT IN (SELECT id FROM archive.urls)
+                ''')
+            else:
+                conn.execute('''
+                    CREATE TABLE archive.domains AS SELECT * FROM main.domains
+                    WHERE id IN (SELECT domain_id FROM archive.usage_data)
+                ''')
+                conn.execute('''
+                    CREATE TABLE archive.urls AS SELECT * FROM main.urls
+                    WHERE id IN (SELECT url_id FROM archive.usage_data UNION SELECT url_id FROM archive.tab_activity)
+                ''')
+            conn.commit()
+            conn.execute('DETACH DATABASE archive')
         finally:
             conn.close()
 
-    def get_user_analytics_data(self, user_id: str) -> Dict:
-        """Get analytics data for insights"""
+        with open(staging_path, 'rb') as src, gzip.open(archive_path + '.tmp', 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(archive_path + '.tmp', archive_path)
+        os.remove(staging_path)
+        # A copy decompressed for attaching before the merge lacks the new rows
+        self.detach_archive(month)
+
         conn = self._get_connection()
         try:
-            self._ensure_user_exists(user_id, conn)
             cursor = conn.cursor()
-            
-            # Total time
-            cursor.execute('SELECT SUM(duration) FROM usage_data WHERE user_id = ?', (user_id,))
-            result = cursor.fetchone()
-            total_time = int(result[0]) if result and result[0] is not None else 0
-            
-            # Top distractions
+            self._begin_write(conn)
             cursor.execute('''
-                SELECT domain, SUM(duration) as total
-                FROM usage_data WHERE user_id = ? AND is_distraction = 1
-                GROUP BY domain ORDER BY total DESC LIMIT 3
-            ''', (user_id,))
-            result = cursor.fetchall()
-            top_distractions = [row[0] for row in result if row[0]]
-            
-            return {
-                'total_time': total_time,
-                'top_distractions': top_distractions
-            }
+                INSERT OR REPLACE INTO partitions
+                (month, start_ms, end_ms, path, usage_rows, tab_rows, archived_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (month, start_ms, end_ms, archive_path, totals['usage_data'], totals['tab_activity'],
+                  datetime.now().isoformat()))
+            conn.commit()
+
+            # Delete in small transactions so writers are never blocked for long
+            for table in PARTITIONED_TABLES:
+                while True:
+                    self._begin_write(conn)
+                    cursor.execute(f'''
+                        DELETE FROM {table} WHERE id IN (
+                            SELECT id FROM {table} WHERE ts_epoch_ms >= ? AND ts_epoch_ms < ? LIMIT ?
+                        )
+                    ''', (start_ms, end_ms, batch_size))
+                    deleted = cursor.rowcount
+                    conn.commit()
+                    if deleted < batch_size:
+                        break
+            print(f"Archived {month}: {counts['usage_data']} usage rows, "
+                  f"{counts['tab_activity']} tab rows -> {archive_path}")
+            return {'month': month, 'path': archive_path, **counts}
             
         except Exception as e:
-            print(f"Error getting user analytics data: {e}")
-            return {'total_time': 0, 'top_distractions': []}
+            print(f"Error archiving {month}: {e}")
+            conn.rollback()
+            raise
         finally:
-            conn.close()
+            self._release_connection(conn)
 
-    def get_user_performance(self, user_id: str) -> Dict:
-        """Get performance data for limit adjustments"""
+    def apply_retention(self, keep_months: int = 3, now: Optional[datetime] = None) -> List[Dict]:
+        """Archive every month with live rows that ends more than keep_months months before now"""
+        now = now or datetime.now()
+        cutoff_index = now.year * 12 + now.month - 1 - keep_months
+        cutoff = f'{cutoff_index // 12:04d}-{cutoff_index % 12 + 1:02d}'
+        cutoff_ms = month_range_ms(cutoff)[1]
+
+        # Only months that still have rows, so empty months get no archive file
         conn = self._get_connection()
         try:
-            self._ensure_user_exists(user_id, conn)
             cursor = conn.cursor()
-            
-            # Distraction usage
-            cursor.execute('''
-                SELECT domain, SUM(duration) as total
-                FROM usage_data WHERE user_id = ? AND is_distraction = 1
-                GROUP BY domain
-            ''', (user_id,))
-            result = cursor.fetchall()
-            distraction_usage = {row[0]: int(row[1]) for row in result if row[0] and row[1] is not None}
-            
-            # Productive usage
-            cursor.execute('''
-                SELECT domain, SUM(duration) as total
-                FROM usage_data WHERE user_id = ? AND is_productive = 1
-                GROUP BY domain
-            ''', (user_id,))
-            result = cursor.fetchall()
-            productive_usage = {row[0]: int(row[1]) for row in result if row[0] and row[1] is not None}
-            
-            return {
-                'distraction_usage': distraction_usage,
-                'productive_usage': productive_usage
-            }
-            
-        except Exception as e:
-            print(f"Error getting user performance: {e}")
-            return {'distraction_usage': {}, 'productive_usage': {}}
+            cursor.execute(' UNION '.join(
+                f"SELECT DISTINCT strftime('%Y-%m', ts_epoch_ms / 1000, 'unixepoch', 'localtime') "
+                f"FROM {table} WHERE ts_epoch_ms < ?"
+                for table in PARTITIONED_TABLES
+            ), (cutoff_ms,) * len(PARTITIONED_TABLES))
+            months = sorted(row[0] for row in cursor.fetchall())
         finally:
-            conn.close()
+            self._release_connection(conn)
 
-    def update_distraction_limits(self, user_id: str, adjustments: Dict):
-        """Update distraction limits"""
-        with self.lock:
-            conn = self._get_connection()
-            try:
-                self._ensure_user_exists(user_id, conn)
-                cursor = conn.cursor()
-                
-                for domain, adj in adjustments.items():
-                    new_limit = int(adj.get('new_limit', 0))
-                    cursor.execute('''
-                        INSERT OR REPLACE INTO distraction_limits (user_id, domain, limit_minutes)
-                        VALUES (?, ?, ?)
-                    ''', (user_id, domain, new_limit))
-                
-                conn.commit()
-                print(f"Updated distraction limits for user {user_id}")
-                
-            except Exception as e:
-                print(f"Error updating distraction limits: {e}")
-                conn.rollback()
-                raise
-            finally:
-                conn.close()
+        return [self.archive_month(month) for month in months]
 
-    def update_productive_targets(self, user_id: str, adjustments: Dict):
-        """Update productive targets"""
-        with self.lock:
-            conn = self._get_connection()
+    def attach_archive(self, month: str) -> str:
+        """Decompress an archived month (once) so it can be attached; returns its path.
+
+        Each caller decompresses into its own temporary file and renames it
+        into place, so concurrent readers never see a half-written copy.
+        """
+        attached_path = self._attached_path(month)
+        if not os.path.exists(attached_path):
+            archive_path = self._archive_path(month)
+            if not os.path.exists(archive_path):
+                raise FileNotFoundError(f"No archive for {month} at {archive_path}")
+            os.makedirs(os.path.dirname(attached_path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(attached_path), suffix='.tmp')
             try:
-                self._ensure_user_exists(user_id, conn)
-                cursor = conn.cursor()
-                
-                for domain, adj in adjustments.items():
-                    new_target = int(adj.get('new_target', 0))
-                    cursor.execute('''
-                        INSERT OR REPLACE INTO productive_targets (user_id, domain, target_minutes)
-                        VALUES (?, ?, ?)
-                    ''', (user_id, domain, new_target))
-                
-                conn.commit()
-                print(f"Updated productive targets for user {user_id}")
-                
-            except Exception as e:
-                print(f"Error updating productive targets: {e}")
-                conn.rollback()
+                with gzip.open(archive_path, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+                os.replace(tmp_path, attached_path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
                 raise
-            finally:
-                conn.close()
+        return attached_path
 
-    def get_daily_data(self, user_id: str, date: str) -> Dict:
-        """Get daily data for summary"""
+    def detach_archive(self, month: str):
+        """Drop the decompressed copy of an archived month"""
+        attached_path = self._attached_path(month)
+        if os.path.exists(attached_path):
+            os.remove(attached_path)
+
+    def _get_watermark(self, cursor, name: str) -> int:
+        cursor.execute('SELECT value FROM watermarks WHERE name = ?', (name,))
+        row = cursor.fetchone()
+        return row[0] if row and row[0] is not None else 0
+
+    def _set_watermark(self, cursor, name: str, value: int):
+        cursor.execute('''
+            INSERT OR REPLACE INTO watermarks (name, value, updated_at) VALUES (?, ?, ?)
+        ''', (name, value, datetime.now().isoformat()))
+
+    def compact_raw_events(self, max_age_days: float = 7, batch_size: int = 5000,
+                           pause: float = 0.01, now: Optional[datetime] = None) -> Dict:
+        """Downsample raw usage_data / tab_activity rows older than max_age_days.
+
+        usage_data rows are already summed into usage_rollup_hourly when they
+        are written, so they are simply deleted, as are tab switches (no
+        analytics read them at hourly resolution). Each batch commits
+        separately and the job pauses between batches so ingest writers are
+        not starved.
+        """
+        self.flush()
+        now = now or datetime.now()
+        # Hour-aligned, so a day splits cleanly between hourly and raw tiers
+        cutoff = (now - timedelta(days=max_age_days)).replace(minute=0, second=0, microsecond=0)
+        cutoff_ms = int(cutoff.timestamp() * 1000)
+        counts = {'usage_data': 0, 'tab_activity': 0}
+
+        try:
+            # Move readers onto the hourly tier before any raw rows disappear
+            self._compact_step('watermark', cutoff_ms, batch_size)
+            for table in ('tab_activity', 'usage_data'):
+                while True:
+                    done = self._compact_step(table, cutoff_ms, batch_size)
+                    counts[table] += done
+                    if done < batch_size:
+                        break
+                    time.sleep(pause)
+
+            if any(counts.values()):
+                print(f"Compacted raw events older than {cutoff.isoformat()}: "
+                      f"{counts['usage_data']} usage rows, {counts['tab_activity']} tab rows")
+            return counts
+            
+        except Exception as e:
+            print(f"Error compacting raw events: {e}")
+            raise
+
+    @mutation
+    def _compact_step(self, step: str, cutoff_ms: int, batch_size: int) -> int:
+        """One compaction transaction: advance the watermark or delete one batch of a table"""
         conn = self._get_connection()
         try:
-            self._ensure_user_exists(user_id, conn)
             cursor = conn.cursor()
-            
-            start_date = f"{date} 00:00:00"
-            end_date = f"{date} 23:59:59"
-            
-            cursor.execute('''
-                SELECT url, domain, duration, is_distraction, is_productive
-                FROM usage_data 
-                WHERE user_id = ? AND timestamp BETWEEN ? AND ?
-            ''', (user_id, start_date, end_date))
-            
-            result = cursor.fetchall()
-            usage_entries = []
-            for row in result:
-                usage_entries.append({
-                    'url': row[0] or '',
-                    'domain': row[1] or '',
-                    'duration': int(row[2]) if row[2] is not None else 0,
-                    'is_distraction': bool(row[3]),
-                    'is_productive': bool(row[4])
-                })
-            
-            return {'usage_entries': usage_entries}
+            self._begin_write(conn)
+            done = 0
+            if step == 'watermark':
+                if cutoff_ms > self._get_watermark(cursor, 'compacted_before_ms'):
+                    self._set_watermark(cursor, 'compacted_before_ms', cutoff_ms)
+            else:
+                cursor.execute(f'''
+                    DELETE FROM {step} WHERE id IN (
+                        SELECT id FROM {step} WHERE ts_epoch_ms < ? ORDER BY id LIMIT ?
+                    )
+                ''', (cutoff_ms, batch_size))
+                done = cursor.rowcount
+            conn.commit()
+            return done
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._release_connection(conn)
+
+    def _raw_data_start_ms(self, cursor) -> int:
+        """Start of the range whose raw usage rows are still in the live database"""
+        cursor.execute('SELECT MAX(end_ms) FROM partitions')
+        archived_before = cursor.fetchone()[0] or 0
+        return max(archived_before, self._get_watermark(cursor, 'compacted_before_ms'))
+
+    @mutation
+    def rebuild_rollups(self):
+        """Recompute usage_rollup_hourly from the raw usage_data rows.
+
+        Hours whose raw rows were archived keep their existing rollups.
+        """
+        self.flush()
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            self._begin_write(conn)
+            since_ms = self._raw_data_start_ms(cursor)
+            cursor.execute('DELETE FROM usage_rollup_hourly WHERE hour_bucket >= ?',
+                           (local_hour_bucket(since_ms),))
+            cursor.execute(ROLLUP_REBUILD_SINCE_SQL, (since_ms,))
+            # Stored summaries of the rebuilt days may be out of date
+            cursor.execute('DELETE FROM daily_summaries WHERE date >= ?',
+                           (bucket_date(local_hour_bucket(since_ms)),))
+            conn.commit()
+            # Contexts are computed from the rollups, for any user
+            self.context_cache.clear()
+            cursor.execute('SELECT COUNT(*) FROM usage_rollup_hourly')
+            print(f"Rebuilt usage rollups ({cursor.fetchone()[0]} hourly rows)")
             
         except Exception as e:
-            print(f"Error getting daily data: {e}")
-            return {'usage_entries': []}
+            print(f"Error rebuilding usage rollups: {e}")
+            conn.rollback()
+            raise
         finally:
-            conn.close()
+            self._release_connection(conn)
+
+    def _persist_hot_rows(self):
+        """Write hot-tier rows to disk first, for readers that only query the database file"""
+        if self.hot:
+            self.hot.flush()
+
+    def flush(self):
+        """Wait until queued write-behind events / hot-tier rows / submitted writes are on disk"""
+        if self.write_queue:
+            self.write_queue.flush()
+        if self.hot:
+            self.hot.flush()
+        if self.writer and not self.writer.owns_current_thread():
+            self.writer.submit(lambda: None).result()
+
+    def cache_stats(self) -> Dict:
+        """UserContext cache counters for the health check"""
+        return self.context_cache.stats()
+
+    def lock_stats(self) -> Dict:
+        """Per-user write lock contention counters for the health check"""
+        return self.locks.stats()
 
     def close(self):
-        """Close method for compatibility (connections are per-thread now)"""
+        """Close method for compatibility (connections are pooled per process)"""
         pass
 
-    @property
-    def cursor(self):
-        """Property for compatibility with health check"""
+    def ping(self):
+        """Run a trivial query on a pooled connection (health check)"""
         conn = self._get_connection()
-        return conn.cursor()
\ No newline at end of file
+        try:
+            conn.execute('SELECT 1')
+        finally:
+            self._release_connection(conn)
+
+
+def shard_index(user_id: str, shards: int) -> int:
+    """Stable shard number for a user (crc32, so it is the same in every process)"""
+    return zlib.crc32(user_id.encode('utf-8')) % shards
+
+
+def shard_path(db_name: str, index: int, shards: int) -> str:
+    """File name of one shard, e.g. productivity_shard_2_of_4.db"""
+    stem, ext = os.path.splitext(db_name)
+    return f'{stem}_shard_{index}_of_{shards}{ext or ".db"}'
+
+
+class ShardedDatabaseManager:
+    """DatabaseManager facade that routes each user_id to one of N database files.
+
+    Every shard is a full DatabaseManager with its own file, connection pool,
+    lock and (optional) write-behind writer, so writes for users on different
+    shards never wait on each other. All per-user methods go to the user's
+    shard; maintenance methods run on every shard.
+    """
+
+    def __init__(self, db_name='productivity.db', shards=4, write_behind=False, archive_dir=None, actor=False,
+                 hot_tier=False):
+        self.db_name = db_name
+        archive_dir = archive_dir or os.path.join(os.path.dirname(os.path.abspath(db_name)), 'archive')
+        self.shards = [
+            DatabaseManager(shard_path(db_name, i, shards), write_behind=write_behind,
+                            archive_dir=os.path.join(archive_dir, f'shard_{i}'), actor=actor, hot_tier=hot_tier)
+            for i in range(shards)
+        ]
+
+    def shard(self, user_id: str) -> DatabaseManager:
+        """The shard that stores this user's data"""
+        return self.shards[shard_index(user_id, len(self.shards))]
+
+    def initialize_database(self):
+        for shard in self.shards:
+            shard.initialize_database()
+
+    def get_schema_version(self) -> int:
+        return min(shard.get_schema_version() for shard in self.shards)
+
+    def store_distraction_urls(self, user_id: str, urls: List[str]):
+        self.shard(user_id).store_distraction_urls(user_id, urls)
+
+    def store_productive_urls(self, user_id: str, urls: List[str]):
+        self.shard(user_id).store_productive_urls(user_id, urls)
+
+    def store_usage_data(self, usage_entry: Dict):
+        self.shard(usage_entry['user_id']).store_usage_data(usage_entry)
+
+    def store_usage_batch(self, user_id: str, usage_entries: List[Dict]):
+        self.shard(user_id).store_usage_batch(user_id, usage_entries)
+
+    def store_tab_activity(self, tab_data: Dict):
+        self.shard(tab_data['user_id']).store_tab_activity(tab_data)
+
+    def store_intervention_response(self, interaction: Dict):
+        self.shard(interaction['user_id']).store_intervention_response(interaction)
+
+    def get_user_context(self, user_id: str) -> UserContext:
+        return self.shard(user_id).get_user_context(user_id)
+
+    def get_user_analytics_data(self, user_id: str) -> Dict:
+        return self.shard(user_id).get_user_analytics_data(user_id)
+
+    def get_user_performance(self, user_id: str) -> Dict:
+        return self.shard(user_id).get_user_performance(user_id)
+
+    def get_engagement_patterns(self, user_id: str) -> Dict:
+        return self.shard(user_id).get_engagement_patterns(user_id)
+
+    def update_distraction_limits(self, user_id: str, adjustments: Dict):
+        self.shard(user_id).update_distraction_limits(user_id, adjustments)
+
+    def update_productive_targets(self, user_id: str, adjustments: Dict):
+        self.shard(user_id).update_productive_targets(user_id, adjustments)
+
+    def get_daily_data(self, user_id: str, date: str) -> Dict:
+        return self.shard(user_id).get_daily_data(user_id, date)
+
+    def get_daily_report(self, user_id: str, date: str) -> Dict:
+        return self.shard(user_id).get_daily_report(user_id, date)
+
+    def precompute_daily_summaries(self, date: Optional[str] = None) -> int:
+        return sum(shard.precompute_daily_summaries(date) for shard in self.shards)
+
+    def search_history(self, user_id: str, *args, **kwargs) -> Dict:
+        return self.shard(user_id).search_history(user_id, *args, **kwargs)
+
+    def get_usage_range(self, user_id: str, start_ms: int, end_ms: int) -> List[tuple]:
+        return self.shard(user_id).get_usage_range(user_id, start_ms, end_ms)
+
+    def get_usage_report(self, user_id: str, *args, **kwargs) -> Dict:
+        return self.shard(user_id).get_usage_report(user_id, *args, **kwargs)
+
+    def iter_usage_export(self, user_id: str, *args, **kwargs):
+        return self.shard(user_id).iter_usage_export(user_id, *args, **kwargs)
+
+    def iter_usage_history(self, *args, **kwargs):
+        for shard in self.shards:
+            yield from shard.iter_usage_history(*args, **kwargs)
+
+    def rebuild_rollups(self):
+        for shard in self.shards:
+            shard.rebuild_rollups()
+
+    def compact_raw_events(self, *args, **kwargs) -> Dict:
+        counts = {}
+        for shard in self.shards:
+            for table, count in shard.compact_raw_events(*args, **kwargs).items():
+                counts[table] = counts.get(table, 0) + count
+        return counts
+
+    def apply_retention(self, *args, **kwargs) -> List[Dict]:
+        return [archived for shard in self.shards for archived in shard.apply_retention(*args, **kwargs)]
+
+    def flush(self):
+        for shard in self.shards:
+            shard.flush()
+
+    def cache_stats(self) -> Dict:
+        """UserContext cache counters summed over the shards"""
+        totals = {}
+        for shard in self.shards:
+            for key, value in shard.cache_stats().items():
+                totals[key] = totals.get(key, 0) + value
+        lookups = totals['hits'] + totals['misses']
+        totals['hit_rate'] = round(totals['hits'] / lookups, 4) if lookups else 0.0
+        return totals
+
+    def lock_stats(self) -> Dict:
+        """Per-user write lock counters summed over the shards"""
+        totals = {}
+        for shard in self.shards:
+            for key, value in shard.lock_stats().items():
+                totals[key] = max(totals.get(key, 0), value) if key == 'max_wait_ms' else totals.get(key, 0) + value
+        acquisitions = totals['acquisitions']
+        totals['avg_wait_ms'] = round(totals['wait_ms_total'] / acquisitions, 4) if acquisitions else 0.0
+        return totals
+
+    def close(self):
+        pass
+
+    def ping(self):
+        for shard in self.shards:
+            shard.ping()
+
+
+def split_into_shards(db_name: str, shards: int) -> List[str]:
+    """Copy an existing single-file database into N shard files.
+
+    Per-user tables are routed with shard_index; the domain/URL dictionaries
+    and watermarks are copied whole so interned IDs stay valid. The source
+    database is left untouched. Returns the shard file names.
+    """
+    source = DatabaseManager(db_name)
+    source.initialize_database()
+    source.flush()
+    conn = source._get_connection()
+    try:
+        cursor = conn.cursor()
+        if cursor.execute('SELECT COUNT(*) FROM partitions').fetchone()[0]:
+            raise ValueError(f"{db_name} has archived months; split before archiving")
+        cursor.execute("""
+            SELECT name FROM sqlite_master
+            WHERE type = 'table' AND name NOT LIKE 'sqlite_%' AND name NOT IN ('schema_version', 'partitions')
+              AND name NOT LIKE 'tab_search%'
+        """)
+        # URLs first: the shard's search index triggers look them up as tab_activity rows arrive
+        tables = sorted((row[0] for row in cursor.fetchall()), key=lambda table: table != 'urls')
+        columns = {table: [row[1] for row in cursor.execute(f'PRAGMA table_info({table})')] for table in tables}
+    finally:
+        source._release_connection(conn)
+
+    paths = [shard_path(db_name, i, shards) for i in range(shards)]
+    for path in paths:
+        if os.path.exists(path):
+            raise FileExistsError(f"Shard {path} already exists")
+
+    for index, path in enumerate(paths):
+        DatabaseManager(path).initialize_database()
+        conn = open_connection(path)
+        try:
+            conn.create_function('shard_index', 1, lambda user_id: shard_index(user_id or '', shards),
+                                 deterministic=True)
+            conn.execute('ATTACH DATABASE ? AS src', (os.path.abspath(db_name),))
+            conn.execute('BEGIN')
+            copied = 0
+            for table in tables:
+                column_list = ', '.join(columns[table])
+                where = 'WHERE shard_index(user_id) = ?' if 'user_id' in columns[table] else ''
+                cursor = conn.execute(
+                    f'INSERT INTO main.{table} ({column_list}) SELECT {column_list} FROM src.{table} {where}',
+                    (index,) if where else ())
+                if where:
+                    copied += cursor.rowcount
+            conn.commit()
+            conn.execute('DETACH DATABASE src')
+            print(f"Shard {index}: {copied} per-user rows -> {path}")
+        except Exception as e:
+            print(f"Error splitting into {path}: {e}")
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+    return paths
+
+
+class Compactor:
+    """Background thread that runs DatabaseManager.compact_raw_events periodically"""
+
+    def __init__(self, db_name: str, max_age_days: float = 7, interval: float = 3600, actor: bool = False):
+        self.manager = DatabaseManager(db_name, actor=actor)
+        self.max_age_days = max_age_days
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='compactor', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.manager.compact_raw_events(self.max_age_days)
+            except Exception as e:
+                print(f"Compaction run failed: {e}")
+            self._stop.wait(self.interval)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class SummaryScheduler:
+    """Background thread that stores the previous day's summaries shortly after local midnight"""
+
+    def __init__(self, db_name: str, delay: float = 300, actor: bool = False):
+        self.manager = DatabaseManager(db_name, actor=actor)
+        self.delay = delay
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='summary-scheduler', daemon=True)
+        self._thread.start()
+
+    def _seconds_until_next_run(self) -> float:
+        now = datetime.now()
+        midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        return (midnight - now).total_seconds() + self.delay
+
+    def _run(self):
+        # The first run catches up on a midnight missed while the server was down
+        while not self._stop.is_set():
+            try:
+                self.manager.precompute_daily_summaries()
+            except Exception as e:
+                print(f"Daily summary run failed: {e}")
+            self._stop.wait(self._seconds_until_next_run())
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+_compactors: Dict[str, Compactor] = {}
+_summary_schedulers: Dict[str, SummaryScheduler] = {}
+# Guards both job registries; separate from _pools_lock, which the jobs' DatabaseManagers take
+_compactors_lock = threading.Lock()
+
+
+def start_compactor(db_name: str, max_age_days: float = 7, interval: float = 3600,
+                    actor: bool = False) -> Compactor:
+    """Start the process-wide compaction thread for a database file (once)"""
+    with _compactors_lock:
+        compactor = _compactors.get(db_name)
+        if compactor is None:
+            compactor = Compactor(db_name, max_age_days, interval, actor)
+            _compactors[db_name] = compactor
+        return compactor
+
+
+def stop_compactors():
+    """Stop every compaction thread (registered with atexit)"""
+    with _compactors_lock:
+        compactors = list(_compactors.values())
+        _compactors.clear()
+    for compactor in compactors:
+        compactor.stop()
+
+
+atexit.register(stop_compactors)
+
+
+def start_summary_scheduler(db_name: str, delay: float = 300, actor: bool = False) -> SummaryScheduler:
+    """Start the process-wide nightly summary thread for a database file (once)"""
+    with _compactors_lock:
+        scheduler = _summary_schedulers.get(db_name)
+        if scheduler is None:
+            scheduler = SummaryScheduler(db_name, delay, actor)
+            _summary_schedulers[db_name] = scheduler
+        return scheduler
+
+
+def stop_summary_schedulers():
+    """Stop every nightly summary thread (registered with atexit)"""
+    with _compactors_lock:
+        schedulers = list(_summary_schedulers.values())
+        _summary_schedulers.clear()
+    for scheduler in schedulers:
+        scheduler.stop()
+
+
+atexit.register(stop_summary_schedulers)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Productivity database maintenance')
+    parser.add_argument('command', choices=['migrate', 'rebuild-rollups', 'vacuum', 'archive',
+                                            'attach-archive', 'detach-archive', 'compact', 'split',
+                                            'summarize'])
+    parser.add_argument('month', nargs='?', help='YYYY-MM for attach-archive / detach-archive')
+    parser.add_argument('--db', default='productivity.db', help='database file (default: productivity.db)')
+    parser.add_argument('--keep-months', type=int, default=3, help='months kept live by archive (default: 3)')
+    parser.add_argument('--shards', type=int, default=4, help='shard count for split (default: 4)')
+    parser.add_argument('--max-age-days', type=float, default=7,
+                        help='raw events older than this are compacted (default: 7)')
+    parser.add_argument('--date', help='YYYY-MM-DD day stored by summarize (default: yesterday)')
+    args = parser.parse_args()
+
+    if args.command == 'split':
+        split_into_shards(args.db, args.shards)
+        raise SystemExit(0)
+
+    manager = DatabaseManager(args.db)
+    manager.initialize_database()
+    if args.command == 'rebuild-rollups':
+        manager.rebuild_rollups()
+    elif args.command == 'vacuum':
+        # Reclaims the space freed by migrations that clear text columns
+        conn = open_connection(args.db)
+        conn.execute('VACUUM')
+        conn.close()
+        print(f"Vacuumed {args.db}")
+    elif args.command == 'compact':
+        manager.compact_raw_events(args.max_age_days)
+    elif args.command == 'summarize':
+        manager.precompute_daily_summaries(args.date)
+    elif args.command == 'archive':
+        manager.apply_retention(args.keep_months)
+    elif args.command in ('attach-archive', 'detach-archive'):
+        if not args.month:
+            parser.error(f'{args.command} needs a YYYY-MM month')
+        if args.command == 'attach-archive':
+            print(f"Attached {args.month} at {manager.attach_archive(args.month)}")
+        else:
+            manager.detach_archive(args.month)
+            print(f"Detached {args.month}")
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Parquet export of the productivity databases for offline analytics.
+
+Each table becomes a dataset directory of Parquet part files with typed
+columns: epoch-millisecond timestamps, dictionary-encoded domains and user
+IDs, booleans and integers instead of SQLite text. Rows are streamed from
+SQLite in chunks, one Arrow record batch (and one row group) per chunk.
+
+Exports are incremental: _manifest.json in the output directory keeps the
+highest row id exported per table, and each run appends a new part file with
+only the rows added since. Row ids only grow, so late-arriving events are
+picked up too. Rows archived or compacted before their first export are not
+recovered.
+
+Usage: python export.py [--out exports/parquet] [--full] [table ...]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from db import DatabaseManager, LOCAL_HOUR_BUCKET_SQL, open_connection, to_epoch_ms
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional: only needed for exports
+    pa = None
+    pq = None
+
+DEFAULT_OUT_DIR = os.path.join('exports', 'parquet')
+DEFAULT_ROW_GROUP_ROWS = 65536
+MANIFEST_NAME = '_manifest.json'
+
+
+def _dictionary_string():
+    return pa.dictionary(pa.int32(), pa.string())
+
+
+# table -> (source database, SELECT with "id > ?" watermark filter, Arrow fields)
+EXPORT_TABLES = {
+    # hour_bucket is the local hour bucket used by the rollups (see db.local_hour_bucket)
+    'usage_data': ('productivity', f'''
+        SELECT ud.id, ud.user_id, ud.ts_epoch_ms, {LOCAL_HOUR_BUCKET_SQL.replace('ts_epoch_ms', 'ud.ts_epoch_ms')},
+               u.url, d.domain, ud.duration, ud.clicks, ud.scrolls, ud.keystrokes, ud.mouse_movements,
+               ud.is_distraction, ud.is_productive
+        FROM usage_data ud
+        LEFT JOIN urls u ON u.id = ud.url_id
+        LEFT JOIN domains d ON d.id = ud.domain_id
+        WHERE ud.id > ?
+        ORDER BY ud.id
+    ''', lambda: [
+        ('id', pa.int64()), ('user_id', _dictionary_string()), ('ts', pa.timestamp('ms', tz='UTC')),
+        ('hour_bucket', pa.int32()), ('url', pa.string()), ('domain', _dictionary_string()),
+        ('duration', pa.int32()),
+        ('clicks', pa.int32()), ('scrolls', pa.int32()), ('keystrokes', pa.int32()),
+        ('mouse_movements', pa.int32()), ('is_distraction', pa.bool_()), ('is_productive', pa.bool_()),
+    ]),
+    'tab_activity': ('productivity', '''
+        SELECT ta.id, ta.user_id, ta.ts_epoch_ms, u.url, ta.title, ta.time_of_day
+        FROM tab_activity ta
+        LEFT JOIN urls u ON u.id = ta.url_id
+        WHERE ta.id > ?
+        ORDER BY ta.id
+    ''', lambda: [
+        ('id', pa.int64()), ('user_id', _dictionary_string()), ('ts', pa.timestamp('ms', tz='UTC')),
+        ('url', pa.string()), ('title', pa.string()), ('time_of_day', pa.int8()),
+    ]),
+    'intervention_responses': ('productivity', '''
+        SELECT id, user_id, ts_epoch_ms, domain, answer
+        FROM intervention_responses
+        WHERE id > ?
+        ORDER BY id
+    ''', lambda: [
+        ('id', pa.int64()), ('user_id', _dictionary_string()), ('ts', pa.timestamp('ms', tz='UTC')),
+        ('domain', _dictionary_string()), ('answer', pa.string()),
+    ]),
+    # brain.py's history database stores text timestamps only; they are converted per row
+    'user_sessions': ('history', '''
+        SELECT id, timestamp, session_data, mental_health_score, intervention_triggered
+        FROM user_sessions
+        WHERE id > ?
+        ORDER BY id
+    ''', lambda: [
+        ('id', pa.int64()), ('ts', pa.timestamp('ms', tz='UTC')), ('session_data', pa.string()),
+        ('mental_health_score', pa.float64()), ('intervention_triggered', pa.bool_()),
+    ]),
+}
+
+
+def load_manifest(out_dir: str) -> Dict:
+    """Read the per-table export watermarks (empty for a new export directory)"""
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {'tables': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(out_dir: str, manifest: Dict):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def _record_batch(rows: List[tuple], schema, table: str):
+    """Build one typed record batch from a chunk of SQLite rows"""
+    columns = list(zip(*rows))
+    if table == 'user_sessions':
+        columns[1] = tuple(to_epoch_ms(value) if value else None for value in columns[1])
+    arrays = []
+    for field, values in zip(schema, columns):
+        if pa.types.is_boolean(field.type):
+            values = [None if value is None else bool(value) for value in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def export_table(conn: sqlite3.Connection, table: str, out_dir: str, after_id: int = 0,
+                 row_group_rows: int = DEFAULT_ROW_GROUP_ROWS) -> Optional[Dict]:
+    """Append rows with id > after_id to the table's Parquet dataset.
+
+    Returns the written part's file name, row count and last id, or None when
+    there is nothing new.
+    """
+    _, sql, fields = EXPORT_TABLES[table]
+    schema = pa.schema(fields())
+    table_dir = os.path.join(out_dir, table)
+    os.makedirs(table_dir, exist_ok=True)
+
+    cursor = conn.cursor()
+    cursor.execute(sql, (after_id,))
+    writer = None
+    tmp_path = None
+    rows_written = 0
+    last_id = after_id
+    try:
+        while True:
+            rows = cursor.fetchmany(row_group_rows)
+            if not rows:
+                break
+            if writer is None:
+                tmp_path = os.path.join(table_dir, f'.part-{rows[0][0]:012d}.parquet.tmp')
+                writer = pq.ParquetWriter(tmp_path, schema, compression='zstd')
+            writer.write_batch(_record_batch(rows, schema, table), row_group_size=row_group_rows)
+            rows_written += len(rows)
+            last_id = rows[-1][0]
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        return None
+    part_name = f'part-{after_id + 1:012d}-{last_id:012d}.parquet'
+    os.replace(tmp_path, os.path.join(table_dir, part_name))
+    return {'file': part_name, 'rows': rows_written, 'last_id': last_id}
+
+
+def export_all(db_name: str = 'productivity.db', history_db: str = 'user_behavior_history.db',
+               out_dir: str = DEFAULT_OUT_DIR, tables: Optional[List[str]] = None, full: bool = False,
+               row_group_rows: int = DEFAULT_ROW_GROUP_ROWS) -> Dict:
+    """Export new rows of every table (or all rows with full=True) and advance the watermarks"""
+    if pa is None:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+
+    tables = tables or list(EXPORT_TABLES)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = load_manifest(out_dir)
+
+    # Migrate first so the interned id and epoch columns exist
+    DatabaseManager(db_name).initialize_database()
+    connections = {'productivity': open_connection(db_name, read_only=True)}
+    if os.path.exists(history_db):
+        connections['history'] = sqlite3.connect(f'file:{history_db}?mode=ro', uri=True)
+
+    results = {}
+    try:
+        for table in tables:
+            source = EXPORT_TABLES[table][0]
+            if source not in connections:
+                print(f"Skipping {table}: {history_db} not found")
+                continue
+            if full:
+                shutil.rmtree(os.path.join(out_dir, table), ignore_errors=True)
+                manifest['tables'].pop(table, None)
+            state = manifest['tables'].setdefault(table, {'last_id': 0, 'parts': []})
+            part = export_table(connections[source], table, out_dir, state['last_id'], row_group_rows)
+            if part:
+                state['last_id'] = part['last_id']
+                state['parts'].append(part['file'])
+                state['exported_at'] = datetime.now().isoformat()
+                # Save after each table so a failure later keeps this table's progress
+                save_manifest(out_dir, manifest)
+                print(f"Exported {part['rows']} new {table} rows -> {table}/{part['file']}")
+            else:
+                print(f"No new {table} rows")
+            results[table] = part
+    finally:
+        for conn in connections.values():
+            conn.close()
+    save_manifest(out_dir, manifest)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export productivity data to Parquet')
+    parser.add_argument('tables', nargs='*', help=f'tables to export (default: {", ".join(EXPORT_TABLES)})')
+    parser.add_argument('--db', default='productivity.db', help='database file (default: productivity.db)')
+    parser.add_argument('--history-db', default='user_behavior_history.db',
+                        help='brain.py history database (default: user_behavior_history.db)')
+    parser.add_argument('--out', default=DEFAULT_OUT_DIR, help=f'output directory (default: {DEFAULT_OUT_DIR})')
+    parser.add_argument('--full', action='store_true', help='re-export everything instead of new rows only')
+    parser.add_argument('--row-group-rows', type=int, default=DEFAULT_ROW_GROUP_ROWS,
+                        help=f'rows per record batch / row group (default: {DEFAULT_ROW_GROUP_ROWS})')
+    args = parser.parse_args()
+    unknown = set(args.tables) - set(EXPORT_TABLES)
+    if unknown:
+        parser.error(f'unknown tables: {", ".join(sorted(unknown))}')
+
+    export_all(args.db, args.history_db, args.out, args.tables, args.full, args.row_group_rows)
@@ -1,10 +1,13 @@
 import json
 import random
+import threading
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional
 import numpy as np
 from dataclasses import dataclass
 
+from db import StripedLock, interaction_counts, local_hour_bucket, to_epoch_ms
+
 
 @dataclass
 class UserContext:
@@ -16,8 +19,265 @@ class UserContext:
     stress_indicators: List[str]
 
 
+class RunningStats:
+    """Constant-memory summary of a stream of values.
+
+    Keeps the count, Welford's running mean and variance, an exponentially
+    weighted moving average of recent values and a fixed-size uniform
+    reservoir sample (Algorithm R) for quantiles.
+    """
+
+    __slots__ = ('count', 'mean', '_m2', 'ewma', 'reservoir')
+
+    # EWMA weight of the newest value, and reservoir size for quantiles
+    ALPHA = 0.1
+    RESERVOIR_SIZE = 32
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.ewma = 0.0
+        self.reservoir = []
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self.ewma = value if self.count == 1 else self.ewma + self.ALPHA * (value - self.ewma)
+        if len(self.reservoir) < self.RESERVOIR_SIZE:
+            self.reservoir.append(value)
+        else:
+            slot = random.randrange(self.count)
+            if slot < self.RESERVOIR_SIZE:
+                self.reservoir[slot] = value
+
+    def add_many(self, values: np.ndarray) -> None:
+        """Add an array of values in order, as if by add() for each"""
+        n = len(values)
+        if not n:
+            return
+        # Merge the batch's mean and M2 into the running ones (Chan et al.)
+        batch_mean = float(values.mean())
+        batch_m2 = float(((values - batch_mean) ** 2).sum())
+        total = self.count + n
+        delta = batch_mean - self.mean
+        self._m2 += batch_m2 + delta * delta * self.count * n / total
+        self.mean += delta * n / total
+
+        ewma, rest = (self.ewma, values) if self.count else (float(values[0]), values[1:])
+        weights = (1 - self.ALPHA) ** np.arange(len(rest) - 1, -1, -1)
+        self.ewma = float((1 - self.ALPHA) ** len(rest) * ewma + self.ALPHA * (weights @ rest))
+
+        fill = min(self.RESERVOIR_SIZE - len(self.reservoir), n)
+        self.reservoir.extend(values[:fill].tolist())
+        if fill < n:
+            # Value i of the batch is value self.count + i + 1 of the stream
+            slots = np.random.randint(0, self.count + np.arange(fill, n) + 1)
+            for i in np.flatnonzero(slots < self.RESERVOIR_SIZE):
+                self.reservoir[slots[i]] = float(values[fill + i])
+        self.count = total
+
+    @property
+    def variance(self) -> float:
+        """Sample variance (0 until there are two values)"""
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def quantile(self, q: float) -> float:
+        """Estimate the q-quantile (0..1) from the reservoir sample"""
+        return float(np.quantile(self.reservoir, q)) if self.reservoir else 0.0
+
+    def to_dict(self) -> Dict[str, float]:
+        return {'count': self.count, 'mean': self.mean, 'std': self.variance ** 0.5, 'ewma': self.ewma,
+                'p50': self.quantile(0.5), 'p90': self.quantile(0.9)}
+
+
+class DomainIndex:
+    """In-memory domain -> small integer ID table shared by all users"""
+
+    def __init__(self):
+        self._ids = {}
+        self.names = []
+        self._lock = threading.Lock()
+
+    def id(self, domain: str) -> int:
+        """Get the ID for a domain, assigning the next one if it is new"""
+        domain_id = self._ids.get(domain)
+        if domain_id is None:
+            with self._lock:
+                domain_id = self._ids.get(domain)
+                if domain_id is None:
+                    domain_id = self._ids[domain] = len(self.names)
+                    self.names.append(domain)
+        return domain_id
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+class UserProfile:
+    """A user's URL lists and intervention history"""
+
+    __slots__ = ('distraction_urls', 'productive_urls', 'intervention_history', 'performance_metrics')
+
+    def __init__(self):
+        self.distraction_urls = frozenset()
+        self.productive_urls = frozenset()
+        self.intervention_history = []
+        self.performance_metrics = {}
+
+
+# Rows of the Welford accumulators in BehaviorPatterns
+COUNT, MEAN, M2 = 0, 1, 2
+
+
+def _welford_add(cell: np.ndarray, value: float) -> None:
+    """Add one value to a (count, mean, M2) accumulator in place"""
+    count = cell[COUNT] + 1
+    delta = value - cell[MEAN]
+    mean = cell[MEAN] + delta / count
+    cell[COUNT] = count
+    cell[MEAN] = mean
+    cell[M2] += delta * (value - mean)
+
+
+def _welford_merge(stats: np.ndarray, cells: np.ndarray, values: np.ndarray) -> None:
+    """Add values[i] to accumulator column cells[i] of a (3, n) array, for a whole batch.
+
+    Per-cell count, mean and M2 of the batch are grouped with bincount and
+    merged into the running ones with Chan et al.'s pairwise update.
+    """
+    touched, inverse, count = np.unique(cells, return_inverse=True, return_counts=True)
+    mean = np.bincount(inverse, weights=values) / count
+    m2 = np.bincount(inverse, weights=(values - mean[inverse]) ** 2)
+
+    old_count, old_mean, old_m2 = stats[:, touched]
+    total = old_count + count
+    delta = mean - old_mean
+    stats[MEAN, touched] = old_mean + delta * count / total
+    stats[M2, touched] = old_m2 + m2 + delta * delta * old_count * count / total
+    stats[COUNT, touched] = total
+
+
+class BehaviorPatterns:
+    """A user's behavioural statistics in flat NumPy arrays.
+
+    Columns are the domains the user has visited; `columns` maps a DomainIndex
+    ID to its column. time_stats[:, hour, column] is a Welford (count, mean, M2)
+    accumulator of visit durations in that local hour and engagement[:, column]
+    one of engagement scores, so memory grows with the user's domains only.
+    Capacity doubles when full, so adding domains is amortised O(1).
+    """
+
+    __slots__ = ('columns', 'time_stats', 'engagement', 'productivity_scores')
+
+    def __init__(self):
+        self.columns: Dict[int, int] = {}
+        self.time_stats = np.zeros((3, 24, 0))
+        self.engagement = np.zeros((3, 0))
+        self.productivity_scores = RunningStats()
+
+    def column(self, domain_id: int) -> int:
+        """Column of a domain, adding one if the user has not visited it yet"""
+        column = self.columns.get(domain_id)
+        if column is None:
+            column = self.columns[domain_id] = len(self.columns)
+            capacity = self.time_stats.shape[2]
+            if column == capacity:
+                capacity = max(1, capacity * 2)
+                time_stats = np.zeros((3, 24, capacity))
+                time_stats[:, :, :column] = self.time_stats
+                engagement = np.zeros((3, capacity))
+                engagement[:, :column] = self.engagement
+                self.time_stats, self.engagement = time_stats, engagement
+        return column
+
+    def add(self, hour: int, domain_id: int, duration: float, engagement_score: float, score: float) -> None:
+        column = self.column(domain_id)
+        _welford_add(self.time_stats[:, hour, column], duration)
+        _welford_add(self.engagement[:, column], engagement_score)
+        self.productivity_scores.add(score)
+
+    def add_batch(self, hours: np.ndarray, domain_ids: np.ndarray, durations: np.ndarray,
+                  engagement_scores: np.ndarray, scores: np.ndarray) -> None:
+        """add() for many events at once (arrays in event order)"""
+        unique_ids, inverse = np.unique(domain_ids, return_inverse=True)
+        columns = np.array([self.column(int(domain_id)) for domain_id in unique_ids])[inverse]
+        # (3, 24, capacity) -> (3, 24 * capacity) view, so cell hour * capacity + column
+        _welford_merge(self.time_stats.reshape(3, -1), hours * self.time_stats.shape[2] + columns, durations)
+        _welford_merge(self.engagement, columns, engagement_scores)
+        self.productivity_scores.add_many(scores)
+
+    def time_pattern(self, hour: int, domain_id: int) -> Dict[str, float]:
+        """Count, mean and standard deviation of durations on a domain in one hour"""
+        column = self.columns.get(domain_id)
+        if column is None:
+            return {'count': 0, 'mean': 0.0, 'std': 0.0}
+        count, mean, m2 = self.time_stats[:, hour, column]
+        std = (m2 / (count - 1)) ** 0.5 if count > 1 else 0.0
+        return {'count': int(count), 'mean': float(mean), 'std': float(std)}
+
+
+@dataclass
+class UsageBatch:
+    """Columnar batch of usage events for ProductivityModel.process_usage_batch.
+
+    Every array has one entry per event. user_index points into users and
+    domain_id is an ID from the model's DomainIndex; build batches with
+    ProductivityModel.usage_batch.
+    """
+    users: List[str]
+    user_index: np.ndarray
+    hour: np.ndarray
+    domain_id: np.ndarray
+    duration: np.ndarray
+    clicks: np.ndarray
+    scrolls: np.ndarray
+    keystrokes: np.ndarray
+    is_distraction: np.ndarray
+    is_productive: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.user_index)
+
+
+def event_hour(timestamp) -> int:
+    """Server local hour of day of a usage event timestamp, else the current hour.
+
+    Same convention as local_hour_bucket in the database, so live events and
+    replayed history land in the same hour: 'Z'/offset timestamps are
+    converted to local time and naive ones are taken as local already.
+    """
+    if isinstance(timestamp, str) and ':' in timestamp:
+        # Fast path for ISO date-times, the common case on ingest
+        try:
+            dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+        except ValueError:
+            dt = None
+        if dt is not None:
+            return (dt.astimezone() if dt.tzinfo else dt).hour
+    ts_epoch_ms = to_epoch_ms(timestamp)
+    if ts_epoch_ms is None:
+        return datetime.now().hour
+    return local_hour_bucket(ts_epoch_ms) % 24
+
+
+def usage_batch_row(usage_entry: Dict) -> tuple:
+    """One usage entry as a ProductivityModel.usage_batch row"""
+    clicks, scrolls, keystrokes, _ = interaction_counts(usage_entry.get('interactions', {}))
+    return (usage_entry['user_id'], usage_entry['domain'], event_hour(usage_entry.get('timestamp')),
+            usage_entry['duration'], clicks, scrolls, keystrokes,
+            bool(usage_entry.get('is_distraction', False)), bool(usage_entry.get('is_productive', False)))
+
+
 class ProductivityModel:
-    """AI model for productivity management and interventions"""
+    """AI model for productivity management and interventions.
+
+    One instance is shared by every request thread. Updates to a user's
+    profile and patterns hold that user's lock stripe; readers see either
+    the old or the new URL set, since updates replace it.
+    """
     
     def __init__(self):
         self.intervention_templates = {
@@ -43,52 +303,43 @@ class ProductivityModel:
             ]
         }
         
-        self.user_profiles = {}
-        self.behavioral_patterns = {}
-        
-    def update_distraction_patterns(self, user_id: str, urls: List[Dict]) -> None:
-        """Update user's distraction patterns"""
-        if user_id not in self.user_profiles:
-            self.user_profiles[user_id] = {
-                'distraction_urls': [],
-                'productive_urls': [],
-                'intervention_history': [],
-                'performance_metrics': {}
-            }
+        self.user_profiles: Dict[str, UserProfile] = {}
+        self.behavioral_patterns: Dict[str, BehaviorPatterns] = {}
+        self.domains = DomainIndex()
+        # Per-user locks for profile / pattern updates
+        self.locks = StripedLock()
         
-        # Ensure urls is a list of dicts with url key
-        processed_urls = []
+    def _profile(self, user_id: str) -> UserProfile:
+        """Get or create a user's profile (caller holds the user's lock)"""
+        profile = self.user_profiles.get(user_id)
+        if profile is None:
+            profile = self.user_profiles[user_id] = UserProfile()
+        return profile
+
+    @staticmethod
+    def _url_set(urls: List) -> frozenset:
+        """URL strings from a list of strings or {'url': ...} dicts"""
+        processed_urls = set()
         for url in urls:
             if isinstance(url, str):
-                processed_urls.append({'url': url})
+                processed_urls.add(url)
             elif isinstance(url, dict) and 'url' in url:
-                processed_urls.append(url)
+                processed_urls.add(url['url'])
             else:
                 print(f"Warning: Invalid URL format: {url}")
+        return frozenset(processed_urls)
         
-        self.user_profiles[user_id]['distraction_urls'] = processed_urls
+    def update_distraction_patterns(self, user_id: str, urls: List[Dict]) -> None:
+        """Update user's distraction patterns"""
+        processed_urls = self._url_set(urls)
+        with self.locks.hold(user_id):
+            self._profile(user_id).distraction_urls = processed_urls
         
     def update_productive_patterns(self, user_id: str, urls: List[Dict]) -> None:
         """Update user's productive patterns"""
-        if user_id not in self.user_profiles:
-            self.user_profiles[user_id] = {
-                'distraction_urls': [],
-                'productive_urls': [],
-                'intervention_history': [],
-                'performance_metrics': {}
-            }
-        
-        # Ensure urls is a list of dicts with url key
-        processed_urls = []
-        for url in urls:
-            if isinstance(url, str):
-                processed_urls.append({'url': url})
-            elif isinstance(url, dict) and 'url' in url:
-                processed_urls.append(url)
-            else:
-                print(f"Warning: Invalid URL format: {url}")
-        
-        self.user_profiles[user_id]['productive_urls'] = processed_urls
+        processed_urls = self._url_set(urls)
+        with self.locks.hold(user_id):
+            self._profile(user_id).productive_urls = processed_urls
         
     def process_usage_data(self, usage_data: Dict) -> None:
         """Process usage data to identify patterns"""
@@ -97,59 +348,84 @@ class ProductivityModel:
             domain = usage_data['domain']
             duration = usage_data['duration']
             interactions = usage_data.get('interactions', {})
-            
-            # Initialize behavioral patterns if not exists
-            if user_id not in self.behavioral_patterns:
-                self.behavioral_patterns[user_id] = {
-                    'time_patterns': {},
-                    'engagement_patterns': {},
-                    'productivity_scores': []
-                }
-            
-            # Handle timestamp properly
-            timestamp = usage_data.get('timestamp')
-            if isinstance(timestamp, str):
-                try:
-                    # Try parsing ISO format
-                    dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                    hour = dt.hour
-                except:
-                    # Fallback to current hour
-                    hour = datetime.now().hour
-            elif isinstance(timestamp, (int, float)):
-                # Assume it's a Unix timestamp in milliseconds
-                hour = datetime.fromtimestamp(timestamp / 1000).hour
-            else:
-                hour = datetime.now().hour
-            
-            # Update time patterns
-            if hour not in self.behavioral_patterns[user_id]['time_patterns']:
-                self.behavioral_patterns[user_id]['time_patterns'][hour] = {}
-            
-            if domain not in self.behavioral_patterns[user_id]['time_patterns'][hour]:
-                self.behavioral_patterns[user_id]['time_patterns'][hour][domain] = []
-            
-            self.behavioral_patterns[user_id]['time_patterns'][hour][domain].append(duration)
+            hour = event_hour(usage_data.get('timestamp'))
             
             # Calculate engagement score based on interactions
             engagement_score = self._calculate_engagement_score(interactions, duration)
             
-            if domain not in self.behavioral_patterns[user_id]['engagement_patterns']:
-                self.behavioral_patterns[user_id]['engagement_patterns'][domain] = []
-            
-            self.behavioral_patterns[user_id]['engagement_patterns'][domain].append(engagement_score)
-            
             # Update productivity score (simple average for now)
             is_productive = usage_data.get('is_productive', False)
             is_distraction = usage_data.get('is_distraction', False)
             score = duration if is_productive else -duration if is_distraction else 0
-            self.behavioral_patterns[user_id]['productivity_scores'].append(score)
+            domain_id = self.domains.id(domain)
+            
+            with self.locks.hold(user_id):
+                # Initialize behavioral patterns if not exists; every stream is a
+                # fixed-size accumulator, so memory does not grow with the number of events
+                patterns = self.behavioral_patterns.get(user_id)
+                if patterns is None:
+                    patterns = self.behavioral_patterns[user_id] = BehaviorPatterns()
+                patterns.add(hour, domain_id, duration, engagement_score, score)
             
         except Exception as e:
             print(f"Error processing usage data: {e}")
         
+    def usage_batch(self, rows: List[tuple]) -> UsageBatch:
+        """Build a UsageBatch from (user_id, domain, hour, duration, clicks, scrolls,
+        keystrokes, is_distraction, is_productive) rows"""
+        users = {}
+        user_index = [users.setdefault(row[0], len(users)) for row in rows]
+        columns = list(zip(*rows)) or [()] * 9
+        domain_ids = {domain: self.domains.id(domain or '') for domain in set(columns[1])}
+        return UsageBatch(
+            users=list(users),
+            user_index=np.array(user_index, dtype=np.int64),
+            hour=np.array(columns[2], dtype=np.int64),
+            domain_id=np.array([domain_ids[domain] for domain in columns[1]], dtype=np.int64),
+            duration=np.array(columns[3], dtype=np.float64),
+            clicks=np.array(columns[4], dtype=np.float64),
+            scrolls=np.array(columns[5], dtype=np.float64),
+            keystrokes=np.array(columns[6], dtype=np.float64),
+            is_distraction=np.array(columns[7], dtype=bool),
+            is_productive=np.array(columns[8], dtype=bool),
+        )
+
+    def process_usage_batch(self, batch: UsageBatch) -> None:
+        """process_usage_data for a whole batch of events.
+
+        Engagement and productivity scores are computed for every event at
+        once; events are then grouped by user and each user's accumulators
+        are updated with one bincount per statistic, holding the user's lock.
+        """
+        if not len(batch):
+            return
+        duration = batch.duration
+        interactions = batch.clicks + batch.scrolls + batch.keystrokes
+        # Same as _calculate_engagement_score, vectorized
+        engagement = np.where(duration > 0, np.minimum(1.0, interactions / np.maximum(1, duration)), 0.0)
+        score = np.where(batch.is_productive, duration, np.where(batch.is_distraction, -duration, 0.0))
+
+        # Stable sort keeps each user's events in order for the EWMA and reservoir
+        order = np.argsort(batch.user_index, kind='stable')
+        user_index = batch.user_index[order]
+        starts = np.flatnonzero(np.r_[True, user_index[1:] != user_index[:-1]])
+        for start, end in zip(starts, np.r_[starts[1:], len(order)]):
+            events = order[start:end]
+            user_id = batch.users[user_index[start]]
+            with self.locks.hold(user_id):
+                patterns = self.behavioral_patterns.get(user_id)
+                if patterns is None:
+                    patterns = self.behavioral_patterns[user_id] = BehaviorPatterns()
+                patterns.add_batch(batch.hour[events], batch.domain_id[events], duration[events],
+                                   engagement[events], score[events])
+
     def _calculate_engagement_score(self, interactions: Dict, duration: int) -> float:
-        """Calculate engagement score based on interactions and duration"""
+        """Calculate engagement score based on interactions and duration.
+
+        Kept in step with ENGAGEMENT_SCORE_SQL in db.py, which computes the same
+        score over stored history (DatabaseManager.get_engagement_patterns, served
+        by /api/engagement-patterns).
+        """
         try:
             # Simple formula: (clicks + scrolls + keystrokes) / duration, normalized
             if not isinstance(interactions, dict):
@@ -171,9 +447,9 @@ class ProductivityModel:
             time_of_day = tab_data.get('time_of_day', datetime.now().hour)
             
             # Simple logic: Check if this is a distraction during non-productive hours
-            if user_id in self.user_profiles:
-                distractions = self.user_profiles[user_id].get('distraction_urls', [])
-                if any(d.get('url', '') == url for d in distractions):
+            profile = self.user_profiles.get(user_id)
+            if profile is not None:
+                if url in profile.distraction_urls:
                     # Assume productive hours are 9-17 for demo
                     if not (9 <= time_of_day <= 17):
                         return {'type': 'distraction_alert', 'message': 'This might be a distraction outside productive hours!'}
@@ -223,8 +499,9 @@ class ProductivityModel:
                 updated_limits = {'reduced_time': 10}
             
             # Store in history
-            if user_id in self.user_profiles:
-                self.user_profiles[user_id]['intervention_history'].append(interaction)
+            with self.locks.hold(user_id):
+                if user_id in self.user_profiles:
+                    self.user_profiles[user_id].intervention_history.append(interaction)
             
             result = {}
             if reward_points > 0:
@@ -237,8 +514,8 @@ class ProductivityModel:
             print(f"Error processing intervention response: {e}")
             return {}
     
-    def generate_productivity_insights(self, user_data: Dict) -> List[str]:
-        """Generate insights from user analytics data"""
+    def generate_productivity_insights(self, user_id: str, user_data: Dict) -> List[str]:
+        """Generate insights from a user's analytics data and behavioural patterns"""
         try:
             insights = []
             
@@ -254,16 +531,14 @@ class ProductivityModel:
                 top = top_distractions[0]
                 insights.append(f"Your top distraction is {top}. Try blocking it during work hours.")
             
-            # Use behavioral patterns if available
-            for user_id in self.behavioral_patterns:
-                scores = self.behavioral_patterns[user_id]['productivity_scores']
-                if scores:
-                    avg_score = np.mean(scores)
-                    if avg_score > 0:
-                        insights.append(f"Overall productivity is positive with average score {avg_score:.2f}.")
-                    else:
-                        insights.append(f"Productivity needs improvement; current average score is {avg_score:.2f}.")
-                break  # Only use first user's data for now
+            # Use this user's behavioral patterns if available
+            patterns = self.behavioral_patterns.get(user_id)
+            if patterns is not None and patterns.productivity_scores.count:
+                avg_score = patterns.productivity_scores.mean
+                if avg_score > 0:
+                    insights.append(f"Overall productivity is positive with average score {avg_score:.2f}.")
+                else:
+                    insights.append(f"Productivity needs improvement; current average score is {avg_score:.2f}.")
             
             if not insights:
                 insights.append("Keep tracking your usage to get personalized insights!")
@@ -297,23 +572,20 @@ class ProductivityModel:
             print(f"Error recommending limit adjustments: {e}")
             return {'distraction_adjustments': {}, 'productive_adjustments': {}}
     
-    def generate_daily_summary(self, daily_data: Dict) -> Dict:
-        """Generate daily productivity summary"""
+    def generate_daily_summary(self, daily_report: Dict) -> Dict:
+        """Generate daily productivity summary from pre-aggregated totals (DatabaseManager.get_daily_report)"""
         try:
+            by_domain = daily_report.get('by_domain', {})
             summary = {
-                'total_productive_time': 0,
-                'total_distraction_time': 0,
+                'total_productive_time': daily_report.get('productive_secs', 0),
+                'total_distraction_time': daily_report.get('distraction_secs', 0),
+                'sessions': daily_report.get('sessions', 0),
+                'top_domains': sorted(by_domain, key=lambda domain: by_domain[domain]['total_secs'],
+                                      reverse=True)[:5],
+                'by_hour': daily_report.get('by_hour', {}),
                 'key_insights': []
             }
             
-            usage_entries = daily_data.get('usage_entries', [])
-            for entry in usage_entries:
-                duration = entry.get('duration', 0)
-                if entry.get('is_productive'):
-                    summary['total_productive_time'] += duration
-                if entry.get('is_distraction'):
-                    summary['total_distraction_time'] += duration
-            
             productive_hours = summary['total_productive_time'] / 60
             distraction_hours = summary['total_distraction_time'] / 60
             
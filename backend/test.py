@@ -5,6 +5,12 @@ Simple test script to verify the productivity API is working
 
 import requests
 import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+
+from db import DatabaseManager, USAGE_HISTORY_PAGE_SQL, _backfill_numeric_epoch_ms
 
 BASE_URL = "http://localhost:5000/api"
 
@@ -89,6 +95,51 @@ def test_usage_data():
         print(f"Error: {e}")
         return False
 
+def test_usage_batch():
+    """Test batch usage data endpoint"""
+    print("\n=== Testing Usage Batch ===")
+    test_data = {
+        "user_id": "test_user",
+        "events": [
+            {
+                "url": "https://github.com/user/repo",
+                "domain": "github.com",
+                "duration": 120,
+                "interactions": {"clicks": 4, "scrolls": 2, "keystrokes": 60},
+                "timestamp": "2024-01-01T11:00:00",
+                "isProductive": True
+            },
+            {
+                "url": "https://youtube.com/watch",
+                "domain": "youtube.com",
+                "duration": 600,
+                "timestamp": "2024-01-01T11:05:00",
+                "isDistraction": True
+            }
+        ]
+    }
+    
+    try:
+        response = requests.post(
+            f"{BASE_URL}/usage-data/batch",
+            json=test_data,
+            headers={"Content-Type": "application/json"}
+        )
+        print(f"Status: {response.status_code}")
+        print(f"Response: {response.json()}")
+        invalid = requests.post(f"{BASE_URL}/usage-data/batch",
+                                json={"user_id": "test_user", "events": [{"url": "https://github.com"}]})
+        print(f"Invalid batch status: {invalid.status_code}")
+        bad_duration = requests.post(f"{BASE_URL}/usage-data/batch",
+                                     json={"user_id": "test_user", "events": [
+                                         {"url": "https://github.com", "domain": "github.com", "duration": None}]})
+        print(f"Bad duration status: {bad_duration.status_code}")
+        return (response.status_code == 200 and invalid.status_code == 400
+                and bad_duration.status_code == 400)
+    except Exception as e:
+        print(f"Error: {e}")
+        return False
+
 def test_get_question():
     """Test get question endpoint"""
     print("\n=== Testing Get Question ===")
@@ -146,6 +197,18 @@ def test_get_insights():
         print(f"Error: {e}")
         return False
 
+def test_engagement_patterns():
+    """Test engagement patterns endpoint"""
+    print("\n=== Testing Engagement Patterns ===")
+    try:
+        response = requests.get(f"{BASE_URL}/engagement-patterns?user_id=test_user")
+        print(f"Status: {response.status_code}")
+        print(f"Response: {response.json()}")
+        return response.status_code == 200 and 'engagement_patterns' in response.json()
+    except Exception as e:
+        print(f"Error: {e}")
+        return False
+
 def test_daily_summary():
     """Test daily summary endpoint"""
     print("\n=== Testing Daily Summary ===")
@@ -158,6 +221,175 @@ def test_daily_summary():
         print(f"Error: {e}")
         return False
 
+def test_export_usage():
+    """Test streaming usage export endpoint"""
+    print("\n=== Testing Usage Export ===")
+    try:
+        response = requests.get(f"{BASE_URL}/export/usage?user_id=test_user&format=ndjson", stream=True)
+        print(f"Status: {response.status_code}")
+        records = [json.loads(line) for line in response.iter_lines() if line]
+        print(f"Records: {len(records)}")
+        keys = [(r['ts_epoch_ms'], r['id']) for r in records]
+        if keys != sorted(keys):
+            print("Records are not in (ts_epoch_ms, id) order")
+            return False
+        if records:
+            # Resuming after the first record must return the rest
+            ts, row_id = keys[0]
+            response = requests.get(f"{BASE_URL}/export/usage?user_id=test_user&after={ts}:{row_id}")
+            rest = [json.loads(line) for line in response.text.splitlines() if line]
+            print(f"Resumed records: {len(rest)}")
+            return response.status_code == 200 and len(rest) == len(records) - 1
+        return response.status_code == 200
+    except Exception as e:
+        print(f"Error: {e}")
+        return False
+
+def test_search_history():
+    """Test full-text history search endpoint"""
+    print("\n=== Testing History Search ===")
+    try:
+        requests.post(
+            f"{BASE_URL}/tab-activity",
+            json={"user_id": "test_user", "url": "https://docs.python.org/3/library/sqlite3.html",
+                  "title": "sqlite3 - DB-API 2.0 interface for SQLite databases", "timestamp": "2024-01-01T11:00:00"},
+            headers={"Content-Type": "application/json"}
+        )
+        response = requests.get(f"{BASE_URL}/search-history?user_id=test_user&q=sqlite*&start=2024-01-01")
+        print(f"Status: {response.status_code}")
+        results = response.json().get('results', [])
+        print(f"Results: {len(results)}")
+        if not any('sqlite3' in result['url'] for result in results):
+            return False
+        # Another user's history must not match
+        response = requests.get(f"{BASE_URL}/search-history?user_id=other_user&q=sqlite*")
+        return response.status_code == 200 and not response.json()['results']
+    except Exception as e:
+        print(f"Error: {e}")
+        return False
+
+class TracingDatabaseManager(DatabaseManager):
+    """DatabaseManager that records every SQL statement it runs"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statements = []
+
+    def _get_connection(self):
+        conn = super()._get_connection()
+        conn.set_trace_callback(self.statements.append)
+        return conn
+
+    def _release_connection(self, conn):
+        conn.set_trace_callback(None)
+        super()._release_connection(conn)
+
+
+def test_query_plans():
+    """Test that the per-user analytics queries search an index instead of scanning"""
+    print("\n=== Testing Query Plans ===")
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        db = TracingDatabaseManager(os.path.join(tmp_dir, 'plans.db'))
+        db.initialize_database()
+        db.store_usage_data({
+            'user_id': 'test_user', 'url': 'https://github.com', 'domain': 'github.com',
+            'duration': 300, 'timestamp': '2024-01-01T10:00:00', 'is_productive': True
+        })
+        db.statements.clear()
+
+        db.get_user_context('test_user')
+        db.get_user_performance('test_user')
+        db.get_user_analytics_data('test_user')
+        db.get_daily_data('test_user', '2024-01-01')
+        db.get_daily_report('test_user', '2024-01-01')
+        list(db.iter_usage_export('test_user'))
+        list(db.iter_usage_history(0))
+
+        conn = db._get_connection()
+        try:
+            ok = True
+            for sql in db.statements:
+                if not sql.lstrip().upper().startswith('SELECT') or 'FROM' not in sql.upper():
+                    continue
+                plan = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}')]
+                uses_index = any(step.startswith('SEARCH') and 'INDEX' in step for step in plan)
+                print(f"{'ok ' if uses_index else 'BAD'} {' '.join(sql.split())[:70]}")
+                for step in plan:
+                    print(f"      {step}")
+                ok = ok and uses_index
+
+            # Startup replay must seek each user to start_ms, not walk their whole history
+            plan = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {USAGE_HISTORY_PAGE_SQL}',
+                                                   ('test_user', 0, -1, 1000))]
+            seeks_start = any('user_id=? AND ts_epoch_ms>?' in step for step in plan)
+            print(f"{'ok ' if seeks_start else 'BAD'} usage history page seeks to start_ms")
+            return ok and seeks_start
+        finally:
+            db._release_connection(conn)
+    except Exception as e:
+        print(f"Error: {e}")
+        return False
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def test_epoch_backfill():
+    """Test that epoch-ms digit string timestamps are backfilled into ts_epoch_ms and the rollups"""
+    print("\n=== Testing Epoch Backfill ===")
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        db = DatabaseManager(os.path.join(tmp_dir, 'backfill.db'))
+        db.initialize_database()
+        conn = db._get_connection()
+        try:
+            # A row stored before ts_epoch_ms existed, with the extension's Date.now() value
+            conn.execute("INSERT INTO usage_data (user_id, timestamp, domain_id, duration) "
+                         "VALUES ('test_user', '1753432742227', ?, 300)", (db.domains.id('github.com'),))
+            _backfill_numeric_epoch_ms(conn.cursor())
+            conn.commit()
+            ts_epoch_ms = conn.execute('SELECT ts_epoch_ms FROM usage_data').fetchone()[0]
+            rolled_up = conn.execute('SELECT SUM(total_secs) FROM usage_rollup_hourly').fetchone()[0]
+        finally:
+            db._release_connection(conn)
+        found = db.get_usage_range('test_user', 1753432742227, 1753432742228)
+        print(f"ts_epoch_ms: {ts_epoch_ms}, rolled up: {rolled_up}, in range: {len(found)}")
+        return ts_epoch_ms == 1753432742227 and rolled_up == 300 and len(found) == 1
+    except Exception as e:
+        print(f"Error: {e}")
+        return False
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def test_hot_tier_readers():
+    """Test that reports, exports and history search see rows still in the hot tier"""
+    print("\n=== Testing Hot Tier Readers ===")
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        db = DatabaseManager(os.path.join(tmp_dir, 'hot.db'), hot_tier=True)
+        db.initialize_database()
+        now = datetime.now()
+        db.store_usage_data({
+            'user_id': 'test_user', 'url': 'https://github.com', 'domain': 'github.com',
+            'duration': 300, 'timestamp': now.isoformat(), 'is_productive': True
+        })
+        db.store_tab_activity({
+            'user_id': 'test_user', 'url': 'https://github.com', 'title': 'Hot tier notes',
+            'timestamp': now.isoformat()
+        })
+        start_ms = int((now - timedelta(hours=1)).timestamp() * 1000)
+        end_ms = int((now + timedelta(hours=1)).timestamp() * 1000)
+        report = db.get_usage_report('test_user', start_ms, end_ms)
+        exported = list(db.iter_usage_export('test_user'))
+        found = db.search_history('test_user', 'notes')['results']
+        db.hot.shutdown()
+        print(f"report: {report['total_secs']} secs, export: {len(exported)} rows, search: {len(found)} results")
+        return report['total_secs'] == 300 and len(exported) == 1 and len(found) == 1
+    except Exception as e:
+        print(f"Error: {e}")
+        return False
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
 def main():
     """Run all tests"""
     print("Starting API Tests...")
@@ -168,10 +400,17 @@ def main():
         ("Distraction URLs", test_distraction_urls),
         ("Productive URLs", test_productive_urls),
         ("Usage Data", test_usage_data),
+        ("Usage Batch", test_usage_batch),
         ("Get Question", test_get_question),
         ("Question Answer", test_question_answer),
         ("Get Insights", test_get_insights),
+        ("Engagement Patterns", test_engagement_patterns),
         ("Daily Summary", test_daily_summary),
+        ("Usage Export", test_export_usage),
+        ("History Search", test_search_history),
+        ("Query Plans", test_query_plans),
+        ("Epoch Backfill", test_epoch_backfill),
+        ("Hot Tier Readers", test_hot_tier_readers),
     ]
     
     passed = 0